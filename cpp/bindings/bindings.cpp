@@ -57,10 +57,24 @@ void register_rng(py::module_ &m) {
       py::arg("sigma"), py::arg("separation"));
 }
 
-// TODO integrate this class more tightly with PerBitRes
+void register_threads(py::module_ &m) {
+  m.def("set_num_threads", &parallel::setNumThreads, py::arg("n"));
+  m.def("get_num_threads", &parallel::getNumThreads);
+}
+
 void register_results_class(py::module_ &m) {
   auto cls = py::class_<Results>(m, "Results");
 
+  cls.def_property_readonly("bw", &Results::getBw);
+  cls.def_property_readonly("num_cases", &Results::getCases);
+  cls.def_property_readonly("num_unsolved", &Results::getUnsolvedCases);
+  cls.def_property_readonly("base_distance", &Results::getBaseDistance);
+  cls.def_property_readonly("sound", &Results::getSound);
+  cls.def_property_readonly("distance", &Results::getDistance);
+  cls.def_property_readonly("exact", &Results::getExact);
+  cls.def_property_readonly("unsolved_exact", &Results::getUnsolvedExact);
+  cls.def_property_readonly("sound_distance", &Results::getSoundDistance);
+
   cls.def("__str__", [](const Results &self) {
     std::ostringstream oss;
     oss << self;
@@ -82,6 +96,7 @@ PYBIND11_MODULE(_eval_engine, m) {
   m.doc() = "Evaluation engine for synth_xfer";
 
   register_rng(m);
+  register_threads(m);
   register_results_class(m);
 
   register_knownbits_bindings(m);
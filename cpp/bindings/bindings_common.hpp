@@ -14,7 +14,9 @@
 
 #include "domain.hpp"
 #include "enum.hpp"
+#include "enum_writer.hpp"
 #include "eval.hpp"
+#include "parallel.hpp"
 #include "rand.hpp"
 #include "results.hpp"
 
@@ -36,6 +38,7 @@ template <>
 struct supports_llvm_pattern_domain<SConstRange> : std::true_type {};
 
 void register_rng(py::module_ &m);
+void register_threads(py::module_ &m);
 void register_results_class(py::module_ &m);
 
 void register_knownbits_bindings(py::module_ &m);
@@ -68,6 +71,23 @@ using EnumHighThunk = py::object (*)(std::uintptr_t,
                                      std::optional<std::uintptr_t>,
                                      unsigned int, unsigned int, unsigned int,
                                      std::shared_ptr<rngdist::Sampler>);
+using EnumWriteLowThunk = std::size_t (*)(std::uintptr_t,
+                                          std::optional<std::uintptr_t>,
+                                          std::size_t, const std::string &,
+                                          bool);
+using EnumWriteMidThunk = std::size_t (*)(std::uintptr_t,
+                                          std::optional<std::uintptr_t>,
+                                          unsigned int, unsigned int,
+                                          std::shared_ptr<rngdist::Sampler>,
+                                          std::size_t, const std::string &,
+                                          bool);
+using EnumWriteHighThunk = std::size_t (*)(std::uintptr_t,
+                                           std::optional<std::uintptr_t>,
+                                           unsigned int, unsigned int,
+                                           unsigned int,
+                                           std::shared_ptr<rngdist::Sampler>,
+                                           std::size_t, const std::string &,
+                                           bool);
 using EvalThunk = Results (*)(py::handle, const std::vector<std::uintptr_t> &,
                               const std::vector<std::uintptr_t> &, unsigned int,
                               unsigned int);
@@ -78,6 +98,9 @@ using IterThunk = py::object (*)(py::handle);
 
 void bind_enum_funcs(py::module_ &m, const std::string &fn_name,
                      EnumLowThunk low, EnumMidThunk mid, EnumHighThunk high);
+void bind_enum_write_funcs(py::module_ &m, const std::string &fn_name,
+                           EnumWriteLowThunk low, EnumWriteMidThunk mid,
+                           EnumWriteHighThunk high);
 void bind_eval_func(py::module_ &m, const std::string &fn_name, EvalThunk eval);
 // Templated on the thunk so exact (4-tuple) and norm (pair) returns can share
 // one binder; pybind11 deduces the Python return type from the callable.
@@ -162,6 +185,12 @@ void register_enum_domain(py::module_ &m) {
 
     return v;
   }));
+  cls.def(
+      "extend",
+      [](EvalVec &self, const EvalVec &rows) {
+        self.insert(self.end(), rows.begin(), rows.end());
+      },
+      py::arg("rows"));
 
   bind_sequence_protocol(
       cls,
@@ -205,9 +234,8 @@ void register_enum_domain(py::module_ &m) {
         auto out = std::make_unique<EvalVec>();
         {
           py::gil_scoped_release release;
-          std::mt19937 rng(seed);
           EnumT ed{crtOpAddr, opConFnAddr};
-          *out = ed.genMids(num_lat_samples, rng, *sampler);
+          *out = ed.genMids(num_lat_samples, seed, *sampler);
         }
         return py::cast(std::move(out),
                         py::return_value_policy::take_ownership);
@@ -219,13 +247,90 @@ void register_enum_domain(py::module_ &m) {
         auto out = std::make_unique<EvalVec>();
         {
           py::gil_scoped_release release;
-          std::mt19937 rng(seed);
           EnumT ed{crtOpAddr, opConFnAddr};
-          *out = ed.genHighs(num_lat_samples, num_conc_samples, rng, *sampler);
+          *out = ed.genHighs(num_lat_samples, num_conc_samples, seed, *sampler);
         }
         return py::cast(std::move(out),
                         py::return_value_policy::take_ownership);
       });
+
+  using ColumnsT = DomainHelpers::Columns<Dom, ResBw, BWs...>;
+  m.def(
+      ("enum_low_shared_" + fn_name).c_str(),
+      [](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+         py::buffer args) {
+        // holding the buffer request keeps the exporter from freeing it
+        auto info = std::shared_ptr<py::buffer_info>(
+            new py::buffer_info(args.request()), [](py::buffer_info *p) {
+              py::gil_scoped_acquire gil;
+              delete p;
+            });
+        std::vector<Dom<ResBw>> bests;
+        {
+          py::gil_scoped_release release;
+          bests = EnumT{crtOpAddr, opConFnAddr}.genLowBests();
+        }
+        const std::size_t argsBytes =
+            Arity * Dom<ResBw>::arity * bests.size() * sizeof(std::uint64_t);
+        if (static_cast<std::size_t>(info->size * info->itemsize) <
+                argsBytes ||
+            reinterpret_cast<std::uintptr_t>(info->ptr) %
+                    alignof(std::uint64_t) !=
+                0)
+          throw py::value_error("buffer does not fit the lattice arguments");
+
+        const auto *src = static_cast<const std::uint64_t *>(info->ptr);
+        return ColumnsT::fromSharedArgs(src, std::move(info), bests);
+      },
+      py::arg("crtOpAddr"), py::arg("opConFnAddr"), py::arg("args"));
+
+  m.def(
+      ("enum_edge_" + fn_name).c_str(),
+      [](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+         unsigned int num_conc_samples, unsigned int seed) -> py::object {
+        auto out = std::make_unique<EvalVec>();
+        {
+          py::gil_scoped_release release;
+          *out = EnumT{crtOpAddr, opConFnAddr}.genEdges(num_conc_samples,
+                                                         seed);
+        }
+        return py::cast(std::move(out),
+                        py::return_value_policy::take_ownership);
+      },
+      py::arg("crtOpAddr"), py::arg("opConFnAddr"),
+      py::arg("num_conc_samples"), py::arg("seed"));
+
+  using WriterT = EnumWriter<Dom, ResBw, BWs...>;
+  static constexpr auto format = [](bool binary) {
+    return binary ? EnumFormat::Bin : EnumFormat::Tsv;
+  };
+  bind_enum_write_funcs(
+      m, fn_name,
+      +[](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+          std::size_t bw, const std::string &path,
+          bool binary) -> std::size_t {
+        py::gil_scoped_release release;
+        return WriterT{path, bw, format(binary)}.writeLows(
+            EnumT{crtOpAddr, opConFnAddr});
+      },
+      +[](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+          unsigned int num_lat_samples, unsigned int seed,
+          std::shared_ptr<rngdist::Sampler> sampler, std::size_t bw,
+          const std::string &path, bool binary) -> std::size_t {
+        py::gil_scoped_release release;
+        return WriterT{path, bw, format(binary)}.writeMids(
+            EnumT{crtOpAddr, opConFnAddr}, num_lat_samples, seed, *sampler);
+      },
+      +[](std::uintptr_t crtOpAddr, std::optional<std::uintptr_t> opConFnAddr,
+          unsigned int num_lat_samples, unsigned int num_conc_samples,
+          unsigned int seed, std::shared_ptr<rngdist::Sampler> sampler,
+          std::size_t bw, const std::string &path,
+          bool binary) -> std::size_t {
+        py::gil_scoped_release release;
+        return WriterT{path, bw, format(binary)}.writeHighs(
+            EnumT{crtOpAddr, opConFnAddr}, num_lat_samples, num_conc_samples,
+            seed, *sampler);
+      });
 }
 
 template <template <std::size_t> class Dom, std::size_t ResBw,
@@ -252,6 +357,147 @@ void register_eval_domain(py::module_ &m) {
       });
 }
 
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+void register_columns_domain(py::module_ &m) {
+  using EvalVec = ToEval<Dom, ResBw, BWs...>;
+  using RunVec = ArgsVec<Dom, BWs...>;
+  using ColumnsT = DomainHelpers::Columns<Dom, ResBw, BWs...>;
+  using EvalT = EvalBatched<Dom, ResBw, BWs...>;
+  using EvalFusedT = EvalFused<Dom, ResBw, BWs...>;
+
+  std::string dname = std::string(Dom<ResBw>::name);
+  std::string suffix = "_" + std::to_string(ResBw);
+  ((suffix += "_" + std::to_string(BWs)), ...);
+
+  auto cls = py::class_<ColumnsT>(m, ("Columns" + dname + suffix).c_str());
+  cls.def(py::init([](const EvalVec &v) {
+            py::gil_scoped_release release;
+            return std::make_unique<ColumnsT>(v);
+          }),
+          py::arg("rows"));
+  cls.def(py::init([](const RunVec &v) {
+            py::gil_scoped_release release;
+            return std::make_unique<ColumnsT>(v);
+          }),
+          py::arg("rows"));
+  cls.def("__len__", [](const ColumnsT &self) { return self.size(); });
+  cls.def("every", &ColumnsT::every, py::arg("step"));
+  cls.def_property_readonly("args_nbytes", &ColumnsT::argsBytes);
+  cls.def(
+      "write_args",
+      [](const ColumnsT &self, py::buffer buf) {
+        py::buffer_info info = buf.request(true);
+        if (static_cast<std::size_t>(info.size * info.itemsize) <
+            self.argsBytes())
+          throw py::value_error("buffer is too small for the arguments");
+        self.writeArgs(static_cast<std::uint64_t *>(info.ptr));
+      },
+      py::arg("buf"));
+  cls.def_property_readonly("nbytes", &ColumnsT::bytes);
+  cls.def(
+      "write",
+      [](const ColumnsT &self, py::buffer buf) {
+        py::buffer_info info = buf.request(true);
+        if (static_cast<std::size_t>(info.size * info.itemsize) < self.bytes())
+          throw py::value_error("buffer is too small for the columns");
+        self.write(static_cast<std::uint64_t *>(info.ptr));
+      },
+      py::arg("buf"));
+  cls.def_static(
+      "from_buffer",
+      [](py::buffer buf, std::size_t num_rows) {
+        // holding the buffer request keeps the exporter from freeing it
+        auto info = std::shared_ptr<py::buffer_info>(
+            new py::buffer_info(buf.request()), [](py::buffer_info *p) {
+              py::gil_scoped_acquire gil;
+              delete p;
+            });
+        const std::size_t numWords =
+            (ColumnsT::N + 1) * ColumnsT::arity * num_rows;
+        if (static_cast<std::size_t>(info->size * info->itemsize) <
+                numWords * sizeof(std::uint64_t) ||
+            reinterpret_cast<std::uintptr_t>(info->ptr) %
+                    alignof(std::uint64_t) !=
+                0)
+          throw py::value_error("buffer does not fit the columns");
+
+        const auto *src = static_cast<const std::uint64_t *>(info->ptr);
+        return ColumnsT::fromShared(src, num_rows, std::move(info));
+      },
+      py::arg("buf"), py::arg("num_rows"));
+  cls.def("to_eval", [](const ColumnsT &self) {
+    if (!self.hasBest())
+      throw py::value_error("columns were not built from a ToEval");
+
+    auto out = std::make_unique<EvalVec>();
+    out->reserve(self.size());
+    for (std::size_t row = 0; row < self.size(); ++row)
+      out->emplace_back(self.getArgs(row), self.getBest(row));
+
+    return out;
+  });
+  cls.def(
+      "share_args",
+      [](const ColumnsT &self, py::buffer buf) {
+        // holding the buffer request keeps the exporter from freeing it
+        auto info = std::shared_ptr<py::buffer_info>(
+            new py::buffer_info(buf.request()), [](py::buffer_info *p) {
+              py::gil_scoped_acquire gil;
+              delete p;
+            });
+        if (static_cast<std::size_t>(info->size * info->itemsize) <
+                self.argsBytes() ||
+            reinterpret_cast<std::uintptr_t>(info->ptr) %
+                    alignof(std::uint64_t) !=
+                0)
+          throw py::value_error("buffer does not fit the arguments");
+
+        const auto *src = static_cast<const std::uint64_t *>(info->ptr);
+        return self.shareArgs(src, std::move(info));
+      },
+      py::arg("buf"));
+
+  std::string dname_lower = to_lower_ascii(std::move(dname));
+
+  bind_eval_func(
+      m, "eval_batched_" + dname_lower + suffix,
+      +[](py::handle to_eval, const std::vector<std::uintptr_t> &xfers,
+          const std::vector<std::uintptr_t> &bases, unsigned int unsound_ex,
+          unsigned int imprecise_ex) -> Results {
+        const ColumnsT &v = py::cast<const ColumnsT &>(to_eval);
+        if (!v.hasBest())
+          throw py::value_error("columns were not built from a ToEval");
+        py::gil_scoped_release release;
+        return EvalT{xfers, bases, unsound_ex, imprecise_ex}.eval(v);
+      });
+
+  m.def(
+      ("eval_fused_" + dname_lower + suffix).c_str(),
+      [](const ColumnsT &v, std::uintptr_t fused, unsigned int num_xfers,
+         unsigned int unsound_ex, unsigned int imprecise_ex) -> Results {
+        if (!v.hasBest())
+          throw py::value_error("columns were not built from a ToEval");
+        py::gil_scoped_release release;
+        return EvalFusedT{fused, num_xfers, unsound_ex, imprecise_ex}.eval(v);
+      },
+      py::arg("to_eval"), py::arg("fused"), py::arg("num_xfers"),
+      py::arg("unsound_ex") = 0, py::arg("imprecise_ex") = 0);
+
+  bind_run_func(
+      m, "run_transformer_batched_" + dname_lower + suffix,
+      +[](py::handle to_run, std::uintptr_t xfer_addr) -> py::object {
+        const ColumnsT &v = py::cast<const ColumnsT &>(to_run);
+        decltype(run_transformer_batched<Dom, ResBw, BWs...>(xfer_addr, v)) out;
+        {
+          py::gil_scoped_release release;
+          out = run_transformer_batched<Dom, ResBw, BWs...>(xfer_addr, v);
+        }
+        return py::cast(std::move(out));
+      });
+}
+
 template <typename EvalPatternT, typename EvalVec>
 std::vector<typename EvalPatternT::ExactRow>
 make_exact_pattern_rows(const EvalVec &to_eval,
@@ -417,6 +663,7 @@ void register_uniform_arity(py::module_ &m) {
       register_eval_pattern_domain<Dom, BW, (static_cast<void>(Is), BW)...>(m);
     }
     register_run_domain<Dom, BW, (static_cast<void>(Is), BW)...>(m);
+    register_columns_domain<Dom, BW, (static_cast<void>(Is), BW)...>(m);
   }(std::make_index_sequence<N>{});
 }
 
@@ -89,6 +89,22 @@ void bind_enum_funcs(py::module_ &m, const std::string &fn_name,
         py::arg("num_conc_samples"), py::arg("seed"), py::arg("sampler"));
 }
 
+void bind_enum_write_funcs(py::module_ &m, const std::string &fn_name,
+                           EnumWriteLowThunk low, EnumWriteMidThunk mid,
+                           EnumWriteHighThunk high) {
+  m.def(("enum_write_low_" + fn_name).c_str(), low, py::arg("crtOpAddr"),
+        py::arg("opConFnAddr"), py::arg("bw"), py::arg("path"),
+        py::arg("binary") = false);
+  m.def(("enum_write_mid_" + fn_name).c_str(), mid, py::arg("crtOpAddr"),
+        py::arg("opConFnAddr"), py::arg("num_lat_samples"), py::arg("seed"),
+        py::arg("sampler"), py::arg("bw"), py::arg("path"),
+        py::arg("binary") = false);
+  m.def(("enum_write_high_" + fn_name).c_str(), high, py::arg("crtOpAddr"),
+        py::arg("opConFnAddr"), py::arg("num_lat_samples"),
+        py::arg("num_conc_samples"), py::arg("seed"), py::arg("sampler"),
+        py::arg("bw"), py::arg("path"), py::arg("binary") = false);
+}
+
 void bind_eval_func(py::module_ &m, const std::string &fn_name,
                     EvalThunk eval) {
   m.def(fn_name.c_str(), eval, py::arg("to_eval"), py::arg("xfers"),
@@ -0,0 +1,247 @@
+#pragma once
+
+#include <algorithm>
+#include <array>
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+#include <stdexcept>
+#include <tuple>
+#include <utility>
+#include <vector>
+
+#include "domain.hpp"
+
+namespace DomainHelpers {
+
+// Structure-of-arrays copy of an ArgsVec/ToEval: one contiguous column of
+// zero-extended uint64 values per field of every argument (and of the expected
+// result for a ToEval). This is the layout the batched transformer ABI reads
+// and writes (see detail::batch_xfer_fn_t).
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+class Columns {
+public:
+  static constexpr std::size_t N = sizeof...(BWs);
+  static constexpr std::size_t arity = Dom<ResBw>::arity;
+
+  using ResultD = Dom<ResBw>;
+  using ArgsTuple = Args<Dom, BWs...>;
+  using ArgPtrs = std::array<const std::uint64_t *, N * arity>;
+
+private:
+  using BWConstTuple = std::tuple<std::integral_constant<std::size_t, BWs>...>;
+
+  // args[a * arity + f] is field f of argument a, unless the argument columns
+  // are shared (see shareArgs), in which case they are read from sharedArgs
+  std::array<std::vector<std::uint64_t>, N * arity> args;
+  const std::uint64_t *sharedArgs = nullptr;
+  std::shared_ptr<const void> argsOwner;
+  // best[f] is field f of the expected result, empty when built from an
+  // ArgsVec, and read from sharedBest instead when that is set (see fromShared)
+  std::array<std::vector<std::uint64_t>, arity> best;
+  const std::uint64_t *sharedBest = nullptr;
+  std::size_t numRows = 0;
+
+  void pushArgs(const ArgsTuple &row) {
+    [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      (pushFields<Is, std::tuple_element_t<Is, BWConstTuple>::value>(
+           std::get<Is>(row)),
+       ...);
+    }(std::make_index_sequence<N>{});
+  }
+
+  template <std::size_t A, std::size_t BW>
+  void pushFields(const Dom<BW> &d) {
+    const auto packed = pack<Dom, BW>(d.v);
+    for (std::size_t f = 0; f < arity; ++f)
+      args[A * arity + f].push_back(packed[f]);
+  }
+
+  const std::uint64_t *argData(std::size_t i) const {
+    return sharedArgs ? sharedArgs + i * numRows : args[i].data();
+  }
+
+  const std::uint64_t *bestData(std::size_t f) const {
+    return sharedBest ? sharedBest + f * numRows : best[f].data();
+  }
+
+  template <std::size_t A, std::size_t BW>
+  Dom<BW> getArg(std::size_t row) const {
+    std::array<std::uint64_t, arity> packed;
+    for (std::size_t f = 0; f < arity; ++f)
+      packed[f] = argData(A * arity + f)[row];
+
+    return Dom<BW>(unpack<Dom, BW>(packed));
+  }
+
+  void reserve(std::size_t n) {
+    for (auto &col : args)
+      col.reserve(n);
+  }
+
+public:
+  Columns() = default;
+
+  explicit Columns(const ArgsVec<Dom, BWs...> &rows) : numRows(rows.size()) {
+    reserve(rows.size());
+    for (const ArgsTuple &row : rows)
+      pushArgs(row);
+  }
+
+  explicit Columns(const ToEval<Dom, ResBw, BWs...> &rows)
+      : numRows(rows.size()) {
+    reserve(rows.size());
+    for (auto &col : best)
+      col.reserve(rows.size());
+
+    for (const auto &[row_args, row_best] : rows) {
+      pushArgs(row_args);
+      const auto packed = pack<Dom, ResBw>(row_best.v);
+      for (std::size_t f = 0; f < arity; ++f)
+        best[f].push_back(packed[f]);
+    }
+  }
+
+  std::size_t size() const noexcept { return numRows; }
+
+  // Every step-th row, starting from the first. Enumerated datasets are in
+  // lattice order, so this is a sample spread evenly over the whole lattice.
+  Columns every(std::size_t step) const {
+    if (step == 0)
+      throw std::invalid_argument("Columns: step must be positive");
+
+    Columns out;
+    for (std::size_t row = 0; row < numRows; row += step, ++out.numRows) {
+      for (std::size_t i = 0; i < N * arity; ++i)
+        out.args[i].push_back(argData(i)[row]);
+      if (hasBest())
+        for (std::size_t f = 0; f < arity; ++f)
+          out.best[f].push_back(bestData(f)[row]);
+    }
+
+    return out;
+  }
+
+  bool hasBest() const noexcept {
+    return sharedBest || best[0].size() == numRows;
+  }
+
+  // Size of the argument columns when written one after the other by writeArgs.
+  std::size_t argsBytes() const noexcept {
+    return N * arity * numRows * sizeof(std::uint64_t);
+  }
+
+  void writeArgs(std::uint64_t *dst) const {
+    for (std::size_t i = 0; i < N * arity; ++i)
+      std::copy_n(argData(i), numRows, dst + i * numRows);
+  }
+
+  // Size of all the columns when written one after the other by write: the
+  // arguments, then the expected result.
+  std::size_t bytes() const noexcept {
+    return argsBytes() + arity * numRows * sizeof(std::uint64_t);
+  }
+
+  void write(std::uint64_t *dst) const {
+    if (!hasBest())
+      throw std::invalid_argument("Columns: no expected results to write");
+
+    writeArgs(dst);
+    dst += N * arity * numRows;
+    for (std::size_t f = 0; f < arity; ++f)
+      std::copy_n(bestData(f), numRows, dst + f * numRows);
+  }
+
+  // Columns of `numRows` rows that read all of their data from `src`, in the
+  // layout of write, without copying or checking it. `owner` keeps `src` alive.
+  static Columns fromShared(const std::uint64_t *src, std::size_t numRows,
+                            std::shared_ptr<const void> owner) {
+    Columns out;
+    out.numRows = numRows;
+    out.sharedArgs = src;
+    out.sharedBest = src + N * arity * numRows;
+    out.argsOwner = std::move(owner);
+
+    return out;
+  }
+
+  // Columns that read their arguments from `src`, in the layout of writeArgs,
+  // without checking them, with `bests` as the expected results. This is how
+  // a process that finds a lattice already shared skips enumerating its rows.
+  static Columns fromSharedArgs(const std::uint64_t *src,
+                                std::shared_ptr<const void> owner,
+                                const std::vector<ResultD> &bests) {
+    Columns out;
+    out.numRows = bests.size();
+    out.sharedArgs = src;
+    out.argsOwner = std::move(owner);
+    for (auto &col : out.best)
+      col.reserve(bests.size());
+    for (const ResultD &b : bests) {
+      const auto packed = pack<Dom, ResBw>(b.v);
+      for (std::size_t f = 0; f < arity; ++f)
+        out.best[f].push_back(packed[f]);
+    }
+
+    return out;
+  }
+
+  // A copy that reads its argument columns from `src`, in the layout of
+  // writeArgs, instead of from memory of its own. Datasets that only differ in
+  // their expected results (like the lattices of genLows for different ops) can
+  // then keep one copy of their arguments. `owner` keeps `src` alive, and `src`
+  // must hold the same arguments as these columns.
+  Columns shareArgs(const std::uint64_t *src,
+                    std::shared_ptr<const void> owner) const {
+    for (std::size_t i = 0; i < N * arity; ++i)
+      if (!std::equal(argData(i), argData(i) + numRows, src + i * numRows))
+        throw std::invalid_argument("Columns: shared arguments differ");
+
+    Columns out;
+    out.numRows = numRows;
+    // copied, as `owner` does not keep the shared expected results alive
+    if (hasBest())
+      for (std::size_t f = 0; f < arity; ++f)
+        out.best[f].assign(bestData(f), bestData(f) + numRows);
+    out.sharedArgs = src;
+    out.argsOwner = std::move(owner);
+
+    return out;
+  }
+
+  // Column pointers for the rows starting at `offset`, in batched ABI order.
+  ArgPtrs argPtrs(std::size_t offset) const {
+    ArgPtrs out;
+    for (std::size_t i = 0; i < N * arity; ++i)
+      out[i] = argData(i) + offset;
+
+    return out;
+  }
+
+  std::array<const std::uint64_t *, arity> bestPtrs(std::size_t offset) const {
+    std::array<const std::uint64_t *, arity> out;
+    for (std::size_t f = 0; f < arity; ++f)
+      out[f] = bestData(f) + offset;
+
+    return out;
+  }
+
+  ArgsTuple getArgs(std::size_t row) const {
+    return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+      return ArgsTuple{
+          getArg<Is, std::tuple_element_t<Is, BWConstTuple>::value>(row)...};
+    }(std::make_index_sequence<N>{});
+  }
+
+  ResultD getBest(std::size_t row) const {
+    std::array<std::uint64_t, arity> packed;
+    for (std::size_t f = 0; f < arity; ++f)
+      packed[f] = bestData(f)[row];
+
+    return ResultD(unpack<Dom, ResBw>(packed));
+  }
+};
+
+} // namespace DomainHelpers
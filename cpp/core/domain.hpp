@@ -3,8 +3,10 @@
 #include <cassert>
 #include <cstddef>
 #include <cstdint>
+#include <optional>
 #include <random>
 #include <string_view>
+#include <utility>
 #include <vector>
 
 #include "apint.hpp"
@@ -46,6 +48,11 @@ concept Domain =
       // this avoids int overflow
       { d.size() } noexcept -> std::same_as<std::uint64_t>;
       { d.sample_concrete(rng) } -> std::same_as<APInt<BW>>;
+      // Two elements, each concretizing to fewer values than d, that together
+      // concretize to the same values as d. std::nullopt if there are none.
+      {
+        d.split()
+      } -> std::same_as<std::optional<std::pair<D<BW>, D<BW>>>>;
 
       { os << d } -> std::same_as<std::ostream &>;
     } &&
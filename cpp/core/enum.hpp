@@ -1,6 +1,10 @@
 #pragma once
 
+#include <algorithm>
 #include <array>
+#include <cassert>
+#include <cstddef>
+#include <map>
 #include <optional>
 #include <random>
 #include <tuple>
@@ -9,6 +13,7 @@
 
 #include "apint.hpp"
 #include "domain.hpp"
+#include "parallel.hpp"
 #include "rand.hpp"
 
 using namespace DomainHelpers;
@@ -45,63 +50,174 @@ public:
                               reinterpret_cast<OpConFn>(*opConAddr))
                         : std::nullopt) {}
 
+  // Rows are generated in fixed size blocks (independent of the thread count)
+  // in parallel. The samples of a block are drawn from an mt19937 of its own,
+  // seeded with the seed and the index of the block, so the output only depends
+  // on the seed, not on the number of threads.
+  static constexpr std::size_t blockSize = 256;
+
+  // The best abstraction of a row is the join of the best abstractions of the
+  // two smaller rows it splits into (see Dom::split), so genLows goes through
+  // the rows from the smallest up, and only the rows that do not split
+  // (constants, mostly) go through the concrete op.
   EvalVec genLows() const {
+    const std::vector<ResD> bests = genLowBests();
     EvalVec r;
+    r.reserve(bests.size());
 
     auto lattices =
         std::tuple<std::vector<Dom<BWs>>...>{Dom<BWs>::enumLattice()...};
-
     ArgsTuple current{};
     for_each_combination<0>(lattices, current, [&](const ArgsTuple &args) {
-      r.emplace_back(std::make_tuple(args, toBestAbst(args)));
+      r.emplace_back(std::make_tuple(args, bests[r.size()]));
     });
 
     return r;
   }
 
-  EvalVec genMids(unsigned int num_lat_samples, std::mt19937 &rng,
-                  const rngdist::Sampler &sampler) {
-    EvalVec r;
-    r.reserve(num_lat_samples);
+  // The best abstractions of the rows of genLows, in the same order, without
+  // ever holding the rows themselves.
+  std::vector<ResD> genLowBests() const {
+    const auto lattices =
+        std::tuple<std::vector<Dom<BWs>>...>{Dom<BWs>::enumLattice()...};
 
-    for (unsigned int i = 0; i < num_lat_samples; ++i) {
-      ArgsTuple args = make_random_args(rng, sampler);
-      ResD res = toBestAbst(args);
+    const std::array<LatticeSplits, N> splits = std::apply(
+        [](const auto &...lats) {
+          return std::array<LatticeSplits, N>{lattice_splits(lats)...};
+        },
+        lattices);
+
+    // rows are in the order of for_each_combination, the last argument varying
+    // the fastest
+    std::array<std::size_t, N> strides{};
+    std::size_t stride = 1;
+    for (std::size_t i = N; i > 0; --i) {
+      strides[i - 1] = stride;
+      stride *= splits[i - 1].rank.size();
+    }
+    auto lattice_index = [&](std::size_t row, std::size_t i) {
+      return (row / strides[i]) % splits[i].rank.size();
+    };
+    auto row_args = [&](std::size_t row) {
+      return [&]<std::size_t... Is>(std::index_sequence<Is...>) {
+        return ArgsTuple{std::get<Is>(lattices)[lattice_index(row, Is)]...};
+      }(std::make_index_sequence<N>{});
+    };
+    std::vector<ResD> r(stride, ResD::bottom());
+
+    // the rows a row splits into have a smaller sum of ranks, so the rows are
+    // computed by that sum, and in parallel for the same sum
+    auto level = [&](std::size_t row) {
+      std::size_t l = 0;
+      for (std::size_t i = 0; i < N; ++i)
+        l += splits[i].rank[lattice_index(row, i)];
+      return l;
+    };
+    std::size_t numLevels = 1;
+    for (const LatticeSplits &s : splits)
+      numLevels += s.numRanks - 1;
+
+    std::vector<std::size_t> levelStart(numLevels + 1, 0);
+    for (std::size_t row = 0; row < r.size(); ++row)
+      ++levelStart[level(row) + 1];
+    for (std::size_t l = 0; l < numLevels; ++l)
+      levelStart[l + 1] += levelStart[l];
+    std::vector<std::size_t> byLevel(r.size());
+    std::vector<std::size_t> next(levelStart.begin(), levelStart.end() - 1);
+    for (std::size_t row = 0; row < r.size(); ++row)
+      byLevel[next[level(row)]++] = row;
+
+    const std::optional<ConcTable> table =
+        argBits <= maxTableBits ? std::optional(make_conc_table())
+                                : std::nullopt;
+    const ConcTable *tablePtr = table ? &*table : nullptr;
+    auto best = [&](std::size_t row) {
+      for (std::size_t i = 0; i < N; ++i) {
+        const std::size_t idx = lattice_index(row, i);
+        const auto &halves = splits[i].halves[idx];
+        if (!halves)
+          continue;
+
+        const std::size_t base = row - idx * strides[i];
+        return r[base + (*halves)[0] * strides[i]].join(
+            r[base + (*halves)[1] * strides[i]]);
+      }
 
-      r.emplace_back(std::make_tuple(args, res));
+      return toBestAbst(row_args(row), tablePtr);
+    };
+
+    for (std::size_t l = 0; l < numLevels; ++l) {
+      const std::size_t start = levelStart[l];
+      for_each_block(levelStart[l + 1] - start,
+                     [&](std::size_t, std::size_t lo, std::size_t hi) {
+                       for (std::size_t k = start + lo; k < start + hi; ++k)
+                         r[byLevel[k]] = best(byLevel[k]);
+                     });
     }
 
     return r;
   }
 
-  EvalVec genHighs(unsigned int num_lat_samples, unsigned int num_conc_samples,
-                   std::mt19937 &rng, const rngdist::Sampler &sampler) {
-    EvalVec r;
-    r.reserve(num_lat_samples);
-
-    for (unsigned int i = 0; i < num_lat_samples; ++i) {
-      ArgsTuple args = make_random_args(rng, sampler);
-      ResD res = ResD::bottom();
-
-      const std::uint64_t cap = static_cast<std::uint64_t>(num_conc_samples);
-      const std::uint64_t total_space = capped_concrete_space(args, cap);
-      if (total_space <= cap) {
-        res = toBestAbst(args);
-      } else {
-        for (unsigned int j = 0; j < num_conc_samples; ++j) {
-          std::array<std::uint64_t, N> concretes{};
-          fill_sampled_concretes(args, rng, concretes);
+  // The samples of genMids and genHighs are the first num_lat_samples of a
+  // stream that only depends on the seed, and `first` (a multiple of blockSize)
+  // skips that many rows of it, so a dataset can be generated in chunks.
+  EvalVec genMids(unsigned int num_lat_samples, unsigned int seed,
+                  const rngdist::Sampler &sampler,
+                  std::size_t first = 0) const {
+    assert(first % blockSize == 0);
+    EvalVec r(num_lat_samples);
+
+    for_each_block(r.size(), [&](std::size_t b, std::size_t lo,
+                                 std::size_t hi) {
+      std::mt19937 rng = block_rng(seed, first / blockSize + b);
+      for (std::size_t i = lo; i < hi; ++i) {
+        ArgsTuple args = make_random_args(rng, sampler);
+        ResD res = toBestAbst(args);
+
+        r[i] = std::make_tuple(args, res);
+      }
+    });
 
-          if (opCon && apply_n_ary(*opCon, concretes) == 0)
-            continue;
+    return r;
+  }
 
-          auto out = apply_n_ary(concOp, concretes);
-          res = res.join(ResD::fromConcrete(APInt<ResBw>(out)));
-        }
+  EvalVec genHighs(unsigned int num_lat_samples, unsigned int num_conc_samples,
+                   unsigned int seed, const rngdist::Sampler &sampler,
+                   std::size_t first = 0) const {
+    assert(first % blockSize == 0);
+    EvalVec r(num_lat_samples);
+
+    for_each_block(r.size(), [&](std::size_t b, std::size_t lo,
+                                 std::size_t hi) {
+      std::mt19937 rng = block_rng(seed, first / blockSize + b);
+      for (std::size_t i = lo; i < hi; ++i) {
+        ArgsTuple args = make_random_args(rng, sampler);
+        r[i] = std::make_tuple(args, sampledBest(args, num_conc_samples, rng));
       }
+    });
 
-      r.emplace_back(std::make_tuple(args, res));
-    }
+    return r;
+  }
+
+  // Rows of every combination of the edge values of the arguments (see
+  // edge_values), which random lattice samples rarely hit, with expected
+  // results computed like the ones of genHighs.
+  EvalVec genEdges(unsigned int num_conc_samples, unsigned int seed) const {
+    const auto edges =
+        std::tuple<std::vector<Dom<BWs>>...>{edge_values<BWs>()...};
+    std::vector<ArgsTuple> args;
+    ArgsTuple current{};
+    for_each_combination<0>(edges, current,
+                            [&](const ArgsTuple &a) { args.push_back(a); });
+
+    EvalVec r(args.size());
+    for_each_block(r.size(), [&](std::size_t b, std::size_t lo,
+                                 std::size_t hi) {
+      std::mt19937 rng = block_rng(seed, b);
+      for (std::size_t i = lo; i < hi; ++i)
+        r[i] = std::make_tuple(args[i],
+                               sampledBest(args[i], num_conc_samples, rng));
+    });
 
     return r;
   }
@@ -110,23 +226,190 @@ private:
   ConcOpFn concOp;
   std::optional<OpConFn> opCon;
 
-  ResD toBestAbst(const ArgsTuple &args) const {
+  // The lattices of genLows hold every concrete tuple of arguments many times
+  // over, so up to this many bits of arguments in total the concrete op is run
+  // once per tuple into a ConcTable, and the rows that do not split are
+  // computed from lookups.
+  static constexpr std::size_t argBits = (BWs + ...);
+  static constexpr std::size_t maxTableBits = 20;
+
+  // Result of the concrete op for every tuple of arguments, indexed by the
+  // arguments concatenated (the first one in the lowest bits). valid is 0 for
+  // the tuples the op constraint rules out.
+  struct ConcTable {
+    std::vector<std::uint64_t> out;
+    std::vector<std::uint8_t> valid;
+  };
+
+  // For every element of the lattice of an argument: the lattice indices of the
+  // halves it splits into, if it splits into elements of the lattice, and the
+  // rank of the number of values it concretizes to among all the elements,
+  // which is lower for both halves.
+  struct LatticeSplits {
+    std::vector<std::optional<std::array<std::size_t, 2>>> halves;
+    std::vector<std::size_t> rank;
+    std::size_t numRanks;
+  };
+
+  template <std::size_t BW>
+  static LatticeSplits lattice_splits(const std::vector<Dom<BW>> &lattice) {
+    std::map<std::array<std::uint64_t, Dom<BW>::arity>, std::size_t> index;
+    std::vector<std::size_t> sizes(lattice.size());
+    for (std::size_t i = 0; i < lattice.size(); ++i) {
+      index.emplace(pack<Dom, BW>(lattice[i].v), i);
+      sizes[i] = lattice[i].toConcrete().size();
+    }
+
+    std::vector<std::size_t> distinct = sizes;
+    std::sort(distinct.begin(), distinct.end());
+    distinct.erase(std::unique(distinct.begin(), distinct.end()),
+                   distinct.end());
+
+    LatticeSplits s{{}, std::vector<std::size_t>(lattice.size()),
+                    distinct.size()};
+    s.halves.resize(lattice.size());
+    for (std::size_t i = 0; i < lattice.size(); ++i) {
+      s.rank[i] = static_cast<std::size_t>(
+          std::lower_bound(distinct.begin(), distinct.end(), sizes[i]) -
+          distinct.begin());
+
+      const auto halves = lattice[i].split();
+      if (!halves)
+        continue;
+      const auto a = index.find(pack<Dom, BW>(halves->first.v));
+      const auto b = index.find(pack<Dom, BW>(halves->second.v));
+      if (a != index.end() && b != index.end())
+        s.halves[i] = std::array<std::size_t, 2>{a->second, b->second};
+    }
+
+    return s;
+  }
+
+  static std::size_t conc_index(const std::array<std::uint64_t, N> &vals) {
+    constexpr std::array<std::size_t, N> widths{BWs...};
+    std::size_t idx = 0;
+    std::size_t shift = 0;
+    for (std::size_t i = 0; i < N; ++i) {
+      idx |= static_cast<std::size_t>(vals[i]) << shift;
+      shift += widths[i];
+    }
+
+    return idx;
+  }
+
+  ConcTable make_conc_table() const {
+    constexpr std::array<std::size_t, N> widths{BWs...};
+    const std::size_t size = std::size_t{1} << argBits;
+    ConcTable t{std::vector<std::uint64_t>(size),
+                std::vector<std::uint8_t>(size)};
+
+    for_each_block(size, [&](std::size_t, std::size_t lo, std::size_t hi) {
+      for (std::size_t idx = lo; idx < hi; ++idx) {
+        std::array<std::uint64_t, N> vals{};
+        std::size_t shift = 0;
+        for (std::size_t i = 0; i < N; ++i) {
+          vals[i] = (idx >> shift) & ((std::uint64_t{1} << widths[i]) - 1);
+          shift += widths[i];
+        }
+
+        t.valid[idx] = !opCon || apply_n_ary(*opCon, vals) != 0;
+        if (t.valid[idx])
+          t.out[idx] = apply_n_ary(concOp, vals);
+      }
+    });
+
+    return t;
+  }
+
+  ResD toBestAbst(const ArgsTuple &args,
+                  const ConcTable *table = nullptr) const {
     auto concSets = build_concrete_sets(args);
     ResD res = ResD::bottom();
     std::array<std::uint64_t, N> current{};
 
     for_each_conc_combination<0>(
         concSets, current, [&](const std::array<std::uint64_t, N> &vals) {
-          if (opCon && apply_n_ary(*opCon, vals) == 0)
-            return;
+          std::uint64_t out;
+          if (table) {
+            const std::size_t idx = conc_index(vals);
+            if (!table->valid[idx])
+              return;
+            out = table->out[idx];
+          } else {
+            if (opCon && apply_n_ary(*opCon, vals) == 0)
+              return;
+            out = apply_n_ary(concOp, vals);
+          }
 
-          auto out = apply_n_ary(concOp, vals);
           res = res.join(ResD::fromConcrete(APInt<ResBw>(out)));
         });
 
     return res;
   }
 
+  // The best abstraction of the results of `args` if they have at most
+  // num_conc_samples concrete tuples, else the join of the results of that many
+  // sampled ones, which is below it.
+  ResD sampledBest(const ArgsTuple &args, unsigned int num_conc_samples,
+                   std::mt19937 &rng) const {
+    const std::uint64_t cap = static_cast<std::uint64_t>(num_conc_samples);
+    if (capped_concrete_space(args, cap) <= cap)
+      return toBestAbst(args);
+
+    ResD res = ResD::bottom();
+    for (unsigned int j = 0; j < num_conc_samples; ++j) {
+      std::array<std::uint64_t, N> concretes{};
+      fill_sampled_concretes(args, rng, concretes);
+
+      if (opCon && apply_n_ary(*opCon, concretes) == 0)
+        continue;
+
+      auto out = apply_n_ary(concOp, concretes);
+      res = res.join(ResD::fromConcrete(APInt<ResBw>(out)));
+    }
+
+    return res;
+  }
+
+  // Top, the constants 0, 1, -1 and the signed extremes, and the joins of
+  // every two of those constants, which are the extreme ranges of the range
+  // domains.
+  template <std::size_t BW> static std::vector<Dom<BW>> edge_values() {
+    const std::array<Dom<BW>, 5> consts{
+        Dom<BW>::fromConcrete(APInt<BW>::getZero()),
+        Dom<BW>::fromConcrete(APInt<BW>(1)),
+        Dom<BW>::fromConcrete(APInt<BW>::getAllOnes()),
+        Dom<BW>::fromConcrete(APInt<BW>::getSignedMinValue()),
+        Dom<BW>::fromConcrete(APInt<BW>::getSignedMaxValue())};
+
+    std::vector<Dom<BW>> r{Dom<BW>::top()};
+    auto add = [&](const Dom<BW> &x) {
+      if (std::find(r.begin(), r.end(), x) == r.end())
+        r.push_back(x);
+    };
+    for (std::size_t i = 0; i < consts.size(); ++i) {
+      add(consts[i]);
+      for (std::size_t j = 0; j < i; ++j)
+        add(consts[j].join(consts[i]));
+    }
+
+    return r;
+  }
+
+  // f(b, lo, hi) for every block b of the rows [lo, hi) out of n
+  template <typename F>
+  static void for_each_block(std::size_t n, const F &f) {
+    parallel::parallelFor((n + blockSize - 1) / blockSize, [&](std::size_t b) {
+      f(b, b * blockSize, std::min(n, (b + 1) * blockSize));
+    });
+  }
+
+  static std::mt19937 block_rng(unsigned int seed, std::size_t block) {
+    std::seed_seq seq{seed, static_cast<unsigned int>(block),
+                      static_cast<unsigned int>(block >> 32)};
+    return std::mt19937(seq);
+  }
+
   ArgsTuple make_random_args(std::mt19937 &rng,
                              const rngdist::Sampler &sampler) const {
     ArgsTuple res{};
@@ -0,0 +1,209 @@
+#pragma once
+
+#include <algorithm>
+#include <array>
+#include <cstddef>
+#include <cstdint>
+#include <fstream>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <tuple>
+#include <vector>
+
+#include "domain.hpp"
+#include "enum.hpp"
+#include "parallel.hpp"
+#include "rand.hpp"
+
+enum class EnumFormat { Tsv, Bin };
+
+// Streams the rows of EnumDomain for one bitwidth to the end of a file, without
+// ever holding more than a chunk of sampled rows. The frontmatter and the
+// header are written by the caller. Rows are formatted in parallel, one block
+// at a time, and written in order, so the file does not depend on the number of
+// threads. The formats are:
+//  - Tsv: the layout of EnumData.write_tsv, bw, the arguments, then the ideal.
+//  - Bin: a section of the binary datasets of enum_bin.py, the bw and the
+//    number of rows as uint64, then the columns of the rows in the layout of
+//    Columns::write.
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+class EnumWriter {
+public:
+  using EnumT = EnumDomain<Dom, ResBw, BWs...>;
+  using EvalVec = typename EnumT::EvalVec;
+
+  // rows sampled per chunk, a multiple of EnumT::blockSize
+  static constexpr std::size_t chunkRows = 64 * EnumT::blockSize;
+
+  // `path` must exist, the rows are written after what it already holds
+  EnumWriter(const std::string &path, std::size_t bitwidth,
+             EnumFormat fmt = EnumFormat::Tsv)
+      : out(path, std::ios::in | std::ios::out | std::ios::binary),
+        format(fmt), bw(bitwidth), bwCell(std::to_string(bitwidth)) {
+    if (!out)
+      throw std::runtime_error("EnumWriter: cannot open " + path);
+    out.seekp(0, std::ios::end);
+  }
+
+  std::size_t writeLows(const EnumT &ed) {
+    const EvalVec rows = ed.genLows();
+    begin(rows.size());
+    for (std::size_t first = 0; first < rows.size(); first += chunkRows)
+      write(rows, first, std::min(rows.size(), first + chunkRows), first);
+
+    return finish(rows.size());
+  }
+
+  std::size_t writeMids(const EnumT &ed, unsigned int num_lat_samples,
+                        unsigned int seed, const rngdist::Sampler &sampler) {
+    begin(num_lat_samples);
+    for (std::size_t first = 0; first < num_lat_samples; first += chunkRows) {
+      const auto n = static_cast<unsigned int>(
+          std::min<std::size_t>(chunkRows, num_lat_samples - first));
+      const EvalVec rows = ed.genMids(n, seed, sampler, first);
+      write(rows, 0, rows.size(), first);
+    }
+
+    return finish(num_lat_samples);
+  }
+
+  std::size_t writeHighs(const EnumT &ed, unsigned int num_lat_samples,
+                         unsigned int num_conc_samples, unsigned int seed,
+                         const rngdist::Sampler &sampler) {
+    begin(num_lat_samples);
+    for (std::size_t first = 0; first < num_lat_samples; first += chunkRows) {
+      const auto n = static_cast<unsigned int>(
+          std::min<std::size_t>(chunkRows, num_lat_samples - first));
+      const EvalVec rows =
+          ed.genHighs(n, num_conc_samples, seed, sampler, first);
+      write(rows, 0, rows.size(), first);
+    }
+
+    return finish(num_lat_samples);
+  }
+
+private:
+  static constexpr std::size_t N = sizeof...(BWs);
+  static constexpr std::size_t arity = Dom<ResBw>::arity;
+  static constexpr std::size_t numCols = (N + 1) * arity;
+
+  std::fstream out;
+  EnumFormat format;
+  std::size_t bw;
+  std::string bwCell;
+  // where the columns of the section start, and its number of rows (Bin only)
+  std::streamoff colsPos = 0;
+  std::size_t sectionRows = 0;
+
+  void begin(std::size_t numRows) {
+    if (format != EnumFormat::Bin)
+      return;
+
+    const std::array<std::uint64_t, 2> header{bw, numRows};
+    writeWords(header.data(), header.size());
+    colsPos = out.tellp();
+    sectionRows = numRows;
+    // sized up front, so the columns can be filled in one chunk at a time
+    if (numRows > 0) {
+      const std::uint64_t zero = 0;
+      out.seekp(colsPos + static_cast<std::streamoff>(
+                              (numCols * numRows - 1) * sizeof zero));
+      writeWords(&zero, 1);
+    }
+  }
+
+  void writeWords(const std::uint64_t *src, std::size_t n) {
+    out.write(reinterpret_cast<const char *>(src),
+              static_cast<std::streamsize>(n * sizeof(std::uint64_t)));
+  }
+
+  // the printed domains end in a newline, which is left out of the cell
+  template <std::size_t BW>
+  static void appendCell(std::string &s, const Dom<BW> &d) {
+    std::ostringstream os;
+    os << d;
+    std::string cell = os.str();
+    cell.pop_back();
+    s += '\t';
+    s += cell;
+  }
+
+  void appendRow(std::string &s,
+                 const typename EvalVec::value_type &row) const {
+    s += bwCell;
+    std::apply([&](const auto &...args) { (appendCell(s, args), ...); },
+               std::get<0>(row));
+    appendCell(s, std::get<1>(row));
+    s += '\n';
+  }
+
+  template <std::size_t BW>
+  static void packCell(std::uint64_t *&col, std::size_t stride,
+                       const Dom<BW> &d) {
+    const auto packed = pack<Dom, BW>(d.v);
+    for (std::size_t f = 0; f < arity; ++f, col += stride)
+      *col = packed[f];
+  }
+
+  // rows [begin, end) of `rows` are rows [first, ...) of the section
+  void write(const EvalVec &rows, std::size_t begin, std::size_t end,
+             std::size_t first) {
+    if (format == EnumFormat::Bin)
+      writeCols(rows, begin, end, first);
+    else
+      writeTsv(rows, begin, end);
+  }
+
+  void writeCols(const EvalVec &rows, std::size_t begin, std::size_t end,
+                 std::size_t first) {
+    const std::size_t n = end - begin;
+    const std::size_t numBlocks =
+        (n + EnumT::blockSize - 1) / EnumT::blockSize;
+    std::vector<std::uint64_t> cols(numCols * n);
+    parallel::parallelFor(numBlocks, [&](std::size_t b) {
+      const std::size_t lo = b * EnumT::blockSize;
+      const std::size_t hi = std::min(n, lo + EnumT::blockSize);
+      for (std::size_t i = lo; i < hi; ++i) {
+        std::uint64_t *col = cols.data() + i;
+        const auto &[args, best] = rows[begin + i];
+        std::apply([&](const auto &...a) { (packCell(col, n, a), ...); },
+                   args);
+        packCell(col, n, best);
+      }
+    });
+
+    for (std::size_t c = 0; c < numCols; ++c) {
+      const std::size_t row = c * sectionRows + first;
+      out.seekp(colsPos +
+                static_cast<std::streamoff>(row * sizeof(std::uint64_t)));
+      writeWords(cols.data() + c * n, n);
+    }
+  }
+
+  void writeTsv(const EvalVec &rows, std::size_t begin, std::size_t end) {
+    const std::size_t numBlocks =
+        (end - begin + EnumT::blockSize - 1) / EnumT::blockSize;
+    std::vector<std::string> blocks(numBlocks);
+    parallel::parallelFor(numBlocks, [&](std::size_t b) {
+      const std::size_t lo = begin + b * EnumT::blockSize;
+      const std::size_t hi = std::min(end, lo + EnumT::blockSize);
+      for (std::size_t i = lo; i < hi; ++i)
+        appendRow(blocks[b], rows[i]);
+    });
+
+    for (const std::string &block : blocks)
+      out.write(block.data(), static_cast<std::streamsize>(block.size()));
+  }
+
+  std::size_t finish(std::size_t numRows) {
+    out.seekp(0, std::ios::end);
+    out.flush();
+    if (!out)
+      throw std::runtime_error("EnumWriter: write failed");
+
+    return numRows;
+  }
+};
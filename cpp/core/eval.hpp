@@ -1,5 +1,6 @@
 #pragma once
 
+#include <algorithm>
 #include <array>
 #include <cstddef>
 #include <cstdint>
@@ -11,7 +12,9 @@
 #include <vector>
 
 #include "../llvm/pattern.h"
+#include "columns.hpp"
 #include "domain.hpp"
+#include "parallel.hpp"
 #include "results.hpp"
 
 using namespace DomainHelpers;
@@ -28,6 +31,41 @@ template <std::size_t N, std::size_t Arity>
 using xfer_fn_t =
     decltype(xfer_fn_ptr<N, Arity>(std::make_index_sequence<N>{}));
 
+// Batched transformer ABI: `in[a * arity + f]` points to the column of field f
+// of argument a, `out[f]` to the column for field f of the result, and the
+// function processes the first `n` rows of those columns (see Columns).
+using batch_xfer_fn_t = void (*)(const std::uint64_t *const *,
+                                 std::uint64_t *const *, std::uint64_t);
+
+// Scratch output columns for one block of rows of a batched call.
+template <std::size_t Arity> struct BatchOut {
+  std::array<std::vector<std::uint64_t>, Arity> cols;
+
+  explicit BatchOut(std::size_t n) {
+    for (auto &col : cols)
+      col.resize(n);
+  }
+
+  template <typename ColumnsT>
+  void run(batch_xfer_fn_t f, const ColumnsT &in, std::size_t offset,
+           std::size_t n) {
+    const auto inPtrs = in.argPtrs(offset);
+    std::array<std::uint64_t *, Arity> outPtrs;
+    for (std::size_t i = 0; i < Arity; ++i)
+      outPtrs[i] = cols[i].data();
+
+    f(inPtrs.data(), outPtrs.data(), n);
+  }
+
+  std::array<std::uint64_t, Arity> get(std::size_t row) const {
+    std::array<std::uint64_t, Arity> out;
+    for (std::size_t i = 0; i < Arity; ++i)
+      out[i] = cols[i][row];
+
+    return out;
+  }
+};
+
 } // namespace detail
 
 template <template <std::size_t> class Dom, std::size_t ResBw,
@@ -58,6 +96,27 @@ std::vector<Dom<ResBw>> run_transformer(const std::uintptr_t &xfer_addr,
   return out;
 }
 
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+std::vector<Dom<ResBw>>
+run_transformer_batched(const std::uintptr_t &xfer_addr,
+                        const Columns<Dom, ResBw, BWs...> &to_run) {
+  using ResultD = Dom<ResBw>;
+  constexpr std::size_t arity = ResultD::arity;
+
+  detail::BatchOut<arity> res(to_run.size());
+  res.run(reinterpret_cast<detail::batch_xfer_fn_t>(xfer_addr), to_run, 0,
+          to_run.size());
+
+  std::vector<ResultD> out;
+  out.reserve(to_run.size());
+  for (std::size_t i = 0; i < to_run.size(); ++i)
+    out.emplace_back(ResultD(unpack<Dom, ResBw>(res.get(i))));
+
+  return out;
+}
+
 template <template <std::size_t> class Dom, std::size_t ResBw,
           std::size_t... BWs>
   requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
@@ -249,15 +308,30 @@ public:
       refFns[i] = reinterpret_cast<XferFn>(refAddrs[i]);
   }
 
+  // Rows are split into fixed size blocks (independent of the thread count)
+  // which are evaluated in parallel, and the per-block results are merged in
+  // row order. So the output does not depend on the number of threads, and the
+  // examples kept are the same as for a single sequential pass.
+  static constexpr std::size_t blockSize = 4096;
+
   Results eval(const std::vector<Row> &to_eval) const {
-    Results r{static_cast<unsigned int>(xfrFns.size()), ResBw,
-              maxUnsoundExamples, maxImpreciseExamples};
+    const Results empty{static_cast<unsigned int>(xfrFns.size()), ResBw,
+                        maxUnsoundExamples, maxImpreciseExamples};
+    const std::size_t numBlocks = (to_eval.size() + blockSize - 1) / blockSize;
+    std::vector<Results> partials(numBlocks, empty);
+
+    parallel::parallelFor(numBlocks, [&](std::size_t b) {
+      const std::size_t end = std::min(to_eval.size(), (b + 1) * blockSize);
+      for (std::size_t i = b * blockSize; i < end; ++i) {
+        const ArgsTuple &args = std::get<0>(to_eval[i]);
+        const ResultD &best = std::get<1>(to_eval[i]);
+        evalSingle(args, best, partials[b]);
+      }
+    });
 
-    for (const Row &row : to_eval) {
-      const ArgsTuple &args = std::get<0>(row);
-      const ResultD &best = std::get<1>(row);
-      evalSingle(args, best, r);
-    }
+    Results r = empty;
+    for (const Results &partial : partials)
+      r.merge(partial);
     r.cleanExamples();
     return r;
   }
@@ -291,18 +365,234 @@ private:
     bool solved = (ref == best);
     double base_distance = dist(ref, best);
 
-    for (unsigned int i = 0; i < synth_results.size(); ++i) {
-      ResultD synth_after_meet = ref.meet(synth_results[i]);
-      bool sound = DomainHelpers::isSuperset(synth_after_meet, best);
-      bool exact = (synth_after_meet == best);
-      double distance = dist(synth_after_meet, best);
-      double sound_distance = sound ? distance : base_distance;
-      // Xuanyu: Creating a CaseExample is expensive, so we passed things to
-      // incResult and create it only when necessary.
-      r.incResult(sound, exact, solved, sound_distance, args, synth_after_meet,
-                  best, distance, i);
-    }
+    for (unsigned int i = 0; i < synth_results.size(); ++i)
+      scoreCandidate(args, best, ref, solved, base_distance, synth_results[i],
+                     i, r);
 
     r.incCases(solved, base_distance);
   }
+
+public:
+  static void scoreCandidate(const ArgsTuple &args, const ResultD &best,
+                             const ResultD &ref, bool solved,
+                             double base_distance, const ResultD &synth,
+                             unsigned int i, Results &r) {
+    scoreMet(args, best, solved, base_distance, ref.meet(synth), i, r);
+  }
+
+  // scoreCandidate for a candidate output that was already met with the ref.
+  static void scoreMet(const ArgsTuple &args, const ResultD &best, bool solved,
+                       double base_distance, const ResultD &synth_after_meet,
+                       unsigned int i, Results &r) {
+    bool sound = DomainHelpers::isSuperset(synth_after_meet, best);
+    bool exact = (synth_after_meet == best);
+    double distance = dist(synth_after_meet, best);
+    double sound_distance = sound ? distance : base_distance;
+    // Xuanyu: Creating a CaseExample is expensive, so we passed things to
+    // incResult and create it only when necessary.
+    r.incResult(sound, exact, solved, sound_distance, args, synth_after_meet,
+                best, distance, i);
+  }
+};
+
+// Eval over a Columns dataset with transformers using the batched ABI. Each
+// block of rows costs one call per transformer instead of one per row. Within
+// a block the candidates are scored one after another rather than row by row,
+// which leaves every per-candidate sum in row order, so the results match Eval.
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+class EvalBatched {
+public:
+  using ResultD = Dom<ResBw>;
+  static constexpr std::size_t arity = ResultD::arity;
+
+  using ColumnsT = Columns<Dom, ResBw, BWs...>;
+  using ArgsTuple = std::tuple<Dom<BWs>...>;
+  using BatchFn = detail::batch_xfer_fn_t;
+  using ScalarEval = Eval<Dom, ResBw, BWs...>;
+
+  static constexpr std::size_t blockSize = ScalarEval::blockSize;
+
+private:
+  std::vector<BatchFn> xfrFns;
+  std::vector<BatchFn> refFns;
+  unsigned int maxUnsoundExamples;
+  unsigned int maxImpreciseExamples;
+
+public:
+  EvalBatched(const std::vector<std::uintptr_t> &xfrAddrs,
+              const std::vector<std::uintptr_t> &refAddrs,
+              unsigned int maxUnsound = 0, unsigned int maxImprecise = 0)
+      : xfrFns(xfrAddrs.size(), nullptr), refFns(refAddrs.size(), nullptr),
+        maxUnsoundExamples(maxUnsound), maxImpreciseExamples(maxImprecise) {
+    for (std::size_t i = 0; i < xfrFns.size(); ++i)
+      xfrFns[i] = reinterpret_cast<BatchFn>(xfrAddrs[i]);
+    for (std::size_t i = 0; i < refFns.size(); ++i)
+      refFns[i] = reinterpret_cast<BatchFn>(refAddrs[i]);
+  }
+
+  Results eval(const ColumnsT &to_eval) const {
+    const Results empty{static_cast<unsigned int>(xfrFns.size()), ResBw,
+                        maxUnsoundExamples, maxImpreciseExamples};
+    const std::size_t numBlocks = (to_eval.size() + blockSize - 1) / blockSize;
+    std::vector<Results> partials(numBlocks, empty);
+
+    parallel::parallelFor(numBlocks, [&](std::size_t b) {
+      const std::size_t lo = b * blockSize;
+      const std::size_t n = std::min(to_eval.size(), lo + blockSize) - lo;
+      evalBlock(to_eval, lo, n, partials[b]);
+    });
+
+    Results r = empty;
+    for (const Results &partial : partials)
+      r.merge(partial);
+    r.cleanExamples();
+    return r;
+  }
+
+private:
+  void evalBlock(const ColumnsT &to_eval, std::size_t lo, std::size_t n,
+                 Results &r) const {
+    detail::BatchOut<arity> out(n);
+
+    std::vector<ResultD> refs;
+    if (refFns.empty())
+      refs.assign(n, ResultD::top());
+    for (std::size_t k = 0; k < refFns.size(); ++k) {
+      out.run(refFns[k], to_eval, lo, n);
+      for (std::size_t j = 0; j < n; ++j) {
+        const ResultD res(unpack<Dom, ResBw>(out.get(j)));
+        if (k == 0)
+          refs.push_back(res);
+        else
+          refs[j] = refs[j].meet(res);
+      }
+    }
+
+    std::vector<ArgsTuple> args;
+    std::vector<ResultD> best;
+    std::vector<char> solved;
+    std::vector<double> base_distance;
+    args.reserve(n);
+    best.reserve(n);
+    solved.reserve(n);
+    base_distance.reserve(n);
+    for (std::size_t j = 0; j < n; ++j) {
+      args.push_back(to_eval.getArgs(lo + j));
+      best.push_back(to_eval.getBest(lo + j));
+      solved.push_back(refs[j] == best[j]);
+      base_distance.push_back(dist(refs[j], best[j]));
+    }
+
+    for (unsigned int i = 0; i < xfrFns.size(); ++i) {
+      out.run(xfrFns[i], to_eval, lo, n);
+      for (std::size_t j = 0; j < n; ++j)
+        ScalarEval::scoreCandidate(args[j], best[j], refs[j], solved[j],
+                                   base_distance[j],
+                                   ResultD(unpack<Dom, ResBw>(out.get(j))), i,
+                                   r);
+    }
+
+    for (std::size_t j = 0; j < n; ++j)
+      r.incCases(solved[j], base_distance[j]);
+  }
+};
+
+// Eval over a Columns dataset with a single fused kernel per transformer set
+// (see LowerToLLVM.shim_fused). Per block of rows the kernel writes the meet of
+// the reference transformers to out[f] and the output of candidate i, already
+// met with it, to out[(i + 1) * arity + f]. So a block costs one call in total,
+// and the references are evaluated once per row rather than per candidate.
+// Candidates are scored in the same order as EvalBatched, so the results match
+// Eval.
+template <template <std::size_t> class Dom, std::size_t ResBw,
+          std::size_t... BWs>
+  requires(Domain<Dom, ResBw> && (Domain<Dom, BWs> && ...))
+class EvalFused {
+public:
+  using ResultD = Dom<ResBw>;
+  static constexpr std::size_t arity = ResultD::arity;
+
+  using ColumnsT = Columns<Dom, ResBw, BWs...>;
+  using ArgsTuple = std::tuple<Dom<BWs>...>;
+  using ScalarEval = Eval<Dom, ResBw, BWs...>;
+
+  static constexpr std::size_t blockSize = ScalarEval::blockSize;
+
+private:
+  detail::batch_xfer_fn_t fusedFn;
+  unsigned int numXfers;
+  unsigned int maxUnsoundExamples;
+  unsigned int maxImpreciseExamples;
+
+public:
+  EvalFused(std::uintptr_t fusedAddr, unsigned int numXfers_,
+            unsigned int maxUnsound = 0, unsigned int maxImprecise = 0)
+      : fusedFn(reinterpret_cast<detail::batch_xfer_fn_t>(fusedAddr)),
+        numXfers(numXfers_), maxUnsoundExamples(maxUnsound),
+        maxImpreciseExamples(maxImprecise) {}
+
+  Results eval(const ColumnsT &to_eval) const {
+    const Results empty{numXfers, ResBw, maxUnsoundExamples,
+                        maxImpreciseExamples};
+    const std::size_t numBlocks = (to_eval.size() + blockSize - 1) / blockSize;
+    std::vector<Results> partials(numBlocks, empty);
+
+    parallel::parallelFor(numBlocks, [&](std::size_t b) {
+      const std::size_t lo = b * blockSize;
+      const std::size_t n = std::min(to_eval.size(), lo + blockSize) - lo;
+      evalBlock(to_eval, lo, n, partials[b]);
+    });
+
+    Results r = empty;
+    for (const Results &partial : partials)
+      r.merge(partial);
+    r.cleanExamples();
+    return r;
+  }
+
+private:
+  void evalBlock(const ColumnsT &to_eval, std::size_t lo, std::size_t n,
+                 Results &r) const {
+    const std::size_t numCols = (numXfers + 1) * arity;
+    std::vector<std::uint64_t> scratch(numCols * n);
+    std::vector<std::uint64_t *> outPtrs(numCols);
+    for (std::size_t c = 0; c < numCols; ++c)
+      outPtrs[c] = scratch.data() + c * n;
+
+    fusedFn(to_eval.argPtrs(lo).data(), outPtrs.data(), n);
+
+    auto get = [&](std::size_t group, std::size_t j) {
+      std::array<std::uint64_t, arity> packed;
+      for (std::size_t f = 0; f < arity; ++f)
+        packed[f] = outPtrs[group * arity + f][j];
+
+      return ResultD(unpack<Dom, ResBw>(packed));
+    };
+
+    std::vector<ArgsTuple> args;
+    std::vector<ResultD> best;
+    std::vector<char> solved;
+    std::vector<double> base_distance;
+    args.reserve(n);
+    best.reserve(n);
+    solved.reserve(n);
+    base_distance.reserve(n);
+    for (std::size_t j = 0; j < n; ++j) {
+      const ResultD ref = get(0, j);
+      args.push_back(to_eval.getArgs(lo + j));
+      best.push_back(to_eval.getBest(lo + j));
+      solved.push_back(ref == best[j]);
+      base_distance.push_back(dist(ref, best[j]));
+    }
+
+    for (unsigned int i = 0; i < numXfers; ++i)
+      for (std::size_t j = 0; j < n; ++j)
+        ScalarEval::scoreMet(args[j], best[j], solved[j], base_distance[j],
+                             get(i + 1, j), i, r);
+
+    for (std::size_t j = 0; j < n; ++j)
+      r.incCases(solved[j], base_distance[j]);
+  }
 };
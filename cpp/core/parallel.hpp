@@ -0,0 +1,68 @@
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <cstddef>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+namespace parallel {
+
+inline std::atomic<unsigned int> numThreads{1};
+
+inline unsigned int getNumThreads() { return numThreads.load(); }
+
+// 0 means one thread per hardware thread.
+inline void setNumThreads(unsigned int n) {
+  if (n == 0)
+    n = std::max(1u, std::thread::hardware_concurrency());
+  numThreads.store(n);
+}
+
+// Calls f(i) for every i in [0, n) on up to getNumThreads() threads, the
+// calling thread included. Indices are handed out dynamically, so f(i) must only
+// write to state owned by index i. Workers are spawned per call rather than
+// kept alive, so nothing outlives the Python interpreter; callers are expected
+// to hand out chunks large enough to amortize that. The first exception thrown
+// by f is rethrown once all workers have stopped.
+template <typename F> void parallelFor(std::size_t n, const F &f) {
+  const std::size_t numWorkers =
+      std::min(static_cast<std::size_t>(getNumThreads()), n);
+  if (numWorkers <= 1) {
+    for (std::size_t i = 0; i < n; ++i)
+      f(i);
+    return;
+  }
+
+  std::atomic<std::size_t> next{0};
+  std::exception_ptr err;
+  std::mutex errMutex;
+
+  auto work = [&]() {
+    for (std::size_t i = next++; i < n; i = next++) {
+      try {
+        f(i);
+      } catch (...) {
+        std::lock_guard<std::mutex> lock(errMutex);
+        if (!err)
+          err = std::current_exception();
+        next = n;
+      }
+    }
+  };
+
+  std::vector<std::thread> workers;
+  workers.reserve(numWorkers - 1);
+  for (std::size_t i = 1; i < numWorkers; ++i)
+    workers.emplace_back(work);
+  work();
+  for (std::thread &t : workers)
+    t.join();
+
+  if (err)
+    std::rethrow_exception(err);
+}
+
+} // namespace parallel
@@ -70,7 +70,7 @@ struct NormalSampler final : Sampler {
     assert(lo <= hi);
     assert(std::isfinite(sigma) && sigma > 0.0);
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
+    std::normal_distribution<double> nd{0.0, 1.0};
 
     for (int iter = 0; iter < 10'000; ++iter) {
       const double x = 0.5 + sigma * nd(rng);
@@ -94,7 +94,7 @@ struct SkewNormalLeftSampler final : Sampler {
     assert(std::isfinite(sigma) && sigma > 0.0);
     assert(std::isfinite(alpha));
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
+    std::normal_distribution<double> nd{0.0, 1.0};
 
     const double a = -std::fabs(alpha);
     const double denom = std::sqrt(1.0 + a * a);
@@ -126,7 +126,7 @@ struct SkewNormalRightSampler final : Sampler {
     assert(std::isfinite(sigma) && sigma > 0.0);
     assert(std::isfinite(alpha));
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
+    std::normal_distribution<double> nd{0.0, 1.0};
 
     const double a = +std::fabs(alpha);
     const double denom = std::sqrt(1.0 + a * a);
@@ -159,7 +159,7 @@ struct BimodalSymmetricSampler final : Sampler {
     assert(std::isfinite(sigma) && sigma > 0.0);
     assert(std::isfinite(separation));
 
-    static thread_local std::normal_distribution<double> nd{0.0, 1.0};
+    std::normal_distribution<double> nd{0.0, 1.0};
     std::bernoulli_distribution pick_right{0.5};
 
     double sep = separation;
@@ -1,6 +1,7 @@
 #pragma once
 
 #include <algorithm>
+#include <cstddef>
 #include <cstdint>
 #include <functional>
 #include <iomanip>
@@ -85,6 +86,14 @@ private:
     }
   }
 
+  template <typename Getter> auto collect(Getter getter) const {
+    std::vector<decltype(getter(r.front()))> out;
+    out.reserve(r.size());
+    for (const auto &ri : r)
+      out.push_back(getter(ri));
+    return out;
+  }
+
   template <typename Getter>
   std::vector<CaseExamples> collectExampleTuples(Getter getter) const {
     std::vector<CaseExamples> out;
@@ -155,6 +164,33 @@ public:
     base_distance += distance;
   }
 
+  // Folds in the results of the rows following the ones in this object,
+  // keeping the examples that a single pass over all rows would have kept.
+  void merge(const Results &rhs) {
+    for (std::size_t i = 0; i < r.size(); ++i) {
+      const Result &ri = rhs.r[i];
+      r[i].sound += ri.sound;
+      r[i].distance += ri.distance;
+      r[i].exact += ri.exact;
+      r[i].sound_distance += ri.sound_distance;
+      r[i].unsolved_exact += ri.unsolved_exact;
+      for (const CaseExample &ex : ri.unsound_examples) {
+        if (maxUnsoundExamples <= r[i].unsound_examples.size())
+          break;
+        r[i].unsound_examples.push_back(ex);
+      }
+      for (const CaseExample &ex : ri.imprecise_examples) {
+        if (5 * maxImpreciseExamples <= r[i].imprecise_examples.size())
+          break;
+        r[i].imprecise_examples.push_back(ex);
+      }
+    }
+
+    cases += rhs.cases;
+    unsolvedCases += rhs.unsolvedCases;
+    base_distance += rhs.base_distance;
+  }
+
   void cleanExamples() {
     for (auto &result : r) {
       // Keep only the first maxUnsoundExamples
@@ -176,6 +212,28 @@ public:
     }
   }
 
+  unsigned int getBw() const { return bw; }
+  unsigned int getCases() const { return cases; }
+  unsigned int getUnsolvedCases() const { return unsolvedCases; }
+  double getBaseDistance() const { return base_distance; }
+
+  // Per transformer counters, in the order the transformers were passed in.
+  std::vector<unsigned long> getSound() const {
+    return collect([](const Result &x) { return x.sound; });
+  }
+  std::vector<double> getDistance() const {
+    return collect([](const Result &x) { return x.distance; });
+  }
+  std::vector<unsigned long> getExact() const {
+    return collect([](const Result &x) { return x.exact; });
+  }
+  std::vector<unsigned long> getUnsolvedExact() const {
+    return collect([](const Result &x) { return x.unsolved_exact; });
+  }
+  std::vector<double> getSoundDistance() const {
+    return collect([](const Result &x) { return x.sound_distance; });
+  }
+
   std::vector<CaseExamples> getUnsoundExampleTuples() const {
     return collectExampleTuples([](const Result &ri) -> const CaseExamples & {
       return ri.unsound_examples;
@@ -3,9 +3,11 @@
 #include <array>
 #include <cassert>
 #include <cstdint>
+#include <optional>
 #include <ostream>
 #include <random>
 #include <string_view>
+#include <utility>
 #include <vector>
 
 #include "apint.hpp"
@@ -103,6 +105,18 @@ public:
     return static_cast<double>(unknown_bits + 1) / static_cast<double>(BW + 1);
   }
 
+  // The lowest unknown bit known to be 0, and known to be 1.
+  constexpr std::optional<std::pair<KnownBits, KnownBits>>
+  split() const noexcept {
+    if (isBottom() || isConstant())
+      return std::nullopt;
+
+    const APInt<BW> unknown_bits = ~(zero() | one());
+    const APInt<BW> bit = APInt<BW>(1UL) << unknown_bits.countr_zero();
+    return std::pair{KnownBits({zero() | bit, one()}),
+                     KnownBits({zero(), one() | bit})};
+  }
+
   static constexpr KnownBits fromConcrete(const APInt<BW> &x) noexcept {
     return KnownBits({~x, x});
   }
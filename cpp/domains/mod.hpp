@@ -3,10 +3,12 @@
 #include <array>
 #include <cassert>
 #include <cstdint>
+#include <optional>
 #include <ostream>
 #include <random>
 #include <string>
 #include <string_view>
+#include <utility>
 #include <vector>
 
 #include "apint.hpp"
@@ -131,6 +133,16 @@ template <std::size_t X_> struct ModT {
       return std::log2(static_cast<double>(size())) / static_cast<double>(BW);
     }
 
+    // The lowest residue, and the others. A single residue does not split.
+    constexpr std::optional<std::pair<Mod, Mod>> split() const noexcept {
+      if (v[0].popcount() <= 1)
+        return std::nullopt;
+
+      APInt<X> lowest(0UL);
+      lowest.setBit(v[0].countr_zero());
+      return std::pair{Mod({lowest}), Mod({v[0] & ~lowest})};
+    }
+
     static constexpr Mod fromConcrete(const APInt<BW> &x) noexcept {
       APInt<X> a(0);
       a.setBit(static_cast<unsigned int>(x.urem(APInt<BW>(X)).getZExtValue()));
@@ -4,10 +4,12 @@
 #include <cassert>
 #include <cmath>
 #include <cstdint>
+#include <optional>
 #include <ostream>
 #include <random>
 #include <string>
 #include <string_view>
+#include <utility>
 #include <vector>
 
 #include "apint.hpp"
@@ -90,6 +92,17 @@ public:
     return std::log2(static_cast<double>(diff)) / static_cast<double>(BW);
   }
 
+  // The lower and the upper half of the range.
+  constexpr std::optional<std::pair<SConstRange, SConstRange>>
+  split() const noexcept {
+    if (isBottom() || lower() == upper())
+      return std::nullopt;
+
+    const BV mid = lower() + BV((upper() - lower()).getZExtValue() / 2);
+    return std::pair{SConstRange({lower(), mid}),
+                     SConstRange({mid + 1UL, upper()})};
+  }
+
   static constexpr SConstRange fromConcrete(const APInt<BW> &x) noexcept {
     return SConstRange({x, x});
   }
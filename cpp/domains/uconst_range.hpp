@@ -3,10 +3,12 @@
 #include <array>
 #include <cassert>
 #include <cstdint>
+#include <optional>
 #include <ostream>
 #include <random>
 #include <string>
 #include <string_view>
+#include <utility>
 #include <vector>
 
 #include "apint.hpp"
@@ -89,6 +91,17 @@ public:
     return std::log2(static_cast<double>(diff)) / static_cast<double>(BW);
   }
 
+  // The lower and the upper half of the range.
+  constexpr std::optional<std::pair<UConstRange, UConstRange>>
+  split() const noexcept {
+    if (isBottom() || lower() == upper())
+      return std::nullopt;
+
+    const BV mid = lower() + BV((upper() - lower()).getZExtValue() / 2);
+    return std::pair{UConstRange({lower(), mid}),
+                     UConstRange({mid + 1UL, upper()})};
+  }
+
   static constexpr UConstRange fromConcrete(const APInt<BW> &x) noexcept {
     return UConstRange({x, x});
   }
@@ -9,8 +9,10 @@ from setproctitle import setproctitle
 import yaml
 
 from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.enum_bin import EnumBin, read_enum_dataset
 from synth_xfer._util.log import init_logging
 from synth_xfer._util.pattern_dsl import PatternDag
+from synth_xfer._util.shared_lattice import SharedLattices
 from synth_xfer._util.tsv import EnumData
 from synth_xfer.cli.args import get_sampler
 from synth_xfer.cli.sxf import run
@@ -114,7 +116,8 @@ def _execute_job(
     args: Namespace,
     output_folder: Path,
     allow_existing: bool,
-    eval_data: EnumData | None = None,
+    eval_data: EnumData | EnumBin | None = None,
+    lattices: SharedLattices | None = None,
 ) -> dict[str, Any]:
     sampler = get_sampler(args)
     print(f"Running {bench.domain} {bench.op}")
@@ -156,6 +159,15 @@ def _execute_job(
             sampler=sampler,
             solver=args.solver,
             eval_data=eval_data,
+            eval_threads=args.eval_threads,
+            fused_eval=args.fused_eval,
+            staged_eval=args.staged_eval,
+            mcmc_procs=args.mcmc_procs,
+            verify_procs=args.verify_procs,
+            fuzz_verify=args.fuzz_verify,
+            verify_cache=args.verify_cache,
+            portfolio=args.portfolio,
+            lattices=lattices,
         )
 
         return {
@@ -188,6 +200,14 @@ def _execute_job(
         }
 
 
+_LATTICES: SharedLattices | None = None
+
+
+def _init_benchmark_worker(lattices: SharedLattices) -> None:
+    global _LATTICES
+    _LATTICES = lattices
+
+
 def _execute_benchmark_job(x: tuple[BenchmarkInput, Namespace]) -> dict[str, Any]:
     bench, args = x
     assert args.output is not None
@@ -201,16 +221,16 @@ def _execute_benchmark_job(x: tuple[BenchmarkInput, Namespace]) -> dict[str, Any
             args,
             args.output / f"{bench.domain}_{bench.op}",
             allow_existing=False,
+            lattices=_LATTICES,
         )
     finally:
         setproctitle("sxf:idle")
 
 
 def run_single_synth(args: Namespace) -> None:
-    eval_data: EnumData | None = None
+    eval_data: EnumData | EnumBin | None = None
     if args.input is not None:
-        with args.input.open("r", encoding="utf-8") as f:
-            eval_data = EnumData.read_tsv(f)
+        eval_data = read_enum_dataset(args.input)
         domain = eval_data.metadata.domain
         op = eval_data.metadata.op
         lbw = eval_data.metadata.lbw
@@ -260,8 +280,10 @@ def run_benchmark(args: Namespace) -> None:
     _prepare_output_dir(args.output, allow_existing=False)
     _validate_unique_output_folders(benchmark, args.output)
 
-    with Pool() as p:
-        data = p.map(_execute_benchmark_job, [(bench, args) for bench in benchmark])
+    # the low bitwidth lattices are shared by the jobs with the same domain and arity
+    with SharedLattices() as lattices:
+        with Pool(initializer=_init_benchmark_worker, initargs=(lattices,)) as p:
+            data = p.map(_execute_benchmark_job, [(bench, args) for bench in benchmark])
 
     with open(args.output.joinpath("data.json"), "w") as f:
         dump(data, f, indent=2)
@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+import mmap
+from pathlib import Path
+import struct
+from typing import BinaryIO
+
+import pandas as pd
+
+from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.eval import Columns, columns_from_buffer, enum_to_file, to_columns
+from synth_xfer._util.parse_mlir import HelperFuncs
+from synth_xfer._util.pattern_dsl import PatternDag
+from synth_xfer._util.random import Sampler
+from synth_xfer._util.tsv import EnumData, EnumMetaData, enum_metadata
+from synth_xfer._util.xfer_data import enumdata_to_eval_inputs
+
+# A binary dataset is, in native byte order (little-endian on every supported
+# host), with all integers uint64:
+#  - MAGIC, the length of the YAML metadata (`EnumMetaData.dump`), the metadata,
+#    and zeros up to a multiple of 8 bytes
+#  - one section per bw, in increasing order: bw, the number of rows, and the
+#    columns of the rows in the layout of `Columns.write` (every field of every
+#    argument, then every field of the ideal, each one a column of packed values)
+MAGIC = b"SXFENUM1"
+_WORD = struct.Struct("=Q")
+_SECTION = struct.Struct("=QQ")
+
+
+def _write_header(f: BinaryIO, metadata: EnumMetaData) -> None:
+    text = metadata.dump().encode()
+    f.write(MAGIC)
+    f.write(_WORD.pack(len(text)))
+    f.write(text)
+    f.write(bytes(-len(text) % 8))
+
+
+def is_enum_bin(path: Path) -> bool:
+    with path.open("rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+@dataclass
+class EnumBin:
+    """
+    A dataset of `EnumData` with only `bw`, the arguments and the ideal, held as the
+    `Columns` the eval engine evaluates, one per bw. `read` maps the file and
+    evaluates it in place, so loading one costs no parsing and no copy.
+
+    Converting from and to `EnumData` is lossless for the values the eval engine
+    prints, which all datasets written by `enum` and `pattern` are made of.
+    """
+
+    metadata: EnumMetaData
+    columns: dict[int, Columns]
+
+    @classmethod
+    def read(cls, path: Path) -> "EnumBin":
+        with path.open("rb") as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        if view[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a binary enum dataset")
+        (text_len,) = _WORD.unpack_from(view, len(MAGIC))
+        pos = len(MAGIC) + _WORD.size
+        metadata = EnumMetaData.parse(bytes(view[pos : pos + text_len]).decode())
+        pos += text_len + -text_len % 8
+
+        columns: dict[int, Columns] = {}
+        while pos < len(view):
+            bw, num_rows = _SECTION.unpack_from(view, pos)
+            pos += _SECTION.size
+            cols = columns_from_buffer(
+                metadata.domain, bw, metadata.arity, view[pos:], num_rows
+            )
+            columns[bw] = cols
+            pos += cols.nbytes
+
+        return cls(metadata, columns)
+
+    def write(self, path: Path) -> None:
+        with path.open("wb") as f:
+            _write_header(f, self.metadata)
+            for bw, cols in sorted(self.columns.items()):
+                buf = bytearray(cols.nbytes)
+                cols.write(buf)
+                f.write(_SECTION.pack(bw, len(cols)))
+                f.write(buf)
+
+    @classmethod
+    def from_enum_data(cls, data: EnumData) -> "EnumBin":
+        cols = ["bw"] + [f"arg_{i}" for i in range(data.metadata.arity)] + ["ideal"]
+        if list(data.enumdata.columns) != cols:
+            raise ValueError(
+                f"binary datasets only hold the columns {cols}, "
+                f"got {list(data.enumdata.columns)}"
+            )
+
+        return cls(
+            data.metadata,
+            {int(bw): to_columns(x) for bw, x in enumdata_to_eval_inputs(data).items()},
+        )
+
+    def to_enum_data(self) -> EnumData:
+        rows = []
+        for bw, cols in sorted(self.columns.items()):
+            for fn_args, ideal in cols.to_eval():
+                rows.append((bw, *map(str, fn_args), str(ideal)))
+
+        arity = self.metadata.arity
+        cols = ["bw"] + [f"arg_{i}" for i in range(arity)] + ["ideal"]
+        return EnumData(self.metadata, pd.DataFrame.from_records(rows, columns=cols))
+
+
+def read_enum_dataset(path: Path) -> EnumData | EnumBin:
+    "The dataset at `path`, binary or TSV."
+
+    if is_enum_bin(path):
+        return EnumBin.read(path)
+    with path.open("r", encoding="utf-8") as f:
+        return EnumData.read_tsv(f)
+
+
+def write_enum_bin(
+    path: Path,
+    domain: AbstractDomain,
+    op: PatternDag,
+    lbw: list[int],
+    mbw: list[tuple[int, int]],
+    hbw: list[tuple[int, int, int]],
+    seed: int | None,
+    sampler: Sampler,
+) -> EnumMetaData:
+    """
+    Write the file `EnumBin.from_enum_data(build_enum_data(...)).write(path)`
+    would, streamed from the eval engine like `write_enum_tsv`.
+    """
+
+    helpers = HelperFuncs(op, domain)
+    metadata = enum_metadata(domain, op, helpers, lbw, mbw, hbw, seed)
+    assert metadata.seed is not None
+
+    with path.open("wb") as f:
+        _write_header(f, metadata)
+
+    enum_to_file(path, lbw, mbw, hbw, metadata.seed, helpers, sampler, binary=True)
+
+    return metadata
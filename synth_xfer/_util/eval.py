@@ -1,7 +1,9 @@
 from collections.abc import Iterator
 from ctypes import CFUNCTYPE, c_bool, c_int64
+from pathlib import Path
 from typing import Callable, Protocol, TypeAlias, cast, runtime_checkable
 
+from llvmlite import ir
 from xdsl.parser import IntegerType, ModuleOp
 from xdsl_smt.dialects.transfer import TransIntegerType
 
@@ -9,9 +11,11 @@ from synth_xfer import _eval_engine
 from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.eval_result import CaseExample, EvalResult, PerBitRes
 from synth_xfer._util.jit import FnPtr, Jit
+from synth_xfer._util.jit_session import JitSession
 from synth_xfer._util.lower import LowerToLLVM
-from synth_xfer._util.parse_mlir import HelperFuncs
+from synth_xfer._util.parse_mlir import HelperFuncs, top_as_xfer
 from synth_xfer._util.random import Sampler
+from synth_xfer._util.xfer_func import XferFunc
 
 
 @runtime_checkable
@@ -41,18 +45,55 @@ class ToEval(Protocol):
     def __iter__(self) -> Iterator["ToEval.EvalRow"]: ...
 
 
+@runtime_checkable
+class Columns(Protocol):
+    "Column-major copy of a ToEval or ArgsVec, read by the batched transformer shims."
+
+    def __len__(self) -> int: ...
+    def every(self, step: int) -> "Columns": ...
+    @property
+    def args_nbytes(self) -> int: ...
+    @property
+    def nbytes(self) -> int: ...
+    def write_args(self, buf: memoryview) -> None: ...
+    def write(self, buf: memoryview | bytearray) -> None: ...
+    def share_args(self, buf: memoryview) -> "Columns": ...
+    def to_eval(self) -> ToEval: ...
+
+
 @runtime_checkable
 class Results(Protocol):
     ExampleTuple: TypeAlias = tuple[tuple[str, ...], str, str, float]
 
+    @property
+    def bw(self) -> int: ...
+    @property
+    def num_cases(self) -> int: ...
+    @property
+    def num_unsolved(self) -> int: ...
+    @property
+    def base_distance(self) -> float: ...
+    @property
+    def sound(self) -> list[int]: ...
+    @property
+    def distance(self) -> list[float]: ...
+    @property
+    def exact(self) -> list[int]: ...
+    @property
+    def unsolved_exact(self) -> list[int]: ...
+    @property
+    def sound_distance(self) -> list[float]: ...
+
     def __str__(self) -> str: ...
     def get_unsound_examples(self) -> list[list["Results.ExampleTuple"]]: ...
     def get_imprecise_examples(self) -> list[list["Results.ExampleTuple"]]: ...
 
 
-EvalInput: TypeAlias = tuple[ToEval, list[FnPtr], list[FnPtr]]
+EvalInput: TypeAlias = tuple[ToEval | Columns, list[FnPtr], list[FnPtr]]
 EvalInputMap: TypeAlias = dict[int, EvalInput]
-RunInputMap: TypeAlias = dict[int, ArgsVec]
+FusedEvalInput: TypeAlias = tuple[Columns, FnPtr, int]
+FusedEvalInputMap: TypeAlias = dict[int, FusedEvalInput]
+RunInputMap: TypeAlias = dict[int, ArgsVec | Columns]
 RunOutputs: TypeAlias = list[list[AbstractValue]]
 
 
@@ -73,59 +114,59 @@ def _get_ee_fn_dyn(fn_name: str) -> Callable:
 
 
 def _get_run_transformer_fn(
-    domain: AbstractDomain, bw: int, input_args: ArgsVec
-) -> Callable[[ArgsVec, int], list[AbstractValue]]:
-    def _run_transformer_engine_name(domain: AbstractDomain, bw: int, arity: int) -> str:
-        fn_name = f"run_transformer_{str(domain).lower()}"
-        for _ in range(arity + 1):
-            fn_name += f"_{bw}"
-        return fn_name
+    input_cols: Columns,
+) -> Callable[[Columns, int], list[AbstractValue]]:
+    cls_name = input_cols.__class__.__name__.lower()
 
     return cast(
-        Callable[[ArgsVec, int], list[AbstractValue]],
-        _get_ee_fn_dyn(_run_transformer_engine_name(domain, bw, len(input_args[0]))),
+        Callable[[Columns, int], list[AbstractValue]],
+        _get_ee_fn_dyn(f"run_transformer_batched_{cls_name[7:]}"),
     )
 
 
 def _get_eval_fn(
-    to_eval: ToEval,
-) -> Callable[[ToEval, list[int], list[int], int, int], Results]:
-    def _eval_engine_name(to_eval: ToEval) -> str:
-        suffix = to_eval.__class__.__name__.lower()[6:]
-        return f"eval_{suffix}"
+    to_eval: ToEval | Columns,
+) -> Callable[[ToEval | Columns, list[int], list[int], int, int], Results]:
+    def _eval_engine_name(to_eval: ToEval | Columns) -> str:
+        cls_name = to_eval.__class__.__name__.lower()
+        if cls_name.startswith("columns"):
+            return f"eval_batched_{cls_name[7:]}"
+        return f"eval_{cls_name[6:]}"
 
     return cast(
-        Callable[[ToEval, list[int], list[int], int, int], Results],
+        Callable[[ToEval | Columns, list[int], list[int], int, int], Results],
         _get_ee_fn_dyn(_eval_engine_name(to_eval)),
     )
 
 
-def get_per_bit(a: Results) -> list[PerBitRes]:
-    x = str(a).split("\n")
-
-    def get[T](in_str: str, to_match: str, parser: Callable[[str], T]) -> T:
-        og_str, to_parse = in_str.split(":")
-
-        assert og_str.strip() == to_match
+def to_columns(x: ToEval | ArgsVec) -> Columns:
+    """
+    Copy a dataset into the column layout of the batched transformer shims
+    (see `LowerToLLVM.shim_xfer_batched`). Build it once and reuse it, the copy
+    costs about as much as one eval.
+    """
 
-        return parser(to_parse)
+    cls_name = x.__class__.__name__
+    if cls_name.startswith("ToEval"):
+        suffix = cls_name[6:]
+    else:
+        assert cls_name.startswith("Args")
+        domain, *bws = cls_name[4:].split("_")
+        suffix = "_".join([domain, bws[0], *bws])
 
-    def get_ints(s: str) -> list[int]:
-        return eval(s)
+    return _get_ee_fn_dyn(f"Columns{suffix}")(x)
 
-    def get_floats(s: str) -> list[float]:
-        return eval(s)
-
-    bw = get(x[0], "bw", int)
-    num_cases = get(x[1], "num cases", int)
-    num_unsolved_cases = get(x[2], "num unsolved", int)
-    base_distance = get(x[3], "base distance", float)
-    sound = get(x[4], "num sound", get_ints)
-    distance = get(x[5], "distance", get_floats)
-    exact = get(x[6], "num exact", get_ints)
-    num_unsolved_exact_cases = get(x[7], "num unsolved exact", get_ints)
-    sound_distance = get(x[8], "sound distance", get_floats)
 
+def get_per_bit(a: Results) -> list[PerBitRes]:
+    # integral distances are kept as ints, as they were parsed from the text output
+    def get_dists(xs: list[float]) -> list[float]:
+        return [int(x) if x.is_integer() else x for x in xs]
+
+    sound = a.sound
+    distance = get_dists(a.distance)
+    exact = a.exact
+    unsolved_exact = a.unsolved_exact
+    sound_distance = get_dists(a.sound_distance)
     unsound_examples = a.get_unsound_examples()
     imprecise_examples = a.get_imprecise_examples()
 
@@ -134,7 +175,7 @@ def get_per_bit(a: Results) -> list[PerBitRes]:
         len(sound)
         == len(distance)
         == len(exact)
-        == len(num_unsolved_exact_cases)
+        == len(unsolved_exact)
         == len(sound_distance)
         == len(unsound_examples)
         == len(imprecise_examples)
@@ -142,15 +183,15 @@ def get_per_bit(a: Results) -> list[PerBitRes]:
 
     return [
         PerBitRes(
-            all_cases=num_cases,
+            all_cases=a.num_cases,
             sounds=sound[i],
             exacts=exact[i],
             dist=distance[i],
-            unsolved_cases=num_unsolved_cases,
-            unsolved_exacts=num_unsolved_exact_cases[i],
-            base_dist=base_distance,
+            unsolved_cases=a.num_unsolved,
+            unsolved_exacts=unsolved_exact[i],
+            base_dist=a.base_distance,
             sound_dist=sound_distance[i],
-            bitwidth=bw,
+            bitwidth=a.bw,
             unsound_examples=[CaseExample(*ex) for ex in unsound_examples[i]],
             imprecise_examples=[CaseExample(*ex) for ex in imprecise_examples[i]],
         )
@@ -158,16 +199,26 @@ def get_per_bit(a: Results) -> list[PerBitRes]:
     ]
 
 
-def enum(
-    lbw: list[int],
-    mbw: list[tuple[int, int]],
-    hbw: list[tuple[int, int, int]],
-    seed: int,
-    helper_funcs: HelperFuncs,
-    sampler: Sampler,
-) -> dict[int, ToEval]:
-    all_bws = list(set(lbw + [x[0] for x in mbw] + [x[0] for x in hbw]))
-    lowerer = LowerToLLVM(all_bws)
+def columns_suffix(helper_funcs: HelperFuncs, bw: int) -> str:
+    "The domain and bitwidths the `Columns` class of the rows at `bw` is named after."
+
+    def get_bw(x: TransIntegerType | IntegerType):
+        return bw if isinstance(x, TransIntegerType) else x.width.data
+
+    ret_bw = get_bw(helper_funcs.conc_ret_ty)
+    arg_bws = [str(get_bw(x)) for x in helper_funcs.conc_arg_ty]
+
+    return "_".join([str(helper_funcs.domain), str(ret_bw), *arg_bws])
+
+
+def _enum_fn(helper_funcs: HelperFuncs, prefix: str, bw: int) -> Callable:
+    return _get_ee_fn_dyn(f"{prefix}_{columns_suffix(helper_funcs, bw).lower()}")
+
+
+def _lower_concrete_op(
+    helper_funcs: HelperFuncs, bws: list[int]
+) -> tuple[LowerToLLVM, dict[int, ir.Function], dict[int, ir.Function] | None]:
+    lowerer = LowerToLLVM(list(set(bws)))
     crt = lowerer.add_fn(helper_funcs.crt_func, shim=True)
     op_constraint = (
         lowerer.add_fn(helper_funcs.op_constraint_func, shim=True)
@@ -175,52 +226,144 @@ def enum(
         else None
     )
 
-    def get_bw(x: TransIntegerType | IntegerType, bw: int):
-        return bw if isinstance(x, TransIntegerType) else x.width.data
+    return lowerer, crt, op_constraint
 
-    def get_enum_f(level: str, bw: int) -> Callable:
-        domain_str = str(helper_funcs.domain).lower()
-        ret_bw = get_bw(helper_funcs.conc_ret_ty, bw)
-        arg_bws = [str(get_bw(x, bw)) for x in helper_funcs.conc_arg_ty]
-        arg_str = "_".join(arg_bws)
-        func_name = f"enum_{level}_{domain_str}_{ret_bw}_{arg_str}"
 
-        return _get_ee_fn_dyn(func_name)
+def enum(
+    lbw: list[int],
+    mbw: list[tuple[int, int]],
+    hbw: list[tuple[int, int, int]],
+    seed: int,
+    helper_funcs: HelperFuncs,
+    sampler: Sampler,
+) -> dict[int, ToEval]:
+    all_bws = lbw + [x[0] for x in mbw] + [x[0] for x in hbw]
+    lowerer, crt, op_constraint = _lower_concrete_op(helper_funcs, all_bws)
 
     with Jit() as jit:
         jit.add_mod(lowerer)
-        low_to_evals: dict[int, ToEval] = {
-            bw: get_enum_f("low", bw)(
+
+        def addrs(bw: int) -> tuple[int, int | None]:
+            return (
                 jit.get_fn_ptr(crt[bw].name).addr,
                 jit.get_fn_ptr(op_constraint[bw].name).addr if op_constraint else None,
             )
-            for bw in lbw
+
+        low_to_evals: dict[int, ToEval] = {
+            bw: _enum_fn(helper_funcs, "enum_low", bw)(*addrs(bw)) for bw in lbw
         }
 
         mid_to_evals: dict[int, ToEval] = {
-            bw: get_enum_f("mid", bw)(
-                jit.get_fn_ptr(crt[bw].name).addr,
-                jit.get_fn_ptr(op_constraint[bw].name).addr if op_constraint else None,
-                samples,
-                seed,
-                sampler.sampler,
+            bw: _enum_fn(helper_funcs, "enum_mid", bw)(
+                *addrs(bw), samples, seed, sampler.sampler
             )
             for bw, samples in mbw
         }
 
         high_to_evals: dict[int, ToEval] = {
-            bw: get_enum_f("high", bw)(
+            bw: _enum_fn(helper_funcs, "enum_high", bw)(
+                *addrs(bw), lat_samples, crt_samples, seed, sampler.sampler
+            )
+            for bw, lat_samples, crt_samples in hbw
+        }
+
+    return low_to_evals | mid_to_evals | high_to_evals
+
+
+def enum_edges(
+    bws: list[tuple[int, int]], seed: int, helper_funcs: HelperFuncs
+) -> dict[int, ToEval]:
+    """
+    Rows of every combination of edge arguments at each `(bw, crt_samples)` of
+    `bws`: top, the constants 0, 1, -1 and the signed extremes, and the joins of
+    every two of those (the extreme ranges of the range domains). Their expected
+    results are computed like the ones of the high bws of `enum`.
+    """
+
+    lowerer, crt, op_constraint = _lower_concrete_op(helper_funcs, [bw for bw, _ in bws])
+    with Jit() as jit:
+        jit.add_mod(lowerer)
+        return {
+            bw: _enum_fn(helper_funcs, "enum_edge", bw)(
                 jit.get_fn_ptr(crt[bw].name).addr,
                 jit.get_fn_ptr(op_constraint[bw].name).addr if op_constraint else None,
-                lat_samples,
                 crt_samples,
                 seed,
-                sampler.sampler,
             )
-            for bw, lat_samples, crt_samples in hbw
+            for bw, crt_samples in bws
         }
 
-    return low_to_evals | mid_to_evals | high_to_evals
+
+def enum_low_shared(
+    lattice_args: dict[int, memoryview], helper_funcs: HelperFuncs
+) -> dict[int, Columns]:
+    """
+    The columns of `enum` at every low bw of `lattice_args`, with their arguments
+    read from the lattice in its buffer (as written by `Columns.write_args`), so
+    only the expected results are computed, and the rows are never enumerated.
+    """
+
+    if not lattice_args:
+        return {}
+
+    lowerer, crt, op_constraint = _lower_concrete_op(helper_funcs, list(lattice_args))
+    with Jit() as jit:
+        jit.add_mod(lowerer)
+        return {
+            bw: _enum_fn(helper_funcs, "enum_low_shared", bw)(
+                jit.get_fn_ptr(crt[bw].name).addr,
+                jit.get_fn_ptr(op_constraint[bw].name).addr if op_constraint else None,
+                buf,
+            )
+            for bw, buf in lattice_args.items()
+        }
+
+
+def enum_to_file(
+    path: Path,
+    lbw: list[int],
+    mbw: list[tuple[int, int]],
+    hbw: list[tuple[int, int, int]],
+    seed: int,
+    helper_funcs: HelperFuncs,
+    sampler: Sampler,
+    binary: bool = False,
+) -> dict[int, int]:
+    """
+    Append the rows `enum` would make to the file at `path`, in increasing order of
+    bw: as TSV rows of `bw`, the arguments and the ideal, or if `binary` as one
+    section of columns per bw (see `enum_bin`). The rows are written by the eval
+    engine as they are generated, and never all held in memory at once.
+    Returns the number of rows written per bw.
+    """
+
+    # like `enum`, a bw given at several levels is only enumerated at the last one
+    levels: dict[int, tuple[str, tuple[int, ...]]] = (
+        {bw: ("enum_write_low", ()) for bw in lbw}
+        | {bw: ("enum_write_mid", (samples,)) for bw, samples in mbw}
+        | {bw: ("enum_write_high", (lat, crt)) for bw, lat, crt in hbw}
+    )
+    lowerer, crt, op_constraint = _lower_concrete_op(helper_funcs, list(levels))
+
+    num_rows: dict[int, int] = {}
+    with Jit() as jit:
+        jit.add_mod(lowerer)
+        for bw, (prefix, samples) in sorted(levels.items()):
+            crt_addr = jit.get_fn_ptr(crt[bw].name).addr
+            op_con_addr = (
+                jit.get_fn_ptr(op_constraint[bw].name).addr if op_constraint else None
+            )
+            sampling = (*samples, seed, sampler.sampler) if samples else ()
+            num_rows[bw] = _enum_fn(helper_funcs, prefix, bw)(
+                crt_addr, op_con_addr, *sampling, bw, str(path), binary
+            )
+
+    return num_rows
+
+
+def set_eval_threads(n: int) -> None:
+    "Number of threads the eval engine splits rows across, and enumerates them with (0 for all cores)."
+    _eval_engine.set_num_threads(n)
 
 
 def get_eval_res(
@@ -252,6 +395,62 @@ def eval_transfer_func(
     return get_eval_res(per_bits, low_and_med_bw)
 
 
+def eval_fused_transfer_func(
+    x: FusedEvalInputMap,
+    low_and_med_bw: set[int],
+    unsound_ex: int = 0,
+    imprecise_ex: int = 0,
+) -> list[EvalResult]:
+    "Like `eval_transfer_func`, for kernels from `JitSession.load_fused`."
+
+    per_bits = []
+    for cols, fused, num_xfers in x.values():
+        suffix = cols.__class__.__name__.lower()[7:]
+        eval_fn = _get_ee_fn_dyn(f"eval_fused_{suffix}")
+        result = eval_fn(cols, fused.addr, num_xfers, unsound_ex, imprecise_ex)
+        per_bits.append(get_per_bit(result))
+
+    return get_eval_res(per_bits, low_and_med_bw)
+
+
+def make_eval_fn(
+    to_eval: dict[int, Columns],
+    session: JitSession,
+    helper_funcs: HelperFuncs,
+    low_and_med_bw: set[int],
+) -> Callable[[list[XferFunc], list[XferFunc]], list[EvalResult]]:
+    "Evaluate candidates against base transformers on `to_eval`, compiling with `session`."
+
+    def helper(
+        xfer: list[XferFunc],
+        base: list[XferFunc],
+    ) -> list[EvalResult]:
+        if not xfer:
+            ret_top_func = XferFunc(top_as_xfer(helper_funcs.transfer_func))
+            ret_top_func.set_name("ret_top")
+            xfer = [ret_top_func]
+
+        if session.meet is not None:
+            with session.load_fused(xfer, base) as fused_fns:
+                fused_input: FusedEvalInputMap = {
+                    bw: (to_eval[bw], fused_fns[bw], len(xfer)) for bw in to_eval
+                }
+
+                return eval_fused_transfer_func(fused_input, low_and_med_bw)
+
+        with session.load(xfer, base) as (xfer_fns, base_fns):
+            input: EvalInputMap = {
+                bw: (to_eval[bw], xfer_fns.get(bw, []), base_fns.get(bw, []))
+                for bw in to_eval
+            }
+
+            results = eval_transfer_func(input, low_and_med_bw)
+
+        return results
+
+    return helper
+
+
 def parse_to_run_inputs(
     domain: AbstractDomain, bw: int, arity: int, inputs: list[tuple[str, ...]]
 ) -> ArgsVec:
@@ -264,6 +463,21 @@ def parse_to_run_inputs(
     return to_run_cls(inputs)
 
 
+def columns_from_buffer(
+    domain: AbstractDomain, bw: int, arity: int, buf: memoryview, num_rows: int
+) -> Columns:
+    """
+    The `num_rows` rows of columns written by `Columns.write` at the start of `buf`,
+    read in place: they are neither copied nor checked, and keep `buf` alive.
+    """
+
+    cls_name = f"Columns{domain}"
+    for _ in range(arity + 1):
+        cls_name += f"_{bw}"
+
+    return _get_ee_fn_dyn(cls_name).from_buffer(buf, num_rows)
+
+
 def parse_to_eval_inputs(
     domain: AbstractDomain, bw: int, arity: int, inputs: list[tuple[tuple[str, ...], str]]
 ) -> ToEval:
@@ -317,17 +531,20 @@ def run_xfer_fns(
     xfer_names: list[str],
 ) -> RunOutputs:
     lowerer = LowerToLLVM(list(to_eval.keys()))
-    lowerer.add_mod(mlir_mod, xfer_names)
+    lowerer.add_mod(mlir_mod, xfer_names, batched=True)
     outputs: RunOutputs = [[] for _ in xfer_names]
 
     with Jit() as jit:
         jit.add_mod(lowerer)
         for bw, input_args in to_eval.items():
-            run_fn = _get_run_transformer_fn(domain, bw, input_args)
+            input_cols = (
+                input_args if isinstance(input_args, Columns) else to_columns(input_args)
+            )
+            run_fn = _get_run_transformer_fn(input_cols)
 
             for i, xfer_name in enumerate(xfer_names):
-                fn_ptr = jit.get_fn_ptr(f"{xfer_name}_{bw}_shim")
-                outputs[i].extend(run_fn(input_args, fn_ptr.addr))
+                fn_ptr = jit.get_fn_ptr(f"{xfer_name}_{bw}_batch")
+                outputs[i].extend(run_fn(input_cols, fn_ptr.addr))
 
     return outputs
 
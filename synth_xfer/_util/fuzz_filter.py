@@ -0,0 +1,82 @@
+from synth_xfer._util.eval import Columns, enum, enum_edges, make_eval_fn, to_columns
+from synth_xfer._util.jit_session import JitSession
+from synth_xfer._util.parse_mlir import HelperFuncs
+from synth_xfer._util.random import Sampler
+from synth_xfer._util.xfer_func import XferFunc
+
+
+class FuzzFilter:
+    """
+    Screens candidates for soundness before they are verified, by evaluating them
+    on rows sampled like genHighs does at every verify bitwidth: random abstract
+    arguments, each with the join of the concrete results of random concrete
+    arguments as its expected result, plus the rows of `enum_edges` (top, constants
+    and extreme ranges), which random samples rarely hit. That join only holds
+    results the op really produces, so a candidate that does not contain it on some
+    row is unsound, and is rejected without calling a solver. Passing proves
+    nothing, the candidates that pass still get verified.
+
+    Bitwidths the eval engine was not compiled for are not screened, they are in
+    `skipped`, and candidates go to the verifier unscreened there.
+    """
+
+    bws: list[int]
+    skipped: list[int]
+    num_checked: int
+    num_rejected: int
+
+    def __init__(
+        self,
+        helper_funcs: HelperFuncs,
+        vbw: list[int],
+        lat_samples: int,
+        crt_samples: int,
+        seed: int,
+        sampler: Sampler,
+    ):
+        to_eval: dict[int, Columns] = {}
+        for bw in vbw:
+            try:
+                rows = enum(
+                    [], [], [(bw, lat_samples, crt_samples)], seed, helper_funcs, sampler
+                )[bw]
+                rows.extend(enum_edges([(bw, crt_samples)], seed, helper_funcs)[bw])
+            except ImportError:
+                continue
+            to_eval[bw] = to_columns(rows)
+
+        self.bws = sorted(to_eval)
+        self.skipped = sorted(set(vbw) - to_eval.keys())
+        self.num_checked = 0
+        self.num_rejected = 0
+        self._session = JitSession(self.bws, [helper_funcs.get_top_func], batched=True)
+        # all bitwidths count as high ones, none of them is enumerated exhaustively
+        self._eval_fn = make_eval_fn(to_eval, self._session, helper_funcs, set())
+
+    def __enter__(self) -> "FuzzFilter":
+        return self
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._session.close()
+
+    def reset_stats(self) -> None:
+        self.num_checked = 0
+        self.num_rejected = 0
+
+    def unsound_bw(self, candidate: XferFunc) -> int | None:
+        "The lowest bitwidth `candidate` was found unsound at, None if it passes."
+
+        self.num_checked += 1
+        if not self.bws:
+            return None
+
+        result = self._eval_fn([candidate], [])[0]
+        for res in result.per_bit_res:
+            if res.sounds < res.all_cases:
+                self.num_rejected += 1
+                return res.bitwidth
+
+        return None
@@ -45,6 +45,9 @@ class Jit:
         return self
 
     def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def close(self) -> None:
         if self._closed:
             return
         for mod in self.mods:
@@ -67,6 +70,12 @@ class Jit:
 
         return mod
 
+    def remove_mod(self, mod: llvm.ModuleRef) -> None:
+        if self._closed:
+            raise RuntimeError("Jit is closed")
+        self.engine.remove_module(mod)
+        self.mods.remove(mod)
+
     def _create_mod(self, llvm_ir: str) -> llvm.ModuleRef:
         if self._closed:
             raise RuntimeError("Jit is closed")
@@ -80,7 +89,12 @@ class Jit:
     def _run_passes(self, mod: llvm.ModuleRef):
         if self._closed:
             raise RuntimeError("Jit is closed")
-        pb = llvm.PassBuilder(self.tm, llvm.PipelineTuningOptions())
+        # the default O2 module pipeline, which inlines the transformers into the
+        # column loops of the batched shims, and vectorizes and unrolls those loops
+        pto = llvm.PipelineTuningOptions(speed_level=2)
+        pto.loop_vectorization = True
+        pto.loop_unrolling = True
+        pb = llvm.PassBuilder(self.tm, pto)
         mpm = pb.getModulePassManager()
         mpm.add_instruction_combine_pass()
         mpm.add_simplify_cfg_pass()
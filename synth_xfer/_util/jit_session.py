@@ -0,0 +1,239 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import partial
+
+from llvmlite import ir
+from xdsl.dialects.func import FuncOp
+
+from synth_xfer._util.jit import FnPtr, Jit
+from synth_xfer._util.lower import LowerToLLVM
+from synth_xfer._util.xfer_func import XferFunc
+
+FnPtrs = dict[int, list[FnPtr]]
+
+
+class JitSession:
+    """
+    A long lived JIT for evaluating many transformer sets against the same helpers.
+
+    The helper functions are compiled once, and every transformer is compiled at
+    most once per engine: compiled shims are cached by the structural hash of the
+    transformer, so solutions, rejected proposals that come back, and programs
+    duplicated across samplers are all free after their first `load`. Each `load`
+    compiles its cache misses into one new module, whose definitions get their own
+    symbol suffix so different programs with the same name never clash. MCJIT never
+    frees the code of a module, so the engine (and with it the cache) is rebuilt
+    once `max_cached` transformers have been compiled.
+
+    With `batched` the cached pointers are the batched shims (taking columns and a
+    row count) instead of the per row ones, for use with `Columns` inputs.
+
+    Given the `meet` and `top` of the domain, `load_fused` instead compiles a whole
+    transformer set into a single kernel for `eval_fused_transfer_func`. Since an
+    MCMC step changes one transformer of the set, the unshimmed transformers are
+    cached on their own, and a new kernel only compiles its cache misses and calls
+    the cached ones across modules (where they cannot be inlined). Kernels are
+    also cached by the hashes of all their transformers, for sets that come back.
+    The hit and miss counts are per transformer, as for `load`.
+    """
+
+    bws: list[int]
+    max_cached: int
+    batched: bool
+    meet: FuncOp | None
+    top: FuncOp | None
+    jit: Jit
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        bws: list[int],
+        helpers: list[FuncOp],
+        max_cached: int = 8192,
+        batched: bool = False,
+        meet: FuncOp | None = None,
+        top: FuncOp | None = None,
+    ):
+        self.bws = bws
+        self.max_cached = max_cached
+        self.batched = batched
+        self.meet = meet
+        self.top = top
+        self.hits = 0
+        self.misses = 0
+
+        lowerer = LowerToLLVM(bws, name="helpers")
+        for fn in helpers:
+            lowerer.add_fn(fn)
+        self._helpers_ir = str(lowerer)
+
+        self._num_mods = 0
+        self._num_compiled = 0
+        self._cache: dict[str, dict[int, FnPtr]] = {}
+        self._fused_fns: dict[str, dict[int, tuple[str, ir.FunctionType]]] = {}
+        self.jit = self._new_jit()
+
+    def __enter__(self) -> "JitSession":
+        return self
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.jit.close()
+        self._cache.clear()
+        self._fused_fns.clear()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def _new_jit(self) -> Jit:
+        jit = Jit()
+        jit.add_mod(self._helpers_ir)
+
+        return jit
+
+    def _reserve(self, n: int) -> None:
+        "Rebuild the engine if compiling `n` more transformers would exceed the cap."
+
+        if self._num_compiled + n > self.max_cached:
+            self.jit.close()
+            self._cache.clear()
+            self._fused_fns.clear()
+            self._num_compiled = 0
+            self.jit = self._new_jit()
+
+    def _new_lowerer(self) -> tuple[LowerToLLVM, str]:
+        self._num_mods += 1
+        suffix = f"m{self._num_mods}"
+
+        return LowerToLLVM(self.bws, name=suffix), suffix
+
+    def _add_mod(self, lowerer: LowerToLLVM, suffix: str) -> None:
+        for fn in lowerer.fns.values():
+            if not fn.is_declaration:
+                fn.name = f"{fn.name}.{suffix}"
+
+        self.jit.add_mod(lowerer)
+
+    def _compile(self, fns: dict[str, XferFunc]) -> None:
+        lowerer, suffix = self._new_lowerer()
+        add_fn = partial(lowerer.add_fn, batched=self.batched)
+        names = {key: fc.lower(add_fn) for key, fc in fns.items()}
+
+        self._add_mod(lowerer, suffix)
+        self._num_compiled += len(fns)
+        for key, bw_names in names.items():
+            self._cache[key] = {
+                bw: self.jit.get_fn_ptr(f"{name}.{suffix}")
+                for bw, name in bw_names.items()
+            }
+
+    def _compile_fused(
+        self,
+        key: str,
+        xfer: list[tuple[str, XferFunc]],
+        base: list[tuple[str, XferFunc]],
+    ) -> None:
+        assert self.meet is not None and self.top is not None
+
+        lowerer, suffix = self._new_lowerer()
+        meet = lowerer.add_fn(self.meet)
+        top = lowerer.add_fn(self.top)
+
+        # only the unshimmed transformers are needed, the new ones get inlined in the
+        # kernel and the cached ones are declared and linked from their own modules
+        def add_fn(fn: FuncOp, shim: bool = False) -> dict[int, ir.Function]:
+            return lowerer.add_fn(fn)
+
+        fns: dict[str, dict[int, ir.Function]] = {}
+        new: list[str] = []
+        for fc_key, fc in xfer + base:
+            if fc_key in fns:
+                self.hits += 1
+            elif fc_key in self._fused_fns:
+                self.hits += 1
+                fns[fc_key] = {
+                    bw: ir.Function(lowerer.llvm_mod, fn_ty, name=sym)
+                    for bw, (sym, fn_ty) in self._fused_fns[fc_key].items()
+                }
+            else:
+                self.misses += 1
+                names = fc.lower(add_fn)
+                fns[fc_key] = {bw: lowerer.fns[name] for bw, name in names.items()}
+                new.append(fc_key)
+
+        sig = (xfer + base)[0][1].body
+        kernels = {
+            bw: lowerer.shim_fused(
+                suffix,
+                sig,
+                [fns[k][bw] for k, _ in xfer],
+                [fns[k][bw] for k, _ in base],
+                meet[bw],
+                top[bw],
+                bw,
+            ).name
+            for bw in self.bws
+        }
+
+        self._add_mod(lowerer, suffix)
+        self._num_compiled += len(new)
+        for fc_key in new:
+            self._fused_fns[fc_key] = {
+                bw: (fn.name, fn.function_type) for bw, fn in fns[fc_key].items()
+            }
+        self._cache[key] = {
+            bw: self.jit.get_fn_ptr(f"{name}.{suffix}") for bw, name in kernels.items()
+        }
+
+    @contextmanager
+    def load(
+        self, xfer: list[XferFunc], base: list[XferFunc]
+    ) -> Iterator[tuple[FnPtrs, FnPtrs]]:
+        "Compile `xfer` and `base`, yielding the shim pointers of both per bitwidth."
+
+        xfer_keys = [fc.structural_hash() for fc in xfer]
+        base_keys = [fc.structural_hash() for fc in base]
+        keys = xfer_keys + base_keys
+
+        self._reserve(len(keys))
+
+        misses: dict[str, XferFunc] = {}
+        for key, fc in zip(keys, xfer + base):
+            if key in self._cache or key in misses:
+                self.hits += 1
+            else:
+                self.misses += 1
+                misses[key] = fc
+
+        if misses:
+            self._compile(misses)
+
+        def ptrs(keys: list[str]) -> FnPtrs:
+            return {bw: [self._cache[key][bw] for key in keys] for bw in self.bws}
+
+        yield ptrs(xfer_keys), ptrs(base_keys)
+
+    @contextmanager
+    def load_fused(
+        self, xfer: list[XferFunc], base: list[XferFunc]
+    ) -> Iterator[dict[int, FnPtr]]:
+        "Compile `xfer` and `base` into one fused kernel, yielding it per bitwidth."
+
+        if self.meet is None or self.top is None:
+            raise ValueError("JitSession needs the meet and top of the domain to fuse")
+
+        xfer_keys = [(fc.structural_hash(), fc) for fc in xfer]
+        base_keys = [(fc.structural_hash(), fc) for fc in base]
+        key = "|".join(k for k, _ in xfer_keys) + "#" + "|".join(k for k, _ in base_keys)
+
+        if key in self._cache:
+            self.hits += len(xfer) + len(base)
+        else:
+            self._reserve(len(xfer) + len(base))
+            self._compile_fused(key, xfer_keys, base_keys)
+
+        yield self._cache[key]
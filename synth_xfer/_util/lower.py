@@ -1,5 +1,5 @@
 from functools import singledispatchmethod
-from typing import Protocol
+from typing import Callable, Protocol
 
 from llvmlite import ir
 from xdsl.dialects.arith import AndIOp, ConstantOp, OrIOp, XOrIOp
@@ -134,7 +134,9 @@ class LowerToLLVM:
 
         return one_ret_val and ret_is_abst and abst_args
 
-    def add_fn(self, mlir_fn: FuncOp, shim: bool = False) -> dict[int, ir.Function]:
+    def add_fn(
+        self, mlir_fn: FuncOp, shim: bool = False, batched: bool = False
+    ) -> dict[int, ir.Function]:
         bw_fns: dict[int, ir.Function] = {}
 
         for bw in self.bws:
@@ -154,7 +156,11 @@ class LowerToLLVM:
                 mlir_fn, llvm_fn, self.llvm_mod, self.fns, bw
             ).llvm_fn
 
-            if shim:
+            if shim and batched:
+                batch_fn = self.shim_xfer_batched(mlir_fn, self.fns[bw_fn_name], bw)
+                self.fns[f"{bw_fn_name}_batch"] = batch_fn
+                bw_fns[bw] = batch_fn
+            elif shim:
                 shimmed_fn = self.shim(mlir_fn, self.fns[bw_fn_name], bw)
                 self.fns[f"{bw_fn_name}_shim"] = shimmed_fn
                 bw_fns[bw] = shimmed_fn
@@ -163,7 +169,9 @@ class LowerToLLVM:
 
         return bw_fns
 
-    def add_mod(self, mod: ModuleOp, to_shim: list[str] = []) -> dict[str, ir.Function]:
+    def add_mod(
+        self, mod: ModuleOp, to_shim: list[str] = [], batched: bool = False
+    ) -> dict[str, ir.Function]:
         fns: dict[str, ir.Function] = {}
 
         for mlir_func in mod.ops:
@@ -173,7 +181,10 @@ class LowerToLLVM:
             fs = self.add_fn(mlir_func, shim=False)
             for bw, f in fs.items():
                 fns[f.name] = f
-                if shim:
+                if shim and batched:
+                    shimmed = self.shim_xfer_batched(mlir_func, f, bw)
+                    fns[shimmed.name] = shimmed
+                elif shim:
                     shimmed = self.shim(mlir_func, f, bw)
                     fns[shimmed.name] = shimmed
 
@@ -298,6 +309,137 @@ class LowerToLLVM:
 
         return shim_fn
 
+    def shim_xfer_batched(
+        self, mlir_fn: FuncOp, old_fn: ir.Function, bw: int
+    ) -> ir.Function:
+        """
+        Shim a transfer function to the batched ABI of the eval engine:
+        `void f(const i64 **in, i64 **out, i64 n)`, where `in[a * arity + f]` is the
+        column of field f of argument a and `out[f]` the column of field f of the
+        result. The loop over the `n` rows lives in the shim, so the transfer
+        function is inlined into it instead of being called once per row, and the
+        loop is vectorized by the pipeline of `Jit`.
+        """
+
+        if not self.is_transfer_fn(mlir_fn):
+            raise ValueError(f"Cannot batch non transfer function: {old_fn}")
+
+        return self._column_loop(
+            f"{old_fn.name}_batch",
+            mlir_fn,
+            bw,
+            1,
+            lambda b, lanes: [b.call(old_fn, lanes)],
+        )
+
+    def shim_fused(
+        self,
+        name: str,
+        mlir_fn: FuncOp,
+        xfers: list[ir.Function],
+        refs: list[ir.Function],
+        meet: ir.Function,
+        top: ir.Function,
+        bw: int,
+    ) -> ir.Function:
+        """
+        Fuse a whole eval of `xfers` against `refs` into one batched kernel. Per row
+        it writes the meet of the refs (top if there are none) to the first result
+        and the output of each of the xfers, met with it, to the following ones, so
+        `out[(i + 1) * arity + f]` is field f of xfer i (see EvalFused). `mlir_fn`
+        only provides the signature shared by all the transformers.
+        """
+
+        if not self.is_transfer_fn(mlir_fn):
+            raise ValueError(f"Cannot fuse non transfer function: {mlir_fn}")
+
+        def body(b: ir.IRBuilder, lanes: list[ir.Value]) -> list[ir.Value]:
+            ref = b.call(top, lanes[:1]) if not refs else b.call(refs[0], lanes)
+            for f in refs[1:]:
+                ref = b.call(meet, [ref, b.call(f, lanes)])
+
+            outs = [b.call(f, lanes) for f in xfers]
+            if refs:
+                outs = [b.call(meet, [ref, x]) for x in outs]
+
+            return [ref, *outs]
+
+        return self._column_loop(f"{name}_{bw}_fused", mlir_fn, bw, len(xfers) + 1, body)
+
+    def _column_loop(
+        self,
+        fn_name: str,
+        mlir_fn: FuncOp,
+        bw: int,
+        num_results: int,
+        body: Callable[[ir.IRBuilder, list[ir.Value]], list[ir.Value]],
+    ) -> ir.Function:
+        "Emit a batched ABI function storing the `num_results` values `body` returns."
+
+        n_args = len(mlir_fn.args)
+        i64 = ir.IntType(64)
+        col_t = i64.as_pointer()
+
+        ret_t = mlir_fn.function_type.outputs.data[0]
+        assert isinstance(ret_t, AbstractValueType)
+        num_abst_fields = len(ret_t.get_fields())
+
+        shim_ty = ir.FunctionType(
+            ir.VoidType(), [col_t.as_pointer(), col_t.as_pointer(), i64]
+        )
+        shim_fn = ir.Function(self.llvm_mod, shim_ty, name=fn_name)
+        shim_fn.attributes.add("nounwind")
+        shim_fn.attributes.add("norecurse")
+        in_cols, out_cols, n = shim_fn.args
+        in_cols.name, out_cols.name, n.name = "in", "out", "n"
+
+        entry = shim_fn.append_basic_block(name="entry")
+        loop = shim_fn.append_basic_block(name="loop")
+        done = shim_fn.append_basic_block(name="done")
+
+        b = ir.IRBuilder(entry)
+
+        def load_col(cols: ir.Argument, i: int) -> ir.Instruction:
+            return b.load(b.gep(cols, [ir.Constant(i64, i)], inbounds=True))
+
+        arg_cols = [load_col(in_cols, i) for i in range(n_args * num_abst_fields)]
+        res_cols = [load_col(out_cols, i) for i in range(num_results * num_abst_fields)]
+        b.cbranch(b.icmp_unsigned("==", n, ir.Constant(i64, 0)), done, loop)
+
+        b.position_at_end(loop)
+        row = b.phi(i64, name="row")
+        row.add_incoming(ir.Constant(i64, 0), entry)
+
+        new_lanes = []
+        for a, mlir_arg in enumerate(mlir_fn.args):
+            assert isinstance(mlir_arg.type, AbstractValueType)
+            lane_t = lower_type(mlir_arg.type.get_fields()[0], bw)
+            new_lane = ir.Constant(ir.ArrayType(lane_t, num_abst_fields), None)
+
+            for i in range(num_abst_fields):
+                col = arg_cols[a * num_abst_fields + i]
+                v = b.load(b.gep(col, [row], inbounds=True))
+                new_lane = b.insert_value(new_lane, b.trunc(v, lane_t), i)
+
+            new_lanes.append(new_lane)
+
+        results = body(b, new_lanes)
+        assert len(results) == num_results
+        for k, r_n in enumerate(results):
+            for i in range(num_abst_fields):
+                col = res_cols[k * num_abst_fields + i]
+                r = b.zext(b.extract_value(r_n, i), i64)
+                b.store(r, b.gep(col, [row], inbounds=True))
+
+        next_row = b.add(row, ir.Constant(i64, 1), name="next_row")
+        row.add_incoming(next_row, loop)
+        b.cbranch(b.icmp_unsigned("==", next_row, n), done, loop)
+
+        b.position_at_end(done)
+        b.ret_void()
+
+        return shim_fn
+
 
 class _LowerFuncToLLVM:
     class _IRBuilderOp(Protocol):
@@ -2,6 +2,7 @@ from dataclasses import dataclass, field, replace
 from enum import StrEnum
 from io import StringIO
 from multiprocessing import Pool
+from typing import ClassVar
 
 import pandas as pd
 from xdsl.context import Context
@@ -11,7 +12,7 @@ from xdsl.dialects.func import Func, FuncOp
 from xdsl.dialects.smt import ConstantBoolOp
 from xdsl.ir import Operation, OpResult
 from xdsl.transforms.canonicalize import CanonicalizePass
-from xdsl_smt.dialects.smt_bitvector_dialect import ConstantOp
+from xdsl_smt.dialects.smt_bitvector_dialect import BitVectorType, ConstantOp
 from xdsl_smt.dialects.smt_dialect import (
     AssertOp,
     CallOp,
@@ -30,7 +31,12 @@ from xdsl_smt.utils.transfer_function_util import get_argument_instances_with_ef
 from synth_xfer._util.domain import AbstractDomain, get_bvs_from_abst
 from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.pattern_dsl import ArgRef, NodeRef, PatternDag, PatternRef
-from synth_xfer._util.smt_solver import IncrementalSolver, SolverKind, make_solver
+from synth_xfer._util.smt_solver import (
+    IncrementalSolver,
+    SolverKind,
+    Z3Optimizer,
+    make_solver,
+)
 from synth_xfer._util.tsv import EnumData
 from synth_xfer._util.verifier import lower_to_smt_module
 
@@ -55,7 +61,9 @@ class MaxPreciseQueryBuilder:
     result_width: int
     arg_widths: list[int]
     arg_is_i1: list[bool]
-    abstract_arg_values: list[tuple[int, int]]
+    # None declares the fields of the abstract arguments as constants instead,
+    # named `$abst_{arg}_{field}`, for `MaxPreciseTemplate` to fix per row
+    abstract_arg_values: list[tuple[int, int]] | None
     instance_constraint_iN: DefineFunOp
     instance_constraint_i1: DefineFunOp | None
     concrete_op: DefineFunOp
@@ -87,7 +95,9 @@ class MaxPreciseQueryBuilder:
         pair_res_op = PairOp(pair_op.res, self._const_false.result)
         return [const_i1, pair_op, pair_res_op], pair_res_op.res
 
-    def _to_pair_value(self, val_list: list[ConstantOp]) -> tuple[list[PairOp], OpResult]:
+    def _to_pair_value(
+        self, val_list: list[ConstantOp] | list[DeclareConstOp]
+    ) -> tuple[list[PairOp], OpResult]:
         last_val = self._const_false.result
         result: list[PairOp] = []
         for val in val_list[::-1]:
@@ -95,7 +105,24 @@ class MaxPreciseQueryBuilder:
             last_val = result[-1].res
         return result, result[-1].res
 
+    def _abstract_vars(self) -> tuple[list[Operation], list[OpResult]]:
+        ops: list[Operation] = []
+        values: list[OpResult] = []
+        for i, arg_width in enumerate(self.arg_widths):
+            field_vars: list[DeclareConstOp] = []
+            for j in range(self.domain.vec_size):
+                var = DeclareConstOp(BitVectorType(arg_width))
+                var.res.name_hint = f"abst_{i}_{j}"
+                field_vars.append(var)
+            pair_ops, pair_value = self._to_pair_value(field_vars)
+            ops += field_vars + pair_ops
+            values.append(pair_value)
+        return ops, values
+
     def _abstract_values(self) -> tuple[list[Operation], list[OpResult]]:
+        if self.abstract_arg_values is None:
+            return self._abstract_vars()
+
         ops: list[Operation] = []
         values: list[OpResult] = []
         for abst_bv, arg_width in zip(self.abstract_arg_values, self.arg_widths):
@@ -171,10 +198,11 @@ class MaxPreciseQueryBuilder:
         )
 
 
-@dataclass(frozen=True)
+@dataclass
 class PreparedQuery:
     solver: IncrementalSolver
     result_width: int
+    num_checks: int = 0
 
     @classmethod
     def from_module(
@@ -184,7 +212,16 @@ class PreparedQuery:
         result_width: int,
         timeout: int,
         solver_kind: SolverKind,
+        optimize: bool = False,
     ) -> "PreparedQuery":
+        """
+        `optimize` puts the query on z3's `Optimize`, for interval domains to ask for
+        the bounds of the result directly. It needs `solver_kind` to be z3.
+        """
+
+        if optimize and solver_kind != SolverKind.z3:
+            raise ValueError(f"optimize needs the z3 solver, not {solver_kind}")
+
         module = smt_mod.clone()
         FunctionCallInline(True, {}).apply(ctx, module)
         LowerPairs().apply(ctx, module)
@@ -193,11 +230,19 @@ class PreparedQuery:
         stream = StringIO()
         print_to_smtlib(module, stream)
 
-        solver = make_solver(solver_kind, stream.getvalue(), timeout)
+        if optimize:
+            solver = Z3Optimizer(stream.getvalue(), timeout)
+        else:
+            solver = make_solver(solver_kind, stream.getvalue(), timeout)
         return cls(solver=solver, result_width=result_width)
 
+    @property
+    def can_optimize(self) -> bool:
+        return isinstance(self.solver, Z3Optimizer)
+
     def is_sat(self) -> bool:
         result = self.solver.check()
+        self.num_checks += 1
         if result is None:
             raise TimeoutError()
         return result
@@ -210,10 +255,43 @@ class PreparedQuery:
         finally:
             self.solver.pop()
 
+        self.num_checks += 1
         if result is None:
             raise TimeoutError()
         return result
 
+    def witness(self, probe: str | None = None) -> int | None:
+        "A value `$result` can take (under `probe`, if any), None if there is none."
+
+        self.solver.push()
+        try:
+            if probe is not None:
+                self.solver.add_smt2(f"(assert {probe})")
+            result = self.solver.check()
+            model = self.solver.model() if result else None
+            value = None if model is None else model.get_bv("$result")
+        finally:
+            self.solver.pop()
+
+        self.num_checks += 1
+        if result is None:
+            raise TimeoutError()
+        if not result:
+            return None
+        if value is None:
+            raise RuntimeError("the model of the max precise query has no $result")
+        return value
+
+    def bounds(self, signed: bool) -> tuple[int, int] | None:
+        "The min and max bits of `$result` (see `Z3Optimizer`), None if there is none."
+
+        assert isinstance(self.solver, Z3Optimizer)
+        result, bounds = self.solver.bounds("$result", self.result_width, signed)
+        self.num_checks += 1
+        if result is None:
+            raise TimeoutError()
+        return bounds
+
     def bv_val(self, val: int) -> str:
         return f"(_ bv{val % (2**self.result_width)} {self.result_width})"
 
@@ -229,37 +307,50 @@ class ComputeMaxPrecise:
 
 @dataclass(frozen=True)
 class KnownBitsMaxPrecise(ComputeMaxPrecise):
-    def check_ith_bit(self, ith: int) -> str | None:
-        ith_bit = f"((_ extract {ith} {ith}) $result)"
-        can_be_z = self.query.check(f"(= {ith_bit} (_ bv0 1))")
-        can_be_o = self.query.check(f"(= {ith_bit} (_ bv1 1))")
-        if can_be_o and can_be_z:
-            return "?"
-        if (not can_be_z) and (not can_be_o):
-            return None
-        if not can_be_z:
-            return "1"
-        if not can_be_o:
-            return "0"
-        raise AssertionError("unreachable")
+    """
+    A witness of the result fixes one possible value of every bit at once, so only
+    whether each bit can also take the other value is left. That is asked for all
+    the bits still open in one query, whether the result can differ from the
+    witness on any of them, and every model of it opens up all the bits it
+    differs on. An unsat answer means the open bits are constant. This takes at
+    most `bitwidth + 1` checks, and usually a handful, instead of `2 * bitwidth`.
+    """
 
     def compute(self) -> str:
-        result = ""
-        for i in range(self.bitwidth):
-            ith_result = self.check_ith_bit(i)
-            if ith_result is None:
-                return "(bottom)"
-            result = ith_result + result
-        return result
+        witness = self.query.witness()
+        if witness is None:
+            return "(bottom)"
+
+        unknown = 2**self.bitwidth - 1
+        varying = 0
+        while unknown:
+            mask = self.query.bv_val(unknown)
+            fixed = self.query.bv_val(witness & unknown)
+            other = self.query.witness(f"(distinct (bvand $result {mask}) {fixed})")
+            if other is None:
+                break
+            seen = (other ^ witness) & unknown
+            varying |= seen
+            unknown &= ~seen
+
+        return "".join(
+            "?" if (varying >> i) & 1 else str((witness >> i) & 1)
+            for i in reversed(range(self.bitwidth))
+        )
 
 
 @dataclass(frozen=True)
 class IntervalMaxPrecise(ComputeMaxPrecise):
-    def _can_be_leq(self, val: int) -> bool:
-        return self.query.check(self._cmp_leq("$result", val))
+    """
+    The bounds are binary searched for, but every probe that is sat also brings a
+    model, and the search jumps to the value of the result in it, which is at
+    least as far as the middle. The first search starts from a witness of the
+    result, so each bound is only searched for between that and the end of the
+    range. With a query on z3's `Optimize` (see `MaxPreciseTemplate`), both bounds
+    are asked for directly.
+    """
 
-    def _can_be_geq(self, val: int) -> bool:
-        return self.query.check(self._cmp_geq("$result", val))
+    signed: ClassVar[bool]
 
     def _cmp_leq(self, concrete_res: str, val: int) -> str:
         raise NotImplementedError
@@ -276,44 +367,71 @@ class IntervalMaxPrecise(ComputeMaxPrecise):
     def format_result(self, lower_bound: int, upper_bound: int) -> str:
         raise NotImplementedError
 
-    def lower_bound(self) -> int | None:
-        if not self.query.is_sat():
-            return None
+    def _from_bits(self, bits: int) -> int:
+        raise NotImplementedError
 
-        lo, hi = self.min_value(), self.max_value()
+    def _leq_witness(self, val: int) -> int | None:
+        witness = self.query.witness(self._cmp_leq("$result", val))
+        return None if witness is None else self._from_bits(witness)
+
+    def _geq_witness(self, val: int) -> int | None:
+        witness = self.query.witness(self._cmp_geq("$result", val))
+        return None if witness is None else self._from_bits(witness)
+
+    def lower_bound(self, witness: int) -> int:
+        "The least value of the result, which is at most `witness`, one of its values."
+
+        lo, hi = self.min_value(), witness
         while lo < hi:
             mid = (lo + hi) // 2
-            if self._can_be_leq(mid):
-                hi = mid
-            else:
+            below = self._leq_witness(mid)
+            if below is None:
                 lo = mid + 1
+            else:
+                hi = below
         return lo
 
-    def upper_bound(self, lower_bound: int) -> int:
-        lo, hi = lower_bound, self.max_value()
+    def upper_bound(self, witness: int) -> int:
+        "The greatest value of the result, which is at least `witness`, one of its values."
+
+        lo, hi = witness, self.max_value()
         while lo < hi:
             mid = (lo + hi + 1) // 2
-            if self._can_be_geq(mid):
-                lo = mid
-            else:
+            above = self._geq_witness(mid)
+            if above is None:
                 hi = mid - 1
+            else:
+                lo = above
         return lo
 
     def compute(self) -> str:
-        lower_bound = self.lower_bound()
-        if lower_bound is None:
+        if self.query.can_optimize:
+            bounds = self.query.bounds(self.signed)
+            if bounds is None:
+                return "(bottom)"
+            return self.format_result(*map(self._from_bits, bounds))
+
+        witness = self.query.witness()
+        if witness is None:
             return "(bottom)"
-        return self.format_result(lower_bound, self.upper_bound(lower_bound))
+
+        witness = self._from_bits(witness)
+        return self.format_result(self.lower_bound(witness), self.upper_bound(witness))
 
 
 @dataclass(frozen=True)
 class UConstRangeMaxPrecise(IntervalMaxPrecise):
+    signed: ClassVar[bool] = False
+
     def _cmp_leq(self, concrete_res: str, val: int) -> str:
         return f"(bvule {concrete_res} {self.query.bv_val(val)})"
 
     def _cmp_geq(self, concrete_res: str, val: int) -> str:
         return f"(bvuge {concrete_res} {self.query.bv_val(val)})"
 
+    def _from_bits(self, bits: int) -> int:
+        return bits
+
     def min_value(self) -> int:
         return 0
 
@@ -326,12 +444,17 @@ class UConstRangeMaxPrecise(IntervalMaxPrecise):
 
 @dataclass(frozen=True)
 class SConstRangeMaxPrecise(IntervalMaxPrecise):
+    signed: ClassVar[bool] = True
+
     def _cmp_leq(self, concrete_res: str, val: int) -> str:
         return f"(bvsle {concrete_res} {self.query.bv_val(val)})"
 
     def _cmp_geq(self, concrete_res: str, val: int) -> str:
         return f"(bvsge {concrete_res} {self.query.bv_val(val)})"
 
+    def _from_bits(self, bits: int) -> int:
+        return bits - 2**self.bitwidth if bits >= 2**self.bitwidth // 2 else bits
+
     def min_value(self) -> int:
         return -(2**self.bitwidth // 2)
 
@@ -388,6 +511,7 @@ class RowResult:
     ideal: str | None = None
     sequential_ideal: str | None = None
     timed_out: bool = False
+    num_checks: int = 0
 
 
 @dataclass(frozen=True)
@@ -396,8 +520,10 @@ class RowProcessor:
     domain: AbstractDomain
     timeout: int
     solver_kind: SolverKind
+    optimize: bool = False
 
     def __call__(self, task: RowTask) -> RowResult:
+        checks_before = num_solver_checks()
         try:
             ideal, sequential_ideal = compute_max_pair(
                 self.pattern,
@@ -406,77 +532,176 @@ class RowProcessor:
                 task.args,
                 self.timeout,
                 self.solver_kind,
+                self.optimize,
             )
             return RowResult(
                 index=task.index,
                 ideal=ideal,
                 sequential_ideal=sequential_ideal,
+                num_checks=num_solver_checks() - checks_before,
             )
         except TimeoutError:
-            return RowResult(index=task.index, timed_out=True)
+            return RowResult(
+                index=task.index,
+                timed_out=True,
+                num_checks=num_solver_checks() - checks_before,
+            )
 
 
-def compute_max_precise(
+class MaxPreciseTemplate:
+    """
+    The max precise query of a pattern at one bitwidth, for any abstract arguments.
+
+    The concrete op, its constraints and the instance constraints are lowered once,
+    into a query where the abstract arguments are free, and loaded into a solver
+    that is kept. A row then only fixes the arguments, inside a `push`/`pop` around
+    the probes of its computer.
+
+    With `optimize`, the query of an interval domain is kept on z3's `Optimize`,
+    which gives the bounds of the result without a search.
+    """
+
+    domain: AbstractDomain
+    bw: int
+    arity: int
+    arg_widths: list[int]
+    result_width: int
+    query: PreparedQuery
+
+    def __init__(
+        self,
+        pattern: PatternDag,
+        domain: AbstractDomain,
+        bw: int,
+        timeout: int,
+        solver_kind: SolverKind,
+        optimize: bool = False,
+    ):
+        ctx = _get_ctx()
+        hlprs = HelperFuncs(pattern, domain)
+
+        self.domain = domain
+        self.bw = bw
+        self.arity = len(hlprs.crt_func.args)
+        self.arg_widths = [_concrete_width(arg_ty, bw) for arg_ty in hlprs.conc_arg_ty]
+        arg_is_i1 = [arg_ty == i1 for arg_ty in hlprs.conc_arg_ty]
+        self.result_width = _concrete_width(hlprs.conc_ret_ty, bw)
+
+        fns = [hlprs.crt_func, hlprs.op_constraint_func]
+        lower_to_smt_module(
+            m := ModuleOp([x.clone() for x in fns if x is not None]), bw, ctx
+        )
+        m_ops = iter(m.ops)
+        concrete_op = next(m_ops)
+        op_constraint = next(m_ops, None)
+        assert isinstance(concrete_op, DefineFunOp)
+        assert isinstance(op_constraint, DefineFunOp) or op_constraint is None
+
+        instance_constraint_iN = _lower_instance_constraint(
+            "abstract_val_contains_iN", hlprs.instance_constraint_func, bw, ctx
+        )
+        instance_constraint_i1 = (
+            _lower_instance_constraint(
+                "abstract_val_contains_i1", hlprs.instance_constraint_func, 1, ctx
+            )
+            if any(arg_is_i1)
+            else None
+        )
+
+        smt_mod = MaxPreciseQueryBuilder(
+            domain=domain,
+            result_width=self.result_width,
+            arg_widths=self.arg_widths,
+            arg_is_i1=arg_is_i1,
+            abstract_arg_values=None,
+            instance_constraint_iN=instance_constraint_iN,
+            instance_constraint_i1=instance_constraint_i1,
+            concrete_op=concrete_op,
+            op_constraint=op_constraint,
+        ).build()
+
+        self.query = PreparedQuery.from_module(
+            ctx,
+            smt_mod,
+            self.result_width,
+            timeout,
+            solver_kind,
+            optimize and domain != AbstractDomain.KnownBits,
+        )
+
+    def compute(self, args: tuple[str, ...]) -> str:
+        if self.arity != len(args):
+            raise ValueError(
+                f"arity of expression ({self.arity}) doesn't match number of args provided ({len(args)})"
+            )
+
+        parsed_args = [
+            get_bvs_from_abst(arg, self.domain, arg_width)
+            for arg, arg_width in zip(args, self.arg_widths)
+        ]
+        if any(arg is None for arg in parsed_args):
+            return "(bottom)"
+
+        fix_args = "\n".join(
+            f"(assert (= $abst_{i}_{j} (_ bv{x % (2**width)} {width})))"
+            for i, (abst_bv, width) in enumerate(zip(parsed_args, self.arg_widths))
+            if abst_bv is not None
+            for j, x in enumerate(abst_bv)
+        )
+
+        solver = self.query.solver
+        solver.push()
+        try:
+            solver.add_smt2(fix_args)
+            computer = _get_max_precise_computer(
+                self.domain, self.query, self.result_width
+            )
+            return computer.compute()
+        finally:
+            solver.pop()
+
+
+_TEMPLATES: dict[
+    tuple[str, AbstractDomain, int, int, SolverKind, bool], MaxPreciseTemplate
+] = {}
+
+
+def max_precise_template(
     pattern: PatternDag,
     domain: AbstractDomain,
     bw: int,
-    args: tuple[str, ...],
     timeout: int,
     solver_kind: SolverKind,
-) -> str:
-    ctx = _get_ctx()
-
-    hlprs = HelperFuncs(pattern, domain)
-    if len(hlprs.crt_func.args) != len(args):
-        raise ValueError(
-            f"arity of expression ({len(hlprs.crt_func.args)}) doesn't match number of args provided ({len(args)})"
+    optimize: bool = False,
+) -> MaxPreciseTemplate:
+    "The `MaxPreciseTemplate` of this process for these args, made on first use."
+
+    key = (str(pattern), domain, bw, timeout, solver_kind, optimize)
+    if key not in _TEMPLATES:
+        _TEMPLATES[key] = MaxPreciseTemplate(
+            pattern, domain, bw, timeout, solver_kind, optimize
         )
 
-    arg_widths = [_concrete_width(arg_ty, bw) for arg_ty in hlprs.conc_arg_ty]
-    arg_is_i1 = [arg_ty == i1 for arg_ty in hlprs.conc_arg_ty]
-    result_width = _concrete_width(hlprs.conc_ret_ty, bw)
-    parsed_args = [
-        get_bvs_from_abst(arg, domain, arg_width)
-        for arg, arg_width in zip(args, arg_widths)
-    ]
-    if any(arg is None for arg in parsed_args):
-        return "(bottom)"
-    abst_arg_values = [arg for arg in parsed_args if arg is not None]
+    return _TEMPLATES[key]
 
-    fns = [hlprs.crt_func, hlprs.op_constraint_func]
-    lower_to_smt_module(m := ModuleOp([x.clone() for x in fns if x is not None]), bw, ctx)
-    m_ops = iter(m.ops)
-    concrete_op = next(m_ops)
-    op_constraint = next(m_ops, None)
-    assert isinstance(concrete_op, DefineFunOp)
-    assert isinstance(op_constraint, DefineFunOp) or op_constraint is None
 
-    instance_constraint_iN = _lower_instance_constraint(
-        "abstract_val_contains_iN", hlprs.instance_constraint_func, bw, ctx
-    )
-    instance_constraint_i1 = (
-        _lower_instance_constraint(
-            "abstract_val_contains_i1", hlprs.instance_constraint_func, 1, ctx
-        )
-        if any(arg_is_i1)
-        else None
-    )
+def num_solver_checks() -> int:
+    "The number of solver checks made by the templates of this process so far."
+
+    return sum(template.query.num_checks for template in _TEMPLATES.values())
 
-    smt_mod = MaxPreciseQueryBuilder(
-        domain=domain,
-        result_width=result_width,
-        arg_widths=arg_widths,
-        arg_is_i1=arg_is_i1,
-        abstract_arg_values=abst_arg_values,
-        instance_constraint_iN=instance_constraint_iN,
-        instance_constraint_i1=instance_constraint_i1,
-        concrete_op=concrete_op,
-        op_constraint=op_constraint,
-    ).build()
 
-    query = PreparedQuery.from_module(ctx, smt_mod, result_width, timeout, solver_kind)
-    computer = _get_max_precise_computer(domain, query, result_width)
-    return computer.compute()
+def compute_max_precise(
+    pattern: PatternDag,
+    domain: AbstractDomain,
+    bw: int,
+    args: tuple[str, ...],
+    timeout: int,
+    solver_kind: SolverKind,
+    optimize: bool = False,
+) -> str:
+    template = max_precise_template(pattern, domain, bw, timeout, solver_kind, optimize)
+    return template.compute(args)
 
 
 def compute_sequential_root_max_precise(
@@ -486,6 +711,7 @@ def compute_sequential_root_max_precise(
     args: tuple[str, ...],
     timeout: int,
     solver_kind: SolverKind,
+    optimize: bool = False,
 ) -> str:
     values: dict[PatternRef, str] = {ArgRef(index): arg for index, arg in enumerate(args)}
     for node_index, node in enumerate(pattern.nodes):
@@ -497,6 +723,7 @@ def compute_sequential_root_max_precise(
             node_args,
             timeout,
             solver_kind,
+            optimize,
         )
     return values[pattern.result]
 
@@ -508,8 +735,11 @@ def compute_max_pair(
     args: tuple[str, ...],
     timeout: int,
     solver_kind: SolverKind,
+    optimize: bool = False,
 ) -> tuple[str, str]:
-    composite = compute_max_precise(pattern, domain, bw, args, timeout, solver_kind)
+    composite = compute_max_precise(
+        pattern, domain, bw, args, timeout, solver_kind, optimize
+    )
     if pattern.is_op():
         return composite, composite
     sequential = compute_sequential_root_max_precise(
@@ -519,6 +749,7 @@ def compute_max_pair(
         args,
         timeout,
         solver_kind,
+        optimize,
     )
     return composite, sequential
 
@@ -531,6 +762,7 @@ def fill_hbw_rows(
     data: EnumData,
     timeout: int,
     solver_kind: SolverKind,
+    optimize: bool = False,
 ) -> tuple[EnumData, list[str]]:
     hbw_bws = {bw for bw, _, _ in data.metadata.hbw}
     arg_cols = [f"arg_{i}" for i in range(data.metadata.arity)]
@@ -543,8 +775,13 @@ def fill_hbw_rows(
         for index, row in data.enumdata.iterrows()
         if int(row["bw"]) in hbw_bws  # type: ignore
     ]
+    # keep the rows of a bitwidth together, so the chunks of a worker mostly share
+    # one `MaxPreciseTemplate`
+    tasks.sort(key=lambda task: task.bw)
 
-    processor = RowProcessor(data.metadata.op, data.metadata.domain, timeout, solver_kind)
+    processor = RowProcessor(
+        data.metadata.op, data.metadata.domain, timeout, solver_kind, optimize
+    )
     if len(tasks) <= 1:
         results = [processor(task) for task in tasks]
     else:
@@ -572,6 +809,13 @@ def fill_hbw_rows(
         df.at[result.index, "ideal"] = result.ideal
         df.at[result.index, "sequential_ideal"] = result.sequential_ideal
 
+    if results:
+        num_checks = sum(result.num_checks for result in results)
+        print(
+            f"solver checks: {num_checks} for {len(results)} rows "
+            f"({num_checks / len(results):.1f} per row)"
+        )
+
     if timed_out_indexes:
         df = df.drop(index=timed_out_indexes).reset_index(drop=True)
 
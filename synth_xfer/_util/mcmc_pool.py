@@ -0,0 +1,287 @@
+from dataclasses import dataclass
+from multiprocessing import get_context
+
+from xdsl.dialects.func import FuncOp
+from xdsl.ir import Operation
+
+from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.eval import Columns, make_eval_fn
+from synth_xfer._util.eval_result import EvalResult
+from synth_xfer._util.jit_session import JitSession
+from synth_xfer._util.mcmc_sampler import setup_mcmc
+from synth_xfer._util.one_iter import McmcOutcome, run_mcmc
+from synth_xfer._util.parse_mlir import HelperFuncs, parse_mlir_func
+from synth_xfer._util.random import Random
+from synth_xfer._util.solution_set import EvalFn, SolutionSet
+from synth_xfer._util.synth_context import SynthesizerContext
+from synth_xfer._util.xfer_func import XferFunc
+
+_Best = list[tuple[str, EvalResult, int]]
+
+
+@dataclass
+class _Worker:
+    helper_funcs: HelperFuncs
+    domain: AbstractDomain
+    context: SynthesizerContext
+    context_weighted: SynthesizerContext
+    context_cond: SynthesizerContext
+    eval_fn: EvalFn
+    screen_fn: EvalFn | None
+
+
+_WORKER: _Worker | None = None
+
+
+def _init_worker(
+    helper_funcs: HelperFuncs,
+    domain: AbstractDomain,
+    contexts: tuple[SynthesizerContext, SynthesizerContext, SynthesizerContext],
+    to_eval: dict[int, Columns],
+    all_bws: list[int],
+    low_and_med_bw: set[int],
+    fused_eval: bool,
+    staged_eval: int,
+) -> None:
+    global _WORKER
+
+    session = JitSession(
+        all_bws,
+        [helper_funcs.get_top_func],
+        batched=True,
+        meet=helper_funcs.meet_func if fused_eval else None,
+        top=helper_funcs.get_top_func if fused_eval else None,
+    )
+    eval_fn = make_eval_fn(to_eval, session, helper_funcs, low_and_med_bw)
+    screen_fn = (
+        make_eval_fn(
+            {bw: x.every(staged_eval) for bw, x in to_eval.items()},
+            session,
+            helper_funcs,
+            low_and_med_bw,
+        )
+        if staged_eval > 0
+        else None
+    )
+
+    _WORKER = _Worker(helper_funcs, domain, *contexts, eval_fn, screen_fn)
+
+
+@dataclass(frozen=True)
+class _Shard:
+    "One iteration of the samplers with an index in `samplers`, IR passed as text."
+
+    ith_iter: int
+    samplers: range
+    seed: int
+    solutions: list[tuple[str, str | None]]
+    precise_set: list[str]
+    op_weights: dict[str, dict[type[Operation], int]]
+    weighted: bool
+    num_mcmc: int
+    num_abd_procs: int
+    program_length: int
+    num_steps: int
+    cond_length: int
+    inv_temp: int
+
+
+@dataclass(frozen=True)
+class _ShardResult:
+    sound_most_improve_tfs: _Best
+    most_improve_tfs: _Best
+    eval_time: float
+    sample_time: float
+    decide_time: float
+    num_accepted: int
+    num_pruned: int | None
+
+
+def _intersect(a: range, b: range) -> range:
+    start = max(a.start, b.start)
+    return range(start, max(start, min(a.stop, b.stop)))
+
+
+def _run_shard(shard: _Shard) -> _ShardResult:
+    assert _WORKER is not None
+    w = _WORKER
+
+    random = Random(shard.seed)
+    w.context_weighted.op_weights = shard.op_weights
+    w.context_weighted.weighted = shard.weighted
+
+    solution_set = SolutionSet(
+        [
+            XferFunc(
+                parse_mlir_func(body), None if cond is None else parse_mlir_func(cond)
+            )
+            for body, cond in shard.solutions
+        ],
+        domain=w.domain,
+    )
+    mcmc_samplers, prec_set, ranges = setup_mcmc(
+        w.helper_funcs.transfer_func,
+        [parse_mlir_func(x) for x in shard.precise_set],
+        shard.num_abd_procs,
+        shard.num_mcmc,
+        w.context,
+        w.context_weighted,
+        w.context_cond,
+        shard.program_length,
+        shard.num_steps,
+        shard.cond_length,
+        shard=shard.samplers,
+    )
+
+    # the ranges of the samplers of this shard, relative to its first sampler
+    first = shard.samplers.start
+    sp_range, p_range, c_range = (_intersect(r, shard.samplers) for r in ranges)
+    shard_prec_set = prec_set[c_range.start - ranges[2].start :][: len(c_range)]
+
+    out = run_mcmc(
+        shard.ith_iter,
+        random,
+        solution_set,
+        w.eval_fn,
+        shard.inv_temp,
+        (
+            range(sp_range.start - first, sp_range.stop - first),
+            range(p_range.start - first, p_range.stop - first),
+            range(c_range.start - first, c_range.stop - first),
+        ),
+        mcmc_samplers,
+        shard_prec_set,
+        w.screen_fn,
+        first,
+    )
+
+    def to_text(tfs: list[tuple[FuncOp, EvalResult, int]]) -> _Best:
+        return [(str(tf), res, rnd) for tf, res, rnd in tfs]
+
+    return _ShardResult(
+        to_text(out.sound_most_improve_tfs),
+        to_text(out.most_improve_tfs),
+        out.eval_time,
+        out.sample_time,
+        out.decide_time,
+        out.num_accepted,
+        out.num_pruned,
+    )
+
+
+class McmcPool:
+    """
+    Runs the MCMC samplers of an iteration on `num_procs` worker processes, each
+    stepping a contiguous shard of the samplers. Every worker builds its own
+    `JitSession` and eval functions on start, and the eval dataset is shared with
+    the parent copy-on-write, so the workers are forked, and must be started while
+    the parent runs no other threads. Per iteration the solution set is sent
+    to the workers as text, and the best transformers of each sampler come back the
+    same way along with their `EvalResult`s. Each shard draws from its own seed,
+    taken from the `random` of the parent, so a run is reproducible for a given
+    seed and number of processes, but samples differently than the sequential one.
+    """
+
+    num_procs: int
+
+    def __init__(
+        self,
+        num_procs: int,
+        helper_funcs: HelperFuncs,
+        domain: AbstractDomain,
+        contexts: tuple[SynthesizerContext, SynthesizerContext, SynthesizerContext],
+        to_eval: dict[int, Columns],
+        all_bws: list[int],
+        low_and_med_bw: set[int],
+        fused_eval: bool = False,
+        staged_eval: int = 0,
+    ):
+        if num_procs < 1:
+            raise ValueError("McmcPool needs at least one process")
+
+        self.num_procs = num_procs
+        self._pool = get_context("fork").Pool(
+            num_procs,
+            _init_worker,
+            (
+                helper_funcs,
+                domain,
+                contexts,
+                to_eval,
+                all_bws,
+                low_and_med_bw,
+                fused_eval,
+                staged_eval,
+            ),
+        )
+
+    def __enter__(self) -> "McmcPool":
+        return self
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+    def run_mcmc(
+        self,
+        ith_iter: int,
+        random: Random,
+        solution_set: SolutionSet,
+        context_weighted: SynthesizerContext,
+        inv_temp: int,
+        num_mcmc: int,
+        num_abd_procs: int,
+        program_length: int,
+        num_steps: int,
+        cond_length: int,
+    ) -> McmcOutcome:
+        "Like `one_iter.run_mcmc` for the samplers `setup_mcmc` makes with these args."
+
+        size, rem = divmod(num_mcmc, self.num_procs)
+        bounds = [i * size + min(i, rem) for i in range(self.num_procs + 1)]
+        shards = [range(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+        solutions = [
+            (str(sol.body), None if sol.cond is None else str(sol.cond))
+            for sol in solution_set.solutions
+        ]
+        precise_set = [str(x) for x in solution_set.precise_set]
+        tasks = [
+            _Shard(
+                ith_iter,
+                shard,
+                random.randint(0, 2**32 - 1),
+                solutions,
+                precise_set,
+                context_weighted.op_weights,
+                context_weighted.weighted,
+                num_mcmc,
+                num_abd_procs,
+                program_length,
+                num_steps,
+                cond_length,
+                inv_temp,
+            )
+            for shard in shards
+        ]
+        results = self._pool.map(_run_shard, tasks, chunksize=1)
+
+        def from_text(tfs: _Best) -> list[tuple[FuncOp, EvalResult, int]]:
+            return [(parse_mlir_func(tf), res, rnd) for tf, res, rnd in tfs]
+
+        pruned = [r.num_pruned for r in results if r.num_pruned is not None]
+
+        # the shards run side by side, so the slowest one is the time spent
+        return McmcOutcome(
+            [tf for r in results for tf in from_text(r.sound_most_improve_tfs)],
+            [tf for r in results for tf in from_text(r.most_improve_tfs)],
+            num_steps,
+            max(r.eval_time for r in results),
+            max(r.sample_time for r in results),
+            max(r.decide_time for r in results),
+            sum(r.num_accepted for r in results),
+            sum(pruned) if pruned else None,
+        )
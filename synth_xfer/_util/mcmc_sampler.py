@@ -256,11 +256,14 @@ def setup_mcmc(
     program_length: int,
     num_steps: int,
     cond_length: int,
+    shard: range | None = None,
 ) -> tuple[list[MCMCSampler], list[FuncOp], tuple[range, range, range]]:
     """
     A mcmc sampler use one of 3 modes: sound & precise, precise, condition
     This function specify which mode should be used for each mcmc sampler
     For example, mcmc samplers with index in sp_range should use "sound&precise"
+    With a `shard`, only the samplers with an index in it are constructed, while
+    the ranges and precise set are still the ones of all `num_mcmc` samplers.
     """
 
     p_size = 0
@@ -287,7 +290,7 @@ def setup_mcmc(
                 prec_set_after_distribute.append(item.clone())
 
     mcmc_samplers: list[MCMCSampler] = []
-    for i in range(num_mcmc):
+    for i in range(num_mcmc) if shard is None else shard:
         if i in sp_range:
             spl = MCMCSampler(
                 transfer_func,
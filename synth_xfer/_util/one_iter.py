@@ -1,10 +1,11 @@
+from dataclasses import dataclass, replace
 from time import perf_counter
 
 from xdsl.dialects.builtin import StringAttr
 from xdsl.dialects.func import FuncOp
 
 from synth_xfer._util.cost_model import decide
-from synth_xfer._util.eval_result import EvalResult
+from synth_xfer._util.eval_result import EvalResult, PerBitRes
 from synth_xfer._util.log import get_logger
 from synth_xfer._util.mcmc_sampler import MCMCSampler
 from synth_xfer._util.parse_mlir import HelperFuncs
@@ -47,33 +48,129 @@ def _build_eval_list(
     return lst
 
 
-def synthesize_one_iteration(
+def _optimistic(screened: EvalResult, full: EvalResult) -> EvalResult:
+    """
+    A result at least as sound and as precise as the one on all rows of the
+    transformer `screened` is the result of on some of them, with every other row
+    counted as sound and exact, and as adding nothing to the distance. `full` is
+    the result of any transformer on all rows, for the number of rows and the
+    distance and unsolved cases of the solution set, which are the same for all.
+    """
+
+    full_res = {res.bitwidth: res for res in full.per_bit_res}
+    per_bit_res: list[PerBitRes] = []
+    for res in screened.per_bit_res:
+        all_res = full_res[res.bitwidth]
+        rest = all_res.all_cases - res.all_cases
+        rest_unsolved = all_res.unsolved_cases - res.unsolved_cases
+        per_bit_res.append(
+            replace(
+                res,
+                all_cases=all_res.all_cases,
+                sounds=res.sounds + rest,
+                exacts=res.exacts + rest,
+                base_dist=all_res.base_dist,
+                unsolved_cases=all_res.unsolved_cases,
+                unsolved_exacts=res.unsolved_exacts + rest_unsolved,
+            )
+        )
+
+    return EvalResult(per_bit_res, screened.low_and_med_bw)
+
+
+def _staged_eval(
+    funcs: list[XferFunc],
+    mcmc_samplers: list[MCMCSampler],
+    ps: list[float],
+    inv_temp: int,
+    solution_set: SolutionSet,
+    eval_func: EvalFn,
+    screen_func: EvalFn,
+) -> list[EvalResult | None]:
+    """
+    Evaluate the proposals on the screening rows first, and on all rows only the
+    ones `decide` may accept with the already drawn `ps`. The others are None.
+    A proposal is pruned when `decide` rejects even the cost of its `_optimistic`
+    result, which no cost function puts above its cost on all rows, so pruning
+    never changes a decision.
+    """
+
+    screened = solution_set.eval_improve(funcs, screen_func)
+    keep = [
+        i
+        for i, (spl, res, p) in enumerate(zip(mcmc_samplers, screened, ps))
+        if decide(
+            p,
+            inv_temp,
+            spl.compute_current_cost(),
+            spl.compute_cost(_optimistic(res, spl.current_cmp)),
+        )
+    ]
+
+    results: list[EvalResult | None] = [None for _ in funcs]
+    if keep:
+        full = solution_set.eval_improve([funcs[i] for i in keep], eval_func)
+        for i, res in zip(keep, full):
+            results[i] = res
+
+    return results
+
+
+@dataclass
+class McmcOutcome:
+    """
+    The best transformers each sampler found during an iteration, in sampler order,
+    along with how the time of the MCMC steps was spent. `num_pruned` is None when
+    the proposals were not screened.
+    """
+
+    sound_most_improve_tfs: list[tuple[FuncOp, EvalResult, int]]
+    most_improve_tfs: list[tuple[FuncOp, EvalResult, int]]
+    num_steps: int
+    eval_time: float = 0.0
+    sample_time: float = 0.0
+    decide_time: float = 0.0
+    num_accepted: int = 0
+    num_pruned: int | None = None
+
+
+def log_iteration_start(
+    ith_iter: int,
+    ranges: tuple[range, range, range],
+    program_length: int,
+    num_steps: int,
+) -> None:
+    sp_range, p_range, c_range = ranges
+    logger = get_logger()
+    logger.info(f"\n{'=' * 60}")
+    logger.info(
+        f"Iter {ith_iter}: {len(sp_range) + len(p_range)} synthesis MCMC + {len(c_range)} abduction MCMC,"
+        f" program length {program_length}, {num_steps} steps each"
+    )
+
+
+def run_mcmc(
     ith_iter: int,
     random: Random,
     solution_set: SolutionSet,
-    helper_funcs: HelperFuncs,
     eval_func: EvalFn,
     inv_temp: int,
-    num_unsound_candidates: int,
     ranges: tuple[range, range, range],
     mcmc_samplers: list[MCMCSampler],
     prec_set: list[FuncOp],
-    lbw: list[int],
-    vbw: list[int],
-    solver_kind: SolverKind,
-) -> SolutionSet:
-    "Given ith_iter, performs num_steps mcmc sampling"
+    screen_func: EvalFn | None = None,
+    first: int = 0,
+) -> McmcOutcome:
+    """
+    Performs num_steps mcmc sampling with every sampler.
+    With a `screen_func`, proposals are evaluated in two stages (see _staged_eval).
+    `first` is the index of the first sampler among all samplers of the iteration,
+    for when they are split across processes (see mcmc_pool).
+    """
 
-    iter_start_time = perf_counter()
     logger = get_logger()
 
-    eval_total = 0.0
-    sample_total = 0.0
-    decide_total = 0.0
-
     sp_range, p_range, c_range = ranges
-    num_mcmc = len(sp_range) + len(p_range) + len(c_range)
-    program_length = mcmc_samplers[0].length
     num_steps = mcmc_samplers[0].total_steps
     transfers = [spl.get_current() for spl in mcmc_samplers]
     func_with_cond_lst = _build_eval_list(transfers, sp_range, p_range, c_range, prec_set)
@@ -88,16 +185,17 @@ def synthesize_one_iteration(
     # These 3 lists store "good" transformers during the search
     sound_most_improve_tfs: list[tuple[FuncOp, EvalResult, int]] = []
     most_improve_tfs: list[tuple[FuncOp, EvalResult, int]] = []
-    for i, spl in enumerate(mcmc_samplers):
+    for i, spl in enumerate(mcmc_samplers, first):
         init_tf = spl.current.func.clone()
         init_tf.attributes["number"] = StringAttr(f"{ith_iter}_{0}_{i}")
         sound_most_improve_tfs.append((init_tf, spl.current_cmp, 0))
         most_improve_tfs.append((init_tf, spl.current_cmp, 0))
 
-    logger.info(f"\n{'=' * 60}")
-    logger.info(
-        f"Iter {ith_iter}: {num_mcmc - len(c_range)} synthesis MCMC + {len(c_range)} abduction MCMC,"
-        f" program length {program_length}, {num_steps} steps each"
+    out = McmcOutcome(
+        sound_most_improve_tfs,
+        most_improve_tfs,
+        num_steps,
+        num_pruned=None if screen_func is None else 0,
     )
 
     for rnd in range(num_steps):
@@ -106,21 +204,45 @@ def synthesize_one_iteration(
         func_with_cond_lst = _build_eval_list(
             transfers, sp_range, p_range, c_range, prec_set
         )
-        sample_total += perf_counter() - s
+        out.sample_time += perf_counter() - s
+
+        # the draws for `decide`, made before eval so that staged eval can use them
+        ps = [random.random() for _ in mcmc_samplers]
 
         s = perf_counter()
-        cmp_results = solution_set.eval_improve(func_with_cond_lst, eval_func)
-        eval_total += perf_counter() - s
+        cmp_results: list[EvalResult | None]
+        if screen_func is None:
+            cmp_results = list(solution_set.eval_improve(func_with_cond_lst, eval_func))
+        else:
+            cmp_results = _staged_eval(
+                func_with_cond_lst,
+                mcmc_samplers,
+                ps,
+                inv_temp,
+                solution_set,
+                eval_func,
+                screen_func,
+            )
+        out.eval_time += perf_counter() - s
 
         s = perf_counter()
-        for i, (spl, res) in enumerate(zip(mcmc_samplers, cmp_results)):
+        for i, (spl, res, p) in enumerate(zip(mcmc_samplers, cmp_results, ps)):
+            if res is None:
+                assert out.num_pruned is not None
+                out.num_pruned += 1
+                spl.reject_proposed()
+                continue
+
             proposed_cost = spl.compute_cost(res)
             current_cost = spl.compute_current_cost()
-            decision = decide(random.random(), inv_temp, current_cost, proposed_cost)
+            decision = decide(p, inv_temp, current_cost, proposed_cost)
             if decision:
+                out.num_accepted += 1
                 spl.accept_proposed(res)
                 cloned_func = spl.current.func.clone()
-                cloned_func.attributes["number"] = StringAttr(f"{ith_iter}_{rnd}_{i}")
+                cloned_func.attributes["number"] = StringAttr(
+                    f"{ith_iter}_{rnd}_{first + i}"
+                )
                 tmp_tuple = (cloned_func, res, rnd)
                 # Update sound_most_exact_tfs
                 if (
@@ -146,22 +268,49 @@ def synthesize_one_iteration(
             base_dis = spl.current_cmp.get_base_dist()
             new_dis = spl.current_cmp.get_sound_dist()
             logger.debug(
-                f"{ith_iter}_{rnd}_{i}\t{sound_prop:.2f}%\t{exact_prop:.2f}%\t{base_dis:.2f}->{new_dis:.2f}\t{res_cost:.3f}"
+                f"{ith_iter}_{rnd}_{first + i}\t{sound_prop:.2f}%\t{exact_prop:.2f}%\t{base_dis:.2f}->{new_dis:.2f}\t{res_cost:.3f}"
             )
             cost_data[i].append(res_cost)
 
-        decide_total += perf_counter() - s
+        out.decide_time += perf_counter() - s
 
         # Print the current best result every K rounds
         if rnd % 250 == 100 or rnd == num_steps - 1:
             logger.debug("Sound transformers with most exact outputs:")
-            for i in range(num_mcmc):
+            for i in range(len(mcmc_samplers)):
                 res = sound_most_improve_tfs[i][1]
                 if res.is_sound():
-                    logger.debug(f"{i}_{sound_most_improve_tfs[i][2]}\n{res}")
+                    logger.debug(f"{first + i}_{sound_most_improve_tfs[i][2]}\n{res}")
             logger.debug("Transformers with most unsolved exact outputs:")
-            for i in range(num_mcmc):
-                logger.debug(f"{i}_{most_improve_tfs[i][2]}\n{most_improve_tfs[i][1]}")
+            for i in range(len(mcmc_samplers)):
+                logger.debug(
+                    f"{first + i}_{most_improve_tfs[i][2]}\n{most_improve_tfs[i][1]}"
+                )
+
+    return out
+
+
+def verify_candidates(
+    ith_iter: int,
+    iter_start_time: float,
+    outcome: McmcOutcome,
+    solution_set: SolutionSet,
+    helper_funcs: HelperFuncs,
+    eval_func: EvalFn,
+    num_unsound_candidates: int,
+    ranges: tuple[range, range, range],
+    prec_set: list[FuncOp],
+    lbw: list[int],
+    vbw: list[int],
+    solver_kind: SolverKind,
+) -> SolutionSet:
+    "Verify the best transformers of every sampler and build the next solution set."
+
+    logger = get_logger()
+
+    sp_range, p_range, c_range = ranges
+    sound_most_improve_tfs = outcome.sound_most_improve_tfs
+    most_improve_tfs = outcome.most_improve_tfs
 
     candidates_sp: list[XferFunc] = []
     candidates_p: list[FuncOp] = []
@@ -203,14 +352,85 @@ def synthesize_one_iteration(
     )
     verif_time = perf_counter() - verif_start_time
     iter_time = perf_counter() - iter_start_time
+    num_steps = outcome.num_steps
 
     def perf_str(x: float) -> str:
         return f"{x:.4f}s | avg {x / num_steps:.4f}s | {100 * x / iter_time:.2f}%"
 
     logger.perf(f"Iter {ith_iter} took {iter_time:.4f}s")
-    logger.perf("\tEval took     | " + perf_str(eval_total))
-    logger.perf("\tSampling took | " + perf_str(sample_total))
-    logger.perf("\tDeciding took | " + perf_str(decide_total))
+    logger.perf("\tEval took     | " + perf_str(outcome.eval_time))
+    logger.perf("\tSampling took | " + perf_str(outcome.sample_time))
+    logger.perf("\tDeciding took | " + perf_str(outcome.decide_time))
     logger.perf("\tVerif took    | " + perf_str(verif_time))
 
+    num_proposals = num_steps * len(sound_most_improve_tfs)
+
+    def rate_str(x: int) -> str:
+        # no proposals are made when there was nothing to improve
+        return f"{100 * x / max(num_proposals, 1):.2f}%"
+
+    logger.perf(
+        f"\tAccepted      | {outcome.num_accepted}/{num_proposals} proposals"
+        f" | {rate_str(outcome.num_accepted)}"
+    )
+    if outcome.num_pruned is not None:
+        logger.perf(
+            f"\tStaged eval   | {outcome.num_pruned}/{num_proposals} proposals pruned"
+            f" | {rate_str(outcome.num_pruned)}"
+        )
+
     return new_solution_set
+
+
+def synthesize_one_iteration(
+    ith_iter: int,
+    random: Random,
+    solution_set: SolutionSet,
+    helper_funcs: HelperFuncs,
+    eval_func: EvalFn,
+    inv_temp: int,
+    num_unsound_candidates: int,
+    ranges: tuple[range, range, range],
+    mcmc_samplers: list[MCMCSampler],
+    prec_set: list[FuncOp],
+    lbw: list[int],
+    vbw: list[int],
+    solver_kind: SolverKind,
+    screen_func: EvalFn | None = None,
+) -> SolutionSet:
+    """
+    Given ith_iter, performs num_steps mcmc sampling.
+    With a `screen_func`, proposals are evaluated in two stages (see _staged_eval).
+    """
+
+    iter_start_time = perf_counter()
+
+    log_iteration_start(
+        ith_iter, ranges, mcmc_samplers[0].length, mcmc_samplers[0].total_steps
+    )
+    outcome = run_mcmc(
+        ith_iter,
+        random,
+        solution_set,
+        eval_func,
+        inv_temp,
+        ranges,
+        mcmc_samplers,
+        prec_set,
+        screen_func,
+    )
+
+    return verify_candidates(
+        ith_iter,
+        iter_start_time,
+        outcome,
+        solution_set,
+        helper_funcs,
+        eval_func,
+        num_unsound_candidates,
+        ranges,
+        prec_set,
+        lbw,
+        vbw,
+        solver_kind,
+    )
@@ -107,7 +107,8 @@ def lower_pattern_to_mlir(dag: PatternDag) -> ModuleOp:
     return ModuleOp(ops)
 
 
-@dataclass
+# compared by identity, sessions and caches are keyed by the instance
+@dataclass(eq=False)
 class HelperFuncs:
     conc_ret_ty: TransIntegerType | IntegerType
     conc_arg_ty: tuple[TransIntegerType | IntegerType, ...]
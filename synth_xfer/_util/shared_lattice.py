@@ -0,0 +1,82 @@
+from multiprocessing import Lock, SimpleQueue
+from multiprocessing.shared_memory import SharedMemory
+import os
+
+from synth_xfer._util.eval import Columns
+
+
+class SharedLattices:
+    """
+    The argument columns of exhaustively enumerated bitwidths, kept in shared memory
+    so that all the processes of a benchmark run hold one copy of each lattice.
+
+    The arguments genLows enumerates only depend on the domain and the bitwidths of
+    the arguments, not on the op, and those are spelled out by the name of the
+    `Columns` class, so that is what a lattice is keyed by. The first process to
+    `share` a lattice publishes its arguments, the others attach to them, and all of
+    them drop their own copy. Only the expected results stay per op, and a process
+    that finds a lattice `published` before enumerating it only computes those (see
+    `enum_low_shared`).
+
+    Segments are not tracked, so they outlive the worker that published them, and
+    the process that made the `SharedLattices` unlinks all of them on `close`.
+    Hand it to other processes by inheritance (e.g. as a `Pool` initializer arg).
+    """
+
+    def __init__(self):
+        self._prefix = f"sxf{os.getpid()}_"
+        self._lock = Lock()
+        self._published: SimpleQueue[str] = SimpleQueue()
+        self._segments: dict[str, SharedMemory] = {}
+
+    def __enter__(self) -> "SharedLattices":
+        return self
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def share(self, cols: Columns) -> Columns:
+        "Columns like `cols`, with arguments read from the shared copy of the lattice."
+
+        name = self._prefix + cols.__class__.__name__.removeprefix("Columns")
+        with self._lock:
+            shm = self._attach(name)
+            if shm is None:
+                shm = SharedMemory(name, create=True, size=cols.args_nbytes, track=False)
+                cols.write_args(shm.buf)
+                self._published.put(name)
+                self._segments[name] = shm
+
+        return cols.share_args(shm.buf)
+
+    def published(self, suffix: str) -> memoryview | None:
+        """
+        The arguments of the lattice of the `Columns` class named after `suffix`
+        (see `columns_suffix`), if a process published it, None if none did yet.
+        """
+
+        with self._lock:
+            shm = self._attach(self._prefix + suffix)
+
+        return None if shm is None else shm.buf
+
+    def _attach(self, name: str) -> SharedMemory | None:
+        shm = self._segments.get(name)
+        if shm is None:
+            try:
+                shm = SharedMemory(name, track=False)
+            except FileNotFoundError:
+                return None
+            self._segments[name] = shm
+
+        return shm
+
+    def close(self) -> None:
+        "Unlink every published lattice. Processes attached to one keep their mapping."
+
+        while not self._published.empty():
+            name = self._published.get()
+            try:
+                SharedMemory(name, track=False).unlink()
+            except FileNotFoundError:
+                pass
@@ -1,4 +1,7 @@
 from enum import Enum
+from multiprocessing import get_context
+from multiprocessing.connection import Connection, wait
+from time import monotonic
 from typing import Protocol
 
 import bitwuzla
@@ -103,6 +106,23 @@ class BitwuzlaModel:
         return items
 
 
+class FixedModel:
+    "Fixed values, e.g. a copy of a model that stays valid after its solver moves on."
+
+    def __init__(self, values: dict[str, int]):
+        self._values = dict(values)
+
+    @classmethod
+    def of(cls, model: Model | None) -> "FixedModel":
+        return cls(dict(model.items()) if model is not None else {})
+
+    def get_bv(self, name: str) -> int | None:
+        return self._values.get(name)
+
+    def items(self) -> list[tuple[str, int]]:
+        return list(self._values.items())
+
+
 class IncrementalSolver(Protocol):
     def push(self) -> None: ...
     def pop(self) -> None: ...
@@ -136,6 +156,47 @@ class Z3Solver:
         return Z3Model(self._solver.model())
 
 
+class Z3Optimizer(Z3Solver):
+    """
+    A `Z3Solver` on z3's `Optimize`, which can also find the bounds of a bitvector
+    over all the models directly. Objectives are boxed, so the min and the max come
+    out of one check.
+    """
+
+    def __init__(self, base_smt2: str, timeout: int):
+        self._solver = z3.Optimize()  # type: ignore
+        self._solver.set(timeout=timeout * 1000)
+        self._solver.set(priority="box")
+        self._solver.from_string(_normalize_smt2(base_smt2))
+
+    def bounds(
+        self, name: str, width: int, signed: bool
+    ) -> tuple[bool | None, tuple[int, int] | None]:
+        """
+        Whether the assertions are sat, and if so the min and max of the bitvector
+        constant `name`, as raw bits, compared signed or unsigned.
+        """
+
+        # unsigned order on the bits with the sign flipped is the signed order
+        flip = z3.BitVecVal(2 ** (width - 1) if signed else 0, width)
+        key = z3.BitVec(name, width) ^ flip
+        self._solver.push()
+        try:
+            lo = self._solver.minimize(key)
+            hi = self._solver.maximize(key)
+            result = self._solver.check()
+            if result != z3.sat:
+                return (None if result == z3.unknown else False), None
+
+            flip_bits = flip.as_long()
+            return True, (
+                lo.value().as_long() ^ flip_bits,
+                hi.value().as_long() ^ flip_bits,
+            )
+        finally:
+            self._solver.pop()
+
+
 class CVC5Solver:
     def __init__(self, base_smt2: str, timeout: int):
         self._solver = cvc5.Solver()  # type: ignore
@@ -208,3 +269,63 @@ def make_solver(kind: SolverKind, base_smt2: str, timeout: int) -> IncrementalSo
         return CVC5Solver(base_smt2, timeout)
     if kind == SolverKind.bitwuzla:
         return BitwuzlaSolver(base_smt2, timeout)
+
+
+def _portfolio_worker(
+    kind: SolverKind, smt2: str, timeout: int, conn: Connection
+) -> None:
+    solver = make_solver(kind, smt2, timeout)
+    is_sat = solver.check()
+    model = solver.model() if is_sat else None
+    conn.send((is_sat, None if model is None else model.items()))
+
+
+def check_portfolio(
+    smt2: str, timeout: int, kinds: list[SolverKind] | None = None
+) -> tuple[SolverKind | None, bool | None, Model | None]:
+    """
+    Check `smt2` on a fresh solver of each of `kinds` (all by default) at once, in
+    forked processes, and kill the others as soon as one answers. Returns the kind
+    that answered first, with its answer and model. Solvers that give up or crash
+    do not answer, and if none answers the kind and answer are None. The processes
+    are not daemons, but cannot be started from one (e.g. a `Pool` worker) either.
+    """
+
+    ctx = get_context("fork")
+    procs = []
+    pending: dict[Connection, SolverKind] = {}
+    for kind in kinds if kinds is not None else list(SolverKind):
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_portfolio_worker, args=(kind, smt2, timeout, send))
+        proc.start()
+        send.close()
+        procs.append(proc)
+        pending[recv] = kind
+
+    # the solvers enforce the timeout themselves, this only guards against hangs
+    deadline = monotonic() + timeout + 10
+    try:
+        while pending:
+            ready = wait(list(pending), max(0.0, deadline - monotonic()))
+            if not ready:
+                break
+            for conn in ready:
+                kind = pending.pop(conn)
+                try:
+                    is_sat, items = conn.recv()
+                except EOFError:
+                    continue
+                finally:
+                    conn.close()
+                if is_sat is not None:
+                    model = None if items is None else FixedModel(dict(items))
+                    return kind, is_sat, model
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.kill()
+            proc.join()
+        for conn in pending:
+            conn.close()
+
+    return None, None, None
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 import io
+from time import perf_counter
 from typing import Callable, TypeAlias
 
 from xdsl.dialects.builtin import ModuleOp
@@ -9,12 +11,19 @@ from xdsl.dialects.func import CallOp, FuncOp, ReturnOp
 from synth_xfer._util.dce import dce
 from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.eval_result import EvalResult
+from synth_xfer._util.fuzz_filter import FuzzFilter
 from synth_xfer._util.log import get_logger, write_log_file
 from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.smt_solver import SolverKind
 from synth_xfer._util.synth_context import SynthesizerContext
+from synth_xfer._util.verify_cache import VerifyCache
+from synth_xfer._util.verify_pool import (
+    VerifyPool,
+    VerifyRes,
+    VerifySchedule,
+    verify_at,
+)
 from synth_xfer._util.xfer_func import XferFunc
-from synth_xfer.cli.verify import verify_function
 from synth_xfer.egraph_rewriter.rewriter import rewrite_single_function
 
 
@@ -45,6 +54,10 @@ class SolutionSet:
     """
     domain: AbstractDomain
     optimize: bool
+    verify_pool: VerifyPool | None
+    fuzz_filter: FuzzFilter | None
+    verify_cache: VerifyCache | None
+    verify_schedule: VerifySchedule
 
     def __init__(
         self,
@@ -53,6 +66,10 @@ class SolutionSet:
         domain: AbstractDomain,
         is_perfect: bool = False,
         optimize: bool = True,
+        verify_pool: VerifyPool | None = None,
+        fuzz_filter: FuzzFilter | None = None,
+        verify_cache: VerifyCache | None = None,
+        verify_schedule: VerifySchedule | None = None,
     ):
         _rename_functions(initial_solutions, "partial_solution_")
         self.solutions = initial_solutions
@@ -61,6 +78,12 @@ class SolutionSet:
         self.is_perfect = is_perfect
         self.domain = domain
         self.optimize = optimize
+        self.verify_pool = verify_pool
+        self.fuzz_filter = fuzz_filter
+        self.verify_cache = verify_cache
+        self.verify_schedule = (
+            verify_schedule if verify_schedule is not None else VerifySchedule()
+        )
 
     def eval_improve(
         self,
@@ -216,19 +239,13 @@ class SolutionSet:
                     rewritten.set_name(candidate.name)
                     return rewritten
 
-                def _verify_once(
+                def _check_once(
                     bw: int,
+                    res: VerifyRes,
                     original: XferFunc,
                     rewritten: XferFunc,
                 ) -> bool:
-                    is_sound, _ = verify_function(
-                        bw,
-                        original.build(),
-                        [original.body, original.cond],
-                        helper_funcs,
-                        200,
-                        solver_kind,
-                    )
+                    is_sound, is_sound_rwt = res
                     if is_sound is None:
                         logger.info(
                             f"\tVerification timed out at bw {bw} (body: {body_number}, cond: {cond_number}) — skipping"
@@ -241,27 +258,55 @@ class SolutionSet:
                         if bw in lbw:
                             self.handle_inconsistent_result(original)
                         return False
-                    if self.optimize:
-                        is_sound_rwt, _ = verify_function(
-                            bw,
-                            rewritten.build(),
-                            [rewritten.body, rewritten.cond],
-                            helper_funcs,
-                            200,
-                            solver_kind,
+                    if self.optimize and is_sound != is_sound_rwt:
+                        logger.info(
+                            f"\tInconsistent rewrite at bw {bw}, body: {body_number}, cond: {cond_number} (original: {is_sound}, rewritten: {is_sound_rwt})"
                         )
-                        if is_sound != is_sound_rwt:
-                            logger.info(
-                                f"\tInconsistent rewrite at bw {bw}, body: {body_number}, cond: {cond_number} (original: {is_sound}, rewritten: {is_sound_rwt})"
-                            )
-                            self.handle_unsound_rewrite(original, rewritten)
+                        self.handle_unsound_rewrite(original, rewritten)
 
                     return True
 
                 if (candidate in new_candidates_sp) or (candidate in new_candidates_c):
+                    if self.fuzz_filter is not None:
+                        fuzz_bw = self.fuzz_filter.unsound_bw(candidate)
+                        if fuzz_bw is not None:
+                            logger.info(
+                                f"\tUnsound on fuzzed inputs at bw {fuzz_bw} (body: {body_number}, cond: {cond_number}) — skipping"
+                            )
+                            if fuzz_bw in lbw:
+                                self.handle_inconsistent_result(candidate)
+                            candidates.remove(candidate)
+                            return None
+
                     rewritten = _rewrite(candidate)
-                    for bw in vbw:
-                        if not _verify_once(bw, candidate, rewritten):
+                    to_rewrite = rewritten if self.optimize else None
+
+                    def _verify_in_turn(
+                        bws: list[int],
+                    ) -> Iterator[tuple[int, VerifyRes, float]]:
+                        for bw in bws:
+                            start = perf_counter()
+                            res = verify_at(
+                                bw,
+                                candidate,
+                                to_rewrite,
+                                helper_funcs,
+                                200,
+                                solver_kind,
+                                self.verify_cache,
+                            )
+                            yield bw, res, perf_counter() - start
+
+                    bws = self.verify_schedule.order(vbw, lbw)
+                    if self.verify_pool is None:
+                        results = _verify_in_turn(bws)
+                    else:
+                        results = self.verify_pool.verify(
+                            bws, candidate, to_rewrite, 200, solver_kind
+                        )
+                    for bw, res, seconds in results:
+                        self.verify_schedule.record(bw, seconds)
+                        if not _check_once(bw, res, candidate, rewritten):
                             candidates.remove(candidate)
                             return None
                     return rewritten
@@ -8,7 +8,7 @@ import pandas as pd
 import yaml
 
 from synth_xfer._util.domain import AbstractDomain
-from synth_xfer._util.eval import enum
+from synth_xfer._util.eval import enum, enum_to_file
 from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.random import Random, Sampler
@@ -43,6 +43,9 @@ class EnumMetaData:
         body = self.dump().splitlines()
         return "\n".join("# " + line for line in body)
 
+    def frontmatter(self) -> str:
+        return f"# ---\n{self.dump_commented()}\n# ---\n"
+
     @classmethod
     def parse(cls, text: str) -> "EnumMetaData":
         obj = yaml.safe_load(text) or {}
@@ -124,7 +127,7 @@ class EnumData:
         ).reset_index(drop=True)
 
     def write_tsv(self, path: Path) -> None:
-        frontmatter = f"# ---\n{self.metadata.dump_commented()}\n# ---\n"
+        frontmatter = self.metadata.frontmatter()
 
         with path.open("w") as f:
             f.write(frontmatter)
@@ -137,7 +140,7 @@ class EnumData:
             )
 
     def write_tsv_with_comments(self, path: Path, commented_rows: list[str]) -> None:
-        frontmatter = f"# ---\n{self.metadata.dump_commented()}\n# ---\n"
+        frontmatter = self.metadata.frontmatter()
         with path.open("w") as f:
             f.write(frontmatter)
             for row in commented_rows:
@@ -170,6 +173,31 @@ class EnumData:
         return cls(metadata, frame)
 
 
+def enum_metadata(
+    domain: AbstractDomain,
+    op: PatternDag,
+    helpers: HelperFuncs,
+    lbw: list[int],
+    mbw: list[tuple[int, int]],
+    hbw: list[tuple[int, int, int]],
+    seed: int | None,
+) -> EnumMetaData:
+    "The metadata of a dataset, with a random seed drawn if `seed` is None."
+
+    random = Random(seed)
+    resolved_seed = random.randint(0, 2**32 - 1) if seed is None else seed
+
+    return EnumMetaData(
+        domain=domain,
+        op=op,
+        arity=len(helpers.conc_arg_ty),
+        seed=resolved_seed,
+        lbw=lbw,
+        mbw=mbw,
+        hbw=hbw,
+    )
+
+
 def build_enum_data(
     domain: AbstractDomain,
     op: PatternDag,
@@ -180,28 +208,47 @@ def build_enum_data(
     sampler: Sampler,
 ) -> EnumData:
     helpers = HelperFuncs(op, domain)
-    random = Random(seed)
-    resolved_seed = random.randint(0, 2**32 - 1) if seed is None else seed
-    arity = len(helpers.conc_arg_ty)
+    metadata = enum_metadata(domain, op, helpers, lbw, mbw, hbw, seed)
+    assert metadata.seed is not None
 
-    to_eval = enum(lbw, mbw, hbw, resolved_seed, helpers, sampler)
+    to_eval = enum(lbw, mbw, hbw, metadata.seed, helpers, sampler)
 
     rows = []
     for bw, xs in to_eval.items():
         for fn_args, ideal in xs:
             rows.append((bw, *fn_args, ideal))
 
-    cols = ["bw"] + [f"arg_{i}" for i in range(arity)] + ["ideal"]
+    cols = ["bw"] + [f"arg_{i}" for i in range(metadata.arity)] + ["ideal"]
     df = pd.DataFrame.from_records(rows, columns=cols)
 
-    metadata = EnumMetaData(
-        domain=domain,
-        op=op,
-        arity=arity,
-        seed=resolved_seed,
-        lbw=lbw,
-        mbw=mbw,
-        hbw=hbw,
-    )
-
     return EnumData(metadata, df)
+
+
+def write_enum_tsv(
+    path: Path,
+    domain: AbstractDomain,
+    op: PatternDag,
+    lbw: list[int],
+    mbw: list[tuple[int, int]],
+    hbw: list[tuple[int, int, int]],
+    seed: int | None,
+    sampler: Sampler,
+) -> EnumMetaData:
+    """
+    Write the file `build_enum_data(...).write_tsv(path)` would, but streamed from
+    the eval engine as the rows are generated, so the dataset is never all held in
+    memory (as a DataFrame or otherwise).
+    """
+
+    helpers = HelperFuncs(op, domain)
+    metadata = enum_metadata(domain, op, helpers, lbw, mbw, hbw, seed)
+    assert metadata.seed is not None
+
+    cols = ["bw"] + [f"arg_{i}" for i in range(metadata.arity)] + ["ideal"]
+    with path.open("w") as f:
+        f.write(metadata.frontmatter())
+        f.write("\t".join(cols) + "\n")
+
+    enum_to_file(path, lbw, mbw, hbw, metadata.seed, helpers, sampler)
+
+    return metadata
@@ -1,4 +1,6 @@
+from collections import Counter
 from io import StringIO
+from weakref import WeakKeyDictionary
 
 from xdsl.context import Context
 from xdsl.dialects.builtin import FunctionType, IntegerType, ModuleOp
@@ -42,7 +44,15 @@ from xdsl_smt.utils.transfer_function_util import (
     TransferFunction,
 )
 
-from synth_xfer._util.smt_solver import Model, SolverKind, make_solver
+from synth_xfer._util.parse_mlir import HelperFuncs
+from synth_xfer._util.smt_solver import (
+    FixedModel,
+    IncrementalSolver,
+    Model,
+    SolverKind,
+    check_portfolio,
+    make_solver,
+)
 
 
 def _to_smtlib(ctx: Context, op: ModuleOp) -> str:
@@ -56,21 +66,134 @@ def _to_smtlib(ctx: Context, op: ModuleOp) -> str:
     return stream.getvalue()
 
 
-def _verify_pattern(
-    ctx: Context,
-    op: ModuleOp,
-    timeout: int,
-    solver_kind: SolverKind,
-) -> tuple[bool | None, Model | None]:
-    solver = make_solver(solver_kind, _to_smtlib(ctx, op), timeout)
+def _smt2_commands(text: str) -> list[str]:
+    "The top level commands of an SMT-LIB script, without the `check-sat`s."
+
+    commands: list[str] = []
+    depth = start = i = 0
+    while i < len(text):
+        c = text[i]
+        if c == ";":
+            i = text.find("\n", i)
+            if i < 0:
+                break
+        elif c in '|"':
+            i = text.index(c, i + 1)
+        elif c == "(":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                commands.append(text[start : i + 1])
+        i += 1
+
+    return [x for x in commands if x != "(check-sat)"]
+
+
+def _check(solver: IncrementalSolver) -> tuple[bool | None, Model | None]:
     is_sat = solver.check()
     if is_sat is None:
         return None, None
     if is_sat:
-        return False, solver.model()
+        return False, FixedModel.of(solver.model())
     return True, None
 
 
+class _IncrementalQueries:
+    """
+    The soundness queries of a session at one width, checked on a solver that is
+    kept across queries.
+
+    Queries only differ in the transformer, and its part of a query comes after
+    the declarations and the asserts of the domain, instance and op constraints,
+    which are the same for every transformer. The first query at a width is
+    checked on a fresh solver. The second one builds the base solver from the
+    commands the two have in common, and from then on a query that starts with
+    that base only adds the rest of its commands inside a `push`/`pop`. A query
+    that does not gets a new base, shared with the query before it, and one that
+    would declare something of its own is checked on a fresh solver.
+
+    `stats` counts how each query was checked: "fresh", "rebuilt" (on a new
+    base) or "reused" (on the base as it was).
+    """
+
+    solver_kind: SolverKind
+    timeout: int
+    stats: Counter[str]
+
+    def __init__(self, solver_kind: SolverKind, timeout: int, stats: Counter[str]):
+        self.solver_kind = solver_kind
+        self.timeout = timeout
+        self.stats = stats
+        self._solver: IncrementalSolver | None = None
+        self._header: list[str] = []
+        self._base: list[str] = []
+        self._last: list[str] = []
+
+    def check(self, smt2: str) -> tuple[bool | None, Model | None]:
+        commands = _smt2_commands(smt2)
+        header = [x for x in commands if x.startswith("(set-")]
+        body = [x for x in commands if not x.startswith("(set-")]
+        last, self._last = self._last, body
+
+        n = len(self._base)
+        if self._solver is not None and header == self._header and body[:n] == self._base:
+            outcome = "reused"
+        else:
+            n = 0
+            if header == self._header:
+                while n < min(len(body), len(last)) and body[n] == last[n]:
+                    n += 1
+
+            self._header = header
+            self._base = body[:n]
+            self._solver = None
+            if n > 0:
+                self._solver = make_solver(
+                    self.solver_kind, "\n".join(header + self._base), self.timeout
+                )
+            outcome = "rebuilt"
+
+        rest = body[n:]
+        if self._solver is None or any(
+            x.startswith(("(declare-", "(define-")) for x in rest
+        ):
+            self.stats["fresh"] += 1
+            return _check(make_solver(self.solver_kind, smt2, self.timeout))
+
+        self.stats[outcome] += 1
+        self._solver.push()
+        try:
+            if rest:
+                self._solver.add_smt2("\n".join(rest))
+            return _check(self._solver)
+        finally:
+            self._solver.pop()
+
+
+class _PortfolioQueries:
+    "Soundness queries checked with `check_portfolio`, counting the wins of each solver."
+
+    timeout: int
+    wins: Counter[SolverKind]
+
+    def __init__(self, timeout: int, wins: Counter[SolverKind]):
+        self.timeout = timeout
+        self.wins = wins
+
+    def check(self, smt2: str) -> tuple[bool | None, Model | None]:
+        kind, is_sat, model = check_portfolio(smt2, self.timeout)
+        if kind is None:
+            return None, None
+
+        self.wins[kind] += 1
+        if is_sat:
+            return False, model
+        return True, None
+
+
 def lower_to_smt_module(module: ModuleOp, width: int, ctx: Context):
     SMTLowerer.rewrite_patterns = {**func_to_smt_patterns}
     SMTLowerer.type_lowerers = {
@@ -131,15 +254,13 @@ def _create_smt_function(func: FuncOp, width: int, ctx: Context) -> DefineFunOp:
     return resultFunc
 
 
-def _soundness_check(
+def _soundness_query(
     smt_transfer_function: SMTTransferFunction,
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     int_attr: dict[int, int],
     ctx: Context,
-    timeout: int,
-    solver_kind: SolverKind,
-) -> tuple[bool | None, Model | None]:
+) -> str:
     query_module = ModuleOp([])
     if smt_transfer_function.is_forward:
         added_ops: list[Operation] = forward_soundness_check(
@@ -158,7 +279,7 @@ def _soundness_check(
     query_module.body.block.add_ops(added_ops)
     FunctionCallInline(True, {}).apply(ctx, query_module)
 
-    return _verify_pattern(ctx, query_module, timeout, solver_kind)
+    return _to_smtlib(ctx, query_module)
 
 
 def _verify_smt_transfer_function(
@@ -166,49 +287,29 @@ def _verify_smt_transfer_function(
     domain_constraint: FunctionCollection,
     instance_constraint: FunctionCollection,
     ctx: Context,
-    timeout: int,
-    solver_kind: SolverKind,
+    queries: _IncrementalQueries | _PortfolioQueries,
 ) -> tuple[bool | None, Model | None]:
     assert smt_transfer_function.concrete_function is not None
     assert smt_transfer_function.transfer_function is not None
 
     int_attr: dict[int, int] = {}
-    soundness_result = _soundness_check(
+    query = _soundness_query(
         smt_transfer_function,
         domain_constraint,
         instance_constraint,
         int_attr,
         ctx,
-        timeout,
-        solver_kind,
     )
 
-    return soundness_result
+    return queries.check(query)
 
 
-def _build_init_module(
-    transfer_function: FuncOp,
-    concrete_func: FuncOp,
-    helper_funcs: list[FuncOp],
-    ctx: Context,
-):
+def _check_unique_names(funcs: list[FuncOp]) -> dict[str, FuncOp]:
     func_name_to_func: dict[str, FuncOp] = {}
-    module_op = ModuleOp([])
-    functions: list[FuncOp] = [transfer_function.clone()]
-    functions.append(_add_poison_to_conc_fn(concrete_func))
-    module_op.body.block.add_ops(functions + [func.clone() for func in helper_funcs])
-    domain_constraint: FunctionCollection | None = None
-    instance_constraint: FunctionCollection | None = None
-    transfer_function_obj: TransferFunction | None = None
-    transfer_function_name = transfer_function.sym_name.data
-    for func in module_op.ops:
-        assert isinstance(func, FuncOp)
+    for func in funcs:
         func_name = func.sym_name.data
         if func_name in func_name_to_func:
-            print(
-                [func.sym_name.data for func in helper_funcs]
-                + [transfer_function.sym_name.data]
-            )
+            print([func.sym_name.data for func in funcs])
             raise ValueError("Found function with the same name in the input")
 
         func_name_to_func[func_name] = func
@@ -222,27 +323,186 @@ def _build_init_module(
         assert return_op.operands[0].type == func.function_type.outputs.data[0]
         # End of check function type
 
-        if func_name == transfer_function_name:
-            assert transfer_function_obj is None
-            transfer_function_obj = TransferFunction(func)
-        if func_name == "is_not_bottom":
-            assert domain_constraint is None
-            domain_constraint = FunctionCollection(func, _create_smt_function, ctx)
-        elif func_name == "abstract_val_contains":
-            assert instance_constraint is None
-            instance_constraint = FunctionCollection(func, _create_smt_function, ctx)
-
-    assert domain_constraint is not None
-    assert instance_constraint is not None
-    assert transfer_function_obj is not None
-
-    func_name_to_func[transfer_function.sym_name.data] = transfer_function
-    return (
-        module_op,
-        func_name_to_func,
-        transfer_function_obj,
-        domain_constraint,
-        instance_constraint,
+    return func_name_to_func
+
+
+class VerifierSession:
+    """
+    Verifies transformers against one concrete op and a fixed set of helpers (the
+    domain functions and the op constraints).
+
+    Everything but the transformer is the same for every query at a given width,
+    so it is inlined once, and lowered to SMT once per width: the concrete op, the
+    op constraints, and the domain and instance constraints. A query then only
+    inlines, unrolls and lowers the transformer and its own helpers (`xfer_helpers`,
+    e.g. the body and condition of a guarded transformer), and gets clones of the
+    cached lowered functions.
+
+    The queries are checked incrementally, on one solver per width (and solver and
+    timeout) that already holds the constraints, see `_IncrementalQueries`, which
+    tallies how the queries ran in `query_stats`. The models of unsound
+    transformers are copies, so they outlive the check.
+
+    With `portfolio` set, every query is instead given to all the solvers at once
+    (see `check_portfolio`), whatever the solver asked for, and `wins` counts the
+    queries each solver answered first.
+    """
+
+    ctx: Context
+    concrete_func: FuncOp
+    portfolio: bool
+    wins: Counter[SolverKind]
+
+    def __init__(self, concrete_func: FuncOp, helper_funcs: list[FuncOp]):
+        self.ctx = Context()
+        self.concrete_func = concrete_func
+        self.portfolio = False
+        self.wins = Counter()
+
+        funcs = [_add_poison_to_conc_fn(concrete_func)]
+        funcs += [func.clone() for func in helper_funcs]
+        self._helpers = _check_unique_names(funcs)
+        if "is_not_bottom" not in self._helpers:
+            raise ValueError("VerifierSession needs the is_not_bottom helper")
+        if "abstract_val_contains" not in self._helpers:
+            raise ValueError("VerifierSession needs the abstract_val_contains helper")
+
+        FunctionCallInline(False, self._helpers).apply(self.ctx, ModuleOp(funcs))
+
+        self._lowered: dict[int, dict[str, DefineFunOp]] = {}
+        self._constraints: dict[tuple[str, int], DefineFunOp] = {}
+        self._queries: dict[tuple[int, SolverKind, int], _IncrementalQueries] = {}
+        self.query_stats: Counter[str] = Counter()
+
+    def _lowered_helpers(self, width: int) -> dict[str, DefineFunOp]:
+        "The helpers lowered as a module at `width`, like the transformer."
+
+        if width not in self._lowered:
+            module = ModuleOp([func.clone() for func in self._helpers.values()])
+            UnrollTransferLoop(width).apply(self.ctx, module)
+            lower_to_smt_module(module, width, self.ctx)
+
+            lowered: dict[str, DefineFunOp] = {}
+            for op in module.ops:
+                if isinstance(op, DefineFunOp) and op.fun_name is not None:
+                    lowered[op.fun_name.data] = op
+            self._lowered[width] = lowered
+
+        return self._lowered[width]
+
+    def _create_constraint(self, func: FuncOp, width: int, ctx: Context) -> DefineFunOp:
+        "A cached `_create_smt_function` for the constraint `FunctionCollection`s."
+
+        key = (func.sym_name.data, width)
+        if key not in self._constraints:
+            self._constraints[key] = _create_smt_function(func, width, ctx)
+
+        return self._constraints[key].clone()
+
+    def verify(
+        self,
+        transfer_function: FuncOp,
+        xfer_helpers: list[FuncOp],
+        width: int,
+        timeout: int,
+        solver_kind: SolverKind,
+    ) -> tuple[bool | None, Model | None]:
+        ctx = self.ctx
+        transfer_clone = transfer_function.clone()
+        funcs = [transfer_clone] + [func.clone() for func in xfer_helpers]
+        func_name_to_func = _check_unique_names(funcs + list(self._helpers.values()))
+        transfer_function_obj = TransferFunction(transfer_clone)
+
+        module_op = ModuleOp(funcs)
+        FunctionCallInline(False, func_name_to_func).apply(ctx, module_op)
+
+        smt_module = ModuleOp([transfer_clone.clone()])
+        UnrollTransferLoop(width).apply(ctx, smt_module)
+        lower_to_smt_module(smt_module, width, ctx)
+        smt_transfer_function = smt_module.ops.first
+        assert isinstance(smt_transfer_function, DefineFunOp)
+
+        lowered = self._lowered_helpers(width)
+        concrete_func_name = self.concrete_func.sym_name.data
+        smt_concrete_func = lowered.get(concrete_func_name, None)
+        assert smt_concrete_func is not None
+
+        def lowered_clone(name: str) -> DefineFunOp | None:
+            op = lowered.get(name, None)
+            return None if op is None else op.clone()
+
+        smt_transfer_function_obj = SMTTransferFunction(
+            transfer_function_obj,
+            transfer_function.sym_name.data,
+            concrete_func_name,
+            lowered_clone("abs_op_constraint"),
+            lowered_clone("op_constraint"),
+            None,
+            None,
+            None,
+            None,
+            smt_transfer_function,
+            smt_concrete_func.clone(),
+        )
+        domain_constraint = FunctionCollection(
+            self._helpers["is_not_bottom"], self._create_constraint, ctx
+        )
+        instance_constraint = FunctionCollection(
+            self._helpers["abstract_val_contains"], self._create_constraint, ctx
+        )
+
+        if self.portfolio:
+            queries = _PortfolioQueries(timeout, self.wins)
+        else:
+            queries = self._queries.setdefault(
+                (width, solver_kind, timeout),
+                _IncrementalQueries(solver_kind, timeout, self.query_stats),
+            )
+
+        return _verify_smt_transfer_function(
+            smt_transfer_function_obj,
+            domain_constraint,
+            instance_constraint,
+            ctx,
+            queries,
+        )
+
+
+_SESSIONS: WeakKeyDictionary[HelperFuncs, VerifierSession] = WeakKeyDictionary()
+
+
+def verifier_session(helper_funcs: HelperFuncs) -> VerifierSession:
+    "The session `verify_function` uses for `helper_funcs`, made on first use."
+
+    if helper_funcs not in _SESSIONS:
+        helpers = [
+            helper_funcs.get_top_func,
+            helper_funcs.instance_constraint_func,
+            helper_funcs.domain_constraint_func,
+            helper_funcs.op_constraint_func,
+            helper_funcs.meet_func,
+        ]
+        _SESSIONS[helper_funcs] = VerifierSession(
+            helper_funcs.crt_func, [x for x in helpers if x is not None]
+        )
+
+    return _SESSIONS[helper_funcs]
+
+
+def verify_function(
+    bw: int,
+    func: FuncOp,
+    xfer_helpers: list[FuncOp | None],
+    helper_funcs: HelperFuncs,
+    timeout: int,
+    solver_kind: SolverKind = SolverKind.bitwuzla,
+) -> tuple[bool | None, Model | None]:
+    return verifier_session(helper_funcs).verify(
+        func,
+        [x for x in xfer_helpers if x is not None],
+        bw,
+        timeout,
+        solver_kind,
     )
 
 
@@ -254,66 +514,8 @@ def verify_transfer_function(
     timeout: int,
     solver_kind: SolverKind,
 ) -> tuple[bool | None, Model | None]:
-    ctx = Context()
+    "Verify one transformer, see `VerifierSession` to verify many."
 
-    (
-        module_op,
-        func_name_to_func,
-        transfer_function_obj,
-        domain_constraint,
-        instance_constraint,
-    ) = _build_init_module(transfer_function, concrete_func, helper_funcs, ctx)
-
-    FunctionCallInline(False, func_name_to_func).apply(ctx, module_op)
-
-    smt_module = module_op.clone()
-
-    # expand for loops
-    unrollTransferLoop = UnrollTransferLoop(width)
-    assert isinstance(smt_module, ModuleOp)
-    unrollTransferLoop.apply(ctx, smt_module)
-
-    concrete_func_name: str = concrete_func.sym_name.data
-    assert concrete_func_name is not None
-
-    lower_to_smt_module(smt_module, width, ctx)
-
-    func_name_to_smt_func: dict[str, DefineFunOp] = {}
-    for op in smt_module.ops:
-        if isinstance(op, DefineFunOp):
-            op_func_name = op.fun_name
-            assert op_func_name is not None
-            func_name = op_func_name.data
-            func_name_to_smt_func[func_name] = op
-
-    func_name = transfer_function.sym_name.data
-    assert func_name is not None
-
-    smt_concrete_func = func_name_to_smt_func.get(concrete_func_name, None)
-    assert smt_concrete_func is not None
-    smt_transfer_function = func_name_to_smt_func.get(func_name, None)
-    abs_op_constraint = func_name_to_smt_func.get("abs_op_constraint", None)
-    op_constraint = func_name_to_smt_func.get("op_constraint", None)
-
-    smt_transfer_function_obj = SMTTransferFunction(
-        transfer_function_obj,
-        func_name,
-        concrete_func_name,
-        abs_op_constraint,
-        op_constraint,
-        None,
-        None,
-        None,
-        None,
-        smt_transfer_function,
-        smt_concrete_func,
-    )
-
-    return _verify_smt_transfer_function(
-        smt_transfer_function_obj,
-        domain_constraint,
-        instance_constraint,
-        ctx,
-        timeout,
-        solver_kind,
+    return VerifierSession(concrete_func, helper_funcs).verify(
+        transfer_function, [], width, timeout, solver_kind
     )
@@ -0,0 +1,150 @@
+import json
+import os
+from pathlib import Path
+import sqlite3
+
+from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.parse_mlir import HelperFuncs
+from synth_xfer._util.pattern_dsl import PatternDag
+from synth_xfer._util.smt_solver import FixedModel, Model, SolverKind
+from synth_xfer._util.verifier import verifier_session, verify_function
+from synth_xfer._util.xfer_func import XferFunc
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verify (
+    domain TEXT NOT NULL,
+    op TEXT NOT NULL,
+    xfer TEXT NOT NULL,
+    bw INTEGER NOT NULL,
+    solver TEXT NOT NULL,
+    sound INTEGER,
+    timeout INTEGER NOT NULL,
+    model TEXT,
+    PRIMARY KEY (domain, op, xfer, bw, solver)
+)
+"""
+
+
+class VerifyCache:
+    """
+    Verification results of the transformers for one op and domain, persisted in
+    an SQLite database at `path` so that a transformer is verified at most once per
+    bitwidth and solver, across iterations and across runs. Transformers are keyed
+    by their `structural_hash`, so renaming them or proposing them again hits the
+    cache. Counterexamples are stored with unsound results.
+
+    Answers of a portfolio (see `VerifierSession.portfolio`) come from whichever
+    solver was first, so they are stored apart from those of every single solver,
+    under the solver name "portfolio".
+
+    A timeout is only reused for queries with at most the timeout it was hit with,
+    and is replaced once the transformer is verified with a longer one.
+
+    The database may be shared by concurrent runs. Every process opens its own
+    connection on first use, so a cache can be inherited by forked workers.
+    """
+
+    path: Path
+    domain: AbstractDomain
+    op: str
+
+    def __init__(self, path: Path, domain: AbstractDomain, op: PatternDag):
+        self.path = path
+        self.domain = domain
+        self.op = str(op)
+        self._conn: sqlite3.Connection | None = None
+        self._pid = -1
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+            self._conn.commit()
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def _key(self, key: str, bw: int, solver_kind: SolverKind, portfolio: bool) -> tuple:
+        solver = "portfolio" if portfolio else str(solver_kind)
+        return (str(self.domain), self.op, key, bw, solver)
+
+    def get(
+        self,
+        key: str,
+        bw: int,
+        solver_kind: SolverKind,
+        timeout: int,
+        portfolio: bool = False,
+    ) -> tuple[bool | None, Model | None] | None:
+        "The result stored for the transformer with hash `key`, None if there is none."
+
+        row = (
+            self._db()
+            .execute(
+                "SELECT sound, timeout, model FROM verify WHERE domain = ? AND op = ?"
+                " AND xfer = ? AND bw = ? AND solver = ?",
+                self._key(key, bw, solver_kind, portfolio),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+
+        sound, cached_timeout, model = row
+        if sound is None:
+            return (None, None) if timeout <= cached_timeout else None
+        if model is None:
+            return bool(sound), None
+
+        return bool(sound), FixedModel(dict(json.loads(model)))
+
+    def put(
+        self,
+        key: str,
+        bw: int,
+        solver_kind: SolverKind,
+        timeout: int,
+        res: tuple[bool | None, Model | None],
+        portfolio: bool = False,
+    ) -> None:
+        is_sound, model = res
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO verify VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                *self._key(key, bw, solver_kind, portfolio),
+                None if is_sound is None else int(is_sound),
+                timeout,
+                None if model is None else json.dumps(model.items()),
+            ),
+        )
+        db.commit()
+
+    def verify(
+        self,
+        bw: int,
+        xfer: XferFunc,
+        helper_funcs: HelperFuncs,
+        timeout: int,
+        solver_kind: SolverKind,
+    ) -> tuple[bool | None, Model | None]:
+        "`verify_function` for `xfer`, through the cache."
+
+        key = xfer.structural_hash()
+        portfolio = verifier_session(helper_funcs).portfolio
+        cached = self.get(key, bw, solver_kind, timeout, portfolio)
+        if cached is not None:
+            return cached
+
+        res = verify_function(
+            bw, xfer.build(), [xfer.body, xfer.cond], helper_funcs, timeout, solver_kind
+        )
+        self.put(key, bw, solver_kind, timeout, res, portfolio)
+
+        return res
@@ -0,0 +1,309 @@
+import atexit
+from collections import Counter
+from dataclasses import dataclass
+from multiprocessing import get_context
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+import os
+import signal
+from time import perf_counter
+
+from synth_xfer._util.parse_mlir import HelperFuncs, parse_mlir_func
+from synth_xfer._util.smt_solver import SolverKind
+from synth_xfer._util.verifier import verifier_session, verify_function
+from synth_xfer._util.verify_cache import VerifyCache
+from synth_xfer._util.xfer_func import XferFunc
+
+VerifyRes = tuple[bool | None, bool | None]
+
+
+def verify_at(
+    bw: int,
+    original: XferFunc,
+    rewritten: XferFunc | None,
+    helper_funcs: HelperFuncs,
+    timeout: int,
+    solver_kind: SolverKind,
+    cache: VerifyCache | None = None,
+) -> VerifyRes:
+    """
+    Verify `original` at `bw`, and if it is sound also `rewritten` (if any).
+    Returns whether each is sound, None for a timeout or when not verified.
+    """
+
+    def verify(f: XferFunc) -> bool | None:
+        if cache is not None:
+            return cache.verify(bw, f, helper_funcs, timeout, solver_kind)[0]
+
+        is_sound, _ = verify_function(
+            bw, f.build(), [f.body, f.cond], helper_funcs, timeout, solver_kind
+        )
+        return is_sound
+
+    is_sound = verify(original)
+    if not is_sound or rewritten is None:
+        return is_sound, None
+
+    return is_sound, verify(rewritten)
+
+
+class VerifySchedule:
+    """
+    The order a candidate is verified at its bitwidths in, learned from how long
+    each bitwidth took so far.
+
+    Unsound candidates nearly always fail at small bitwidths, while the large ones
+    take most of the solving time. So the `num_first` smallest bitwidths always go
+    first, smallest to largest, then those with no history yet (in order), and then
+    the rest from the fastest to the slowest on average, so that a failure is found
+    as early and as cheaply as possible.
+
+    The bitwidths of `lbw` go before all of those: the eval engine found the
+    candidate sound on them exhaustively, so a failure there is an inconsistency,
+    which must not go unnoticed by stopping at a failure somewhere else first.
+    """
+
+    num_first: int
+
+    def __init__(self, num_first: int = 2):
+        self.num_first = num_first
+        self._times: dict[int, tuple[int, float]] = {}
+
+    def order(self, vbw: list[int], lbw: list[int] = []) -> list[int]:
+        low = sorted(bw for bw in vbw if bw in lbw)
+        bws = sorted(bw for bw in vbw if bw not in lbw)
+        first, rest = bws[: self.num_first], bws[self.num_first :]
+        new = [bw for bw in rest if bw not in self._times]
+        seen = sorted(
+            (bw for bw in rest if bw in self._times), key=lambda bw: self.mean(bw)
+        )
+
+        return low + first + new + seen
+
+    def record(self, bw: int, seconds: float) -> None:
+        count, total = self._times.get(bw, (0, 0.0))
+        self._times[bw] = (count + 1, total + seconds)
+
+    def mean(self, bw: int) -> float:
+        count, total = self._times[bw]
+        return total / count
+
+    def __str__(self) -> str:
+        return " | ".join(
+            f"{bw}: {self.mean(bw):.3f}s x{self._times[bw][0]}"
+            for bw in sorted(self._times)
+        )
+
+
+_XferText = tuple[str, str, str | None]
+_Task = tuple[int, _XferText, _XferText | None, int, SolverKind]
+_TaskRes = tuple[VerifyRes, float, Counter[SolverKind]]
+
+
+def _to_text(f: XferFunc) -> _XferText:
+    return f.name, str(f.body), None if f.cond is None else str(f.cond)
+
+
+def _from_text(x: _XferText) -> XferFunc:
+    name, body, cond = x
+    f = XferFunc(parse_mlir_func(body), None if cond is None else parse_mlir_func(cond))
+    f.name = name
+
+    return f
+
+
+def _worker_loop(
+    conn: Connection, helper_funcs: HelperFuncs, cache: VerifyCache | None
+) -> None:
+    "Run `verify_at` for the tasks on `conn` until it sends None or is closed."
+
+    # in a group of its own, so that killing the group also kills the solver
+    # processes of a portfolio
+    os.setpgrp()
+    wins = verifier_session(helper_funcs).wins
+    while True:
+        try:
+            task: _Task | None = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        bw, original, rewritten, timeout, solver_kind = task
+        before = wins.copy()
+        start = perf_counter()
+        try:
+            res = verify_at(
+                bw,
+                _from_text(original),
+                None if rewritten is None else _from_text(rewritten),
+                helper_funcs,
+                timeout,
+                solver_kind,
+                cache,
+            )
+        except Exception as e:
+            conn.send(e)
+            continue
+
+        result: _TaskRes = (res, perf_counter() - start, wins - before)
+        conn.send(result)
+
+
+@dataclass
+class _Worker:
+    proc: BaseProcess
+    conn: Connection
+    task: int | None = None
+
+
+class VerifyPool:
+    """
+    Verifies a candidate at several bitwidths at once, one task per bitwidth on
+    `num_procs` forked worker processes. The tasks are handed out in the order
+    given (see `VerifySchedule`), and once one is not sound (or times out) and all
+    the tasks before it finished, everything else is stopped: the tasks not started
+    yet are dropped, and the workers still solving are killed, along with their
+    portfolio solvers, and forked again.
+    Results are reported in task order for the tasks before the first failure, and
+    then the failure, as if the bitwidths had been verified one at a time up to it.
+
+    The workers verify through `cache`, if given, and the portfolio wins of the
+    workers are added to the session of the parent. They are not daemons, so they
+    can run a portfolio, and `close` (also called at exit) stops them.
+    """
+
+    num_procs: int
+
+    def __init__(
+        self,
+        num_procs: int,
+        helper_funcs: HelperFuncs,
+        cache: VerifyCache | None = None,
+    ):
+        if num_procs < 1:
+            raise ValueError("VerifyPool needs at least one process")
+
+        self.num_procs = num_procs
+        self._helper_funcs = helper_funcs
+        self._cache = cache
+        self._ctx = get_context("fork")
+        self._workers = [self._spawn() for _ in range(num_procs)]
+        atexit.register(self.close)
+
+    def __enter__(self) -> "VerifyPool":
+        return self
+
+    def __exit__(self, _exc_type, _exc, _tb) -> None:
+        self.close()
+
+    def _spawn(self) -> _Worker:
+        conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_loop, args=(child_conn, self._helper_funcs, self._cache)
+        )
+        proc.start()
+        child_conn.close()
+
+        return _Worker(proc, conn)
+
+    @staticmethod
+    def _kill(w: _Worker) -> None:
+        "Kill a busy worker and the solver processes it started, and reap it."
+
+        assert w.proc.pid is not None
+        try:
+            os.killpg(w.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # not in its own group yet, so it has not started any solver either
+            w.proc.kill()
+        w.proc.join()
+
+    def close(self) -> None:
+        for w in self._workers:
+            if w.task is None:
+                try:
+                    w.conn.send(None)
+                except OSError:
+                    pass
+            else:
+                self._kill(w)
+        for w in self._workers:
+            w.proc.join()
+            w.conn.close()
+        self._workers = []
+        atexit.unregister(self.close)
+
+    def verify(
+        self,
+        bws: list[int],
+        original: XferFunc,
+        rewritten: XferFunc | None,
+        timeout: int,
+        solver_kind: SolverKind,
+    ) -> list[tuple[int, VerifyRes, float]]:
+        """
+        `verify_at` every bw of `bws`, with the seconds each took, up to and
+        including the first failure in the order of `bws`.
+        """
+
+        original_text = _to_text(original)
+        rewritten_text = None if rewritten is None else _to_text(rewritten)
+        wins = verifier_session(self._helper_funcs).wins
+
+        done: dict[int, tuple[VerifyRes, float]] = {}
+        failed: int | None = None
+        error: Exception | None = None
+        next_task = 0
+
+        # a failure only ends the run once every task before it is done, so a later
+        # task that happens to fail first cannot hide an earlier failure
+        def num_needed() -> int:
+            return len(bws) if failed is None else failed
+
+        def finished() -> bool:
+            return all(i in done for i in range(num_needed()))
+
+        while error is None and not finished():
+            for w in self._workers:
+                if w.task is None and next_task < num_needed():
+                    task: _Task = (
+                        bws[next_task],
+                        original_text,
+                        rewritten_text,
+                        timeout,
+                        solver_kind,
+                    )
+                    w.conn.send(task)
+                    w.task = next_task
+                    next_task += 1
+
+            busy = {w.conn: w for w in self._workers if w.task is not None}
+            for conn in wait(list(busy)):
+                w = busy[conn]
+                i, w.task = w.task, None
+                assert i is not None
+                msg: _TaskRes | Exception = conn.recv()
+                if isinstance(msg, Exception):
+                    error = msg
+                    continue
+
+                res, seconds, task_wins = msg
+                wins.update(task_wins)
+                done[i] = res, seconds
+                if not res[0] and (failed is None or i < failed):
+                    failed = i
+
+        # stop the tasks still running, they cannot change the outcome
+        for k, w in enumerate(self._workers):
+            if w.task is not None:
+                self._kill(w)
+                w.conn.close()
+                self._workers[k] = self._spawn()
+        if error is not None:
+            raise error
+
+        order = sorted(i for i in done if i < num_needed())
+        if failed is not None:
+            order.append(failed)
+        return [(bws[i], *done[i]) for i in order]
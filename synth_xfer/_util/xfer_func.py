@@ -1,10 +1,13 @@
 from collections.abc import Sequence
 from dataclasses import dataclass, field
+import hashlib
+import io
 from typing import Callable
 
 from xdsl.dialects.builtin import StringAttr
 from xdsl.dialects.func import CallOp, FuncOp, ReturnOp
 from xdsl.ir import Operation, SSAValue
+from xdsl.printer import Printer
 from xdsl_smt.dialects.transfer import AbstractValueType, GetOp, MakeOp, SelectOp
 
 from synth_xfer._util.dce import dce
@@ -49,6 +52,21 @@ class XferFunc:
         cond_str = "True\n" if self.cond is None else dce(self.cond)
         return f"Cond:\n{cond_str}\nFunc:{dce(self.body)}"
 
+    def structural_hash(self) -> str:
+        """
+        Hash of the DCE'd body and cond, ignoring function names and attributes.
+        WARNING: like `__str__`, this runs dce on the body and cond in place!
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for fn in (self.body, self.cond):
+            buf = io.StringIO()
+            if fn is not None:
+                Printer(stream=buf).print_region(dce(fn).body)
+            h.update(buf.getvalue().encode())
+            h.update(b"\0")
+
+        return h.hexdigest()
+
     def build(self) -> FuncOp:
         """Assemble the full guarded transfer function.
 
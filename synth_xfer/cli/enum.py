@@ -2,8 +2,10 @@ from argparse import ArgumentParser, Namespace
 from pathlib import Path
 
 from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.enum_bin import write_enum_bin
+from synth_xfer._util.eval import set_eval_threads
 from synth_xfer._util.pattern_dsl import PatternDag
-from synth_xfer._util.tsv import build_enum_data
+from synth_xfer._util.tsv import write_enum_tsv
 from synth_xfer.cli.args import get_sampler, int_triple, int_tuple, make_sampler_parser
 
 
@@ -11,6 +13,12 @@ def _register_parser() -> Namespace:
     p = ArgumentParser()
 
     p.add_argument("-o", "--output", type=Path, required=True)
+    p.add_argument(
+        "--format",
+        choices=["tsv", "bin"],
+        default="tsv",
+        help="Output format, a TSV or a binary dataset that loads without parsing",
+    )
     p.add_argument("--op", type=PatternDag, help="op or pattern expression")
     p.add_argument(
         "-d",
@@ -42,6 +50,12 @@ def _register_parser() -> Namespace:
         help="High-bitwidths to sample abstract values with, and sample the concretizations of each of them",
     )
     p.add_argument("--seed", type=int, help="Enum seed")
+    p.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of threads to enumerate with (0 for all cores), the output does not depend on it",
+    )
     make_sampler_parser(p)
 
     return p.parse_args()
@@ -49,7 +63,10 @@ def _register_parser() -> Namespace:
 
 def main() -> None:
     args = _register_parser()
-    build_enum_data(
+    set_eval_threads(args.threads)
+    write = write_enum_bin if args.format == "bin" else write_enum_tsv
+    write(
+        path=args.output,
         domain=AbstractDomain[args.domain],
         op=args.op,
         lbw=args.lbw,
@@ -57,7 +74,7 @@ def main() -> None:
         hbw=args.hbw,
         seed=args.seed,
         sampler=get_sampler(args),
-    ).write_tsv(args.output)
+    )
 
 
 if __name__ == "__main__":
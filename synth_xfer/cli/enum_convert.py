@@ -0,0 +1,31 @@
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+from synth_xfer._util.enum_bin import EnumBin, is_enum_bin
+from synth_xfer._util.tsv import EnumData
+
+
+def _register_parser() -> Namespace:
+    p = ArgumentParser(
+        description="Convert an enum dataset from TSV to binary, or from binary to TSV"
+    )
+
+    p.add_argument("input", type=Path, help="Enum TSV or binary dataset")
+    p.add_argument("output", type=Path, help="Converted dataset")
+
+    return p.parse_args()
+
+
+def main() -> None:
+    args = _register_parser()
+
+    if is_enum_bin(args.input):
+        EnumBin.read(args.input).to_enum_data().write_tsv(args.output)
+    else:
+        with args.input.open("r") as f:
+            data = EnumData.read_tsv(f)
+        EnumBin.from_enum_data(data).write(args.output)
+
+
+if __name__ == "__main__":
+    main()
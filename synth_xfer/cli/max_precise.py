@@ -51,8 +51,15 @@ def _get_args() -> Namespace:
         default=SolverKind.bitwuzla,
         help="SMT solver backend",
     )
+    p.add_argument(
+        "--optimize",
+        action="store_true",
+        help="get the bounds of interval domains from z3's Optimize (needs --solver z3)",
+    )
 
     args = p.parse_args()
+    if args.optimize and args.solver != SolverKind.z3:
+        p.error("--optimize needs --solver z3")
     if args.input is not None:
         invalid_flags: list[str] = []
         if args.op is not None:
@@ -173,7 +180,9 @@ def main() -> None:
         with args.input.open() as f:
             data = EnumData.read_tsv(f)
 
-        updated, commented_rows = fill_hbw_rows(data, args.timeout, args.solver)
+        updated, commented_rows = fill_hbw_rows(
+            data, args.timeout, args.solver, args.optimize
+        )
         output_path = args.input if args.output is None else args.output
         updated.write_tsv_with_comments(output_path, commented_rows)
     else:
@@ -197,6 +206,7 @@ def main() -> None:
                 fn_args,
                 args.timeout,
                 args.solver,
+                args.optimize,
             )
             print(max_prec)
 
@@ -6,6 +6,7 @@ import pandas as pd
 from xdsl.dialects.func import FuncOp
 
 from synth_xfer._util.domain import AbstractDomain
+from synth_xfer._util.enum_bin import EnumBin, read_enum_dataset
 from synth_xfer._util.eval import RunInputMap, parse_to_run_inputs, run_xfer_fns
 from synth_xfer._util.parse_mlir import get_fns, parse_mlir_mod
 from synth_xfer._util.tsv import EnumData
@@ -101,24 +102,28 @@ def main() -> None:
     args = _register_parser()
     candidates = load_file_candidates(args.xfer_file, args.xfer_name)
     prepared = PreparedCandidates.from_candidates(candidates)
-    data: EnumData | None = None
+    data: EnumData | EnumBin | None = None
+    to_eval: RunInputMap
 
     if args.input is not None:
-        with args.input.open("r", encoding="utf-8") as f:
-            data = EnumData.read_tsv(f)
+        data = read_enum_dataset(args.input)
         if prepared.arity != data.metadata.arity:
             raise ValueError(
                 f"Candidate arity {prepared.arity} does not match dataset arity {data.metadata.arity}"
             )
 
-        domain, df = data.metadata.domain, data.enumdata
-        to_eval = enumdata_to_run_inputs(data)
+        domain = data.metadata.domain
+        if isinstance(data, EnumBin):
+            # the transformers run on the mapped columns, the rows are only printed
+            df = data.to_enum_data().enumdata
+            to_eval = dict(data.columns)
+        else:
+            df = data.enumdata
+            to_eval = enumdata_to_run_inputs(data)
     else:
         domain = AbstractDomain[args.domain]
         fn_args = [tuple(x.strip() for x in args.args.split(";"))]
-        to_eval: RunInputMap = {
-            args.bw: parse_to_run_inputs(domain, args.bw, prepared.arity, fn_args)
-        }
+        to_eval = {args.bw: parse_to_run_inputs(domain, args.bw, prepared.arity, fn_args)}
         df = pd.DataFrame({f"arg_{n}": [x] for n, x in enumerate(fn_args[0])})
 
     d_fns = get_fns(parse_mlir_mod(files("synth_xfer") / "mlir" / f"{domain}.mlir"))
@@ -9,70 +9,45 @@ from time import perf_counter
 
 from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.dsl_operators import DslOpSet, load_dsl_ops
-from synth_xfer._util.eval import EvalInputMap, ToEval, enum, eval_transfer_func
+from synth_xfer._util.enum_bin import EnumBin
+from synth_xfer._util.eval import (
+    Columns,
+    columns_suffix,
+    enum,
+    enum_low_shared,
+    eval_transfer_func,
+    make_eval_fn,
+    set_eval_threads,
+    to_columns,
+)
 from synth_xfer._util.eval_result import EvalResult
+from synth_xfer._util.fuzz_filter import FuzzFilter
 from synth_xfer._util.jit import Jit
+from synth_xfer._util.jit_session import JitSession
 from synth_xfer._util.log import get_logger, write_log_file
 from synth_xfer._util.lower import LowerToLLVM
+from synth_xfer._util.mcmc_pool import McmcPool
 from synth_xfer._util.mcmc_sampler import setup_mcmc
-from synth_xfer._util.one_iter import synthesize_one_iteration
-from synth_xfer._util.parse_mlir import HelperFuncs, top_as_xfer
+from synth_xfer._util.one_iter import (
+    log_iteration_start,
+    synthesize_one_iteration,
+    verify_candidates,
+)
+from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.random import Random, Sampler
+from synth_xfer._util.shared_lattice import SharedLattices
 from synth_xfer._util.smt_solver import SolverKind
-from synth_xfer._util.solution_set import EvalFn, SolutionSet
+from synth_xfer._util.solution_set import SolutionSet
 from synth_xfer._util.synth_context import SynthesizerContext
 from synth_xfer._util.tsv import EnumData
+from synth_xfer._util.verifier import verifier_session
+from synth_xfer._util.verify_cache import VerifyCache
+from synth_xfer._util.verify_pool import VerifyPool
 from synth_xfer._util.xfer_data import enumdata_to_eval_inputs
-from synth_xfer._util.xfer_func import XferFunc
 from synth_xfer.cli.args import int_list, int_triple, int_tuple, make_sampler_parser
 
 
-def _eval_helper(
-    to_eval: dict[int, ToEval],
-    bws: list[int],
-    helper_funcs: HelperFuncs,
-    low_and_med_bw: set[int],
-) -> EvalFn:
-    def helper(
-        xfer: list[XferFunc],
-        base: list[XferFunc],
-    ) -> list[EvalResult]:
-        lowerer = LowerToLLVM(bws)
-        lowerer.add_fn(helper_funcs.get_top_func)
-
-        if not xfer:
-            ret_top_func = XferFunc(top_as_xfer(helper_funcs.transfer_func))
-            ret_top_func.set_name("ret_top")
-            xfer = [ret_top_func]
-
-        xfer_names = [fc.lower(lowerer.add_fn) for fc in xfer]
-        base_names = [fc.lower(lowerer.add_fn) for fc in base]
-
-        xfer_names = {bw: [d[bw] for d in xfer_names] for bw in bws}
-        base_names = {bw: [d[bw] for d in base_names] for bw in bws}
-
-        with Jit() as jit:
-            jit.add_mod(lowerer)
-            xfer_fns = {
-                bw: [jit.get_fn_ptr(x) for x in xfer_names[bw]] for bw in xfer_names
-            }
-            base_fns = {
-                bw: [jit.get_fn_ptr(x) for x in base_names[bw]] for bw in base_names
-            }
-
-            input: EvalInputMap = {
-                bw: (to_eval[bw], xfer_fns.get(bw, []), base_fns.get(bw, []))
-                for bw in to_eval
-            }
-
-            results = eval_transfer_func(input, low_and_med_bw)
-
-        return results
-
-    return helper
-
-
 def _setup_context(
     r: Random, use_full_i1_ops: bool, dsl_ops: DslOpSet | None
 ) -> SynthesizerContext:
@@ -104,9 +79,19 @@ def run(
     optimize: bool,
     sampler: Sampler,
     solver: SolverKind,
-    eval_data: EnumData | None = None,
+    eval_data: EnumData | EnumBin | None = None,
+    eval_threads: int = 1,
+    fused_eval: bool = False,
+    staged_eval: int = 0,
+    mcmc_procs: int = 1,
+    verify_procs: int = 1,
+    lattices: SharedLattices | None = None,
+    fuzz_verify: tuple[int, int] | None = None,
+    verify_cache: Path | None = None,
+    portfolio: bool = False,
 ) -> EvalResult:
     logger = get_logger()
+    set_eval_threads(eval_threads)
     dsl_ops: DslOpSet | None = load_dsl_ops(dsl_ops_path) if dsl_ops_path else None
     logger.debug("Round_ID\tSound%\tUExact%\tDisReduce\tCost")
 
@@ -118,11 +103,34 @@ def run(
     context_weighted = _setup_context(random, False, dsl_ops)
     context_cond = _setup_context(random, True, dsl_ops)
 
+    # a bw given at several levels is only enumerated at the last one, so only the
+    # bws that are just in lbw are exhaustive lattices that can be shared
+    sampled_bws = set(x[0] for x in mbw) | set(x[0] for x in hbw)
+    shared_bws = [bw for bw in lbw if bw not in sampled_bws]
+    shared_lows: dict[int, Columns] = {}
     if eval_data is None:
         start_time = perf_counter()
-        to_eval = enum(lbw, mbw, hbw, seed, helper_funcs, sampler)
+        if lattices is not None:
+            published = {
+                bw: lattices.published(columns_suffix(helper_funcs, bw))
+                for bw in shared_bws
+            }
+            shared_lows = enum_low_shared(
+                {bw: buf for bw, buf in published.items() if buf is not None},
+                helper_funcs,
+            )
+        enum_lbw = [bw for bw in lbw if bw not in shared_lows]
+        to_eval = (
+            enum(enum_lbw, mbw, hbw, seed, helper_funcs, sampler)
+            if enum_lbw or mbw or hbw
+            else {}
+        )
         run_time = perf_counter() - start_time
         logger.perf(f"Enum engine took {run_time:.4f}s")
+    elif isinstance(eval_data, EnumBin):
+        # the columns are evaluated in place from the mapped file
+        to_eval = {}
+        logger.perf("Dataset mode: using provided binary eval dataset")
     else:
         to_eval = enumdata_to_eval_inputs(eval_data)
         logger.perf("Dataset mode: using provided eval dataset")
@@ -130,8 +138,77 @@ def run(
     all_bws = list(set(lbw) | set(x[0] for x in mbw) | set(x[0] for x in hbw))
     low_and_med_bw = set(lbw) | set(t[0] for t in mbw)
 
-    eval_fn = _eval_helper(to_eval, all_bws, helper_funcs, low_and_med_bw)
-    solution_set = SolutionSet([], domain=domain, optimize=optimize)
+    to_eval_cols = {bw: to_columns(x) for bw, x in to_eval.items()}
+    del to_eval
+    if isinstance(eval_data, EnumBin):
+        to_eval_cols = dict(eval_data.columns)
+    if lattices is not None and eval_data is None:
+        to_eval_cols |= {
+            bw: lattices.share(to_eval_cols[bw])
+            for bw in shared_bws
+            if bw not in shared_lows
+        }
+    if shared_lows:
+        # in the order `enum` returns them in
+        order = dict.fromkeys([*lbw, *(x[0] for x in mbw), *(x[0] for x in hbw)])
+        to_eval_cols = {bw: (shared_lows | to_eval_cols)[bw] for bw in order}
+    mcmc_pool = (
+        McmcPool(
+            mcmc_procs,
+            helper_funcs,
+            domain,
+            (context, context_weighted, context_cond),
+            to_eval_cols,
+            all_bws,
+            low_and_med_bw,
+            fused_eval,
+            staged_eval,
+        )
+        if mcmc_procs > 1
+        else None
+    )
+    session = JitSession(
+        all_bws,
+        [helper_funcs.get_top_func],
+        batched=True,
+        meet=helper_funcs.meet_func if fused_eval else None,
+        top=helper_funcs.get_top_func if fused_eval else None,
+    )
+    eval_fn = make_eval_fn(to_eval_cols, session, helper_funcs, low_and_med_bw)
+    screen_fn = (
+        make_eval_fn(
+            {bw: x.every(staged_eval) for bw, x in to_eval_cols.items()},
+            session,
+            helper_funcs,
+            low_and_med_bw,
+        )
+        if staged_eval > 0
+        else None
+    )
+    verifier = verifier_session(helper_funcs)
+    verifier.portfolio = portfolio
+    cache = VerifyCache(verify_cache, domain, op) if verify_cache is not None else None
+    verify_pool = (
+        VerifyPool(verify_procs, helper_funcs, cache) if verify_procs > 1 else None
+    )
+    fuzz_filter = (
+        FuzzFilter(helper_funcs, vbw, *fuzz_verify, seed, sampler)
+        if fuzz_verify is not None
+        else None
+    )
+    if fuzz_filter is not None and fuzz_filter.skipped:
+        logger.warning(
+            f"Fuzz filter: no eval engine for bws {fuzz_filter.skipped}, "
+            f"candidates are only screened at bws {fuzz_filter.bws}"
+        )
+    solution_set = SolutionSet(
+        [],
+        domain=domain,
+        optimize=optimize,
+        verify_pool=verify_pool,
+        fuzz_filter=fuzz_filter,
+        verify_cache=cache,
+    )
 
     start_time = perf_counter()
     init_cmp_res = solution_set.eval_improve([], eval_fn)[0]
@@ -166,23 +243,66 @@ def run(
             current_prog_len,
             current_num_steps,
             condition_length,
+            shard=None if mcmc_pool is None else range(0),
         )
 
-        solution_set = synthesize_one_iteration(
-            ith_iter,
-            random,
-            solution_set,
-            helper_funcs,
-            eval_fn,
-            inv_temp,
-            num_unsound_candidates,
-            ranges,
-            mcmc_samplers,
-            prec_set,
-            lbw,
-            vbw,
-            solver,
-        )
+        if mcmc_pool is None:
+            solution_set = synthesize_one_iteration(
+                ith_iter,
+                random,
+                solution_set,
+                helper_funcs,
+                eval_fn,
+                inv_temp,
+                num_unsound_candidates,
+                ranges,
+                mcmc_samplers,
+                prec_set,
+                lbw,
+                vbw,
+                solver,
+                screen_fn,
+            )
+        else:
+            log_iteration_start(ith_iter, ranges, current_prog_len, current_num_steps)
+            outcome = mcmc_pool.run_mcmc(
+                ith_iter,
+                random,
+                solution_set,
+                context_weighted,
+                inv_temp,
+                num_mcmc,
+                current_num_abd_procs,
+                current_prog_len,
+                current_num_steps,
+                condition_length,
+            )
+            solution_set = verify_candidates(
+                ith_iter,
+                iter_start,
+                outcome,
+                solution_set,
+                helper_funcs,
+                eval_fn,
+                num_unsound_candidates,
+                ranges,
+                prec_set,
+                lbw,
+                vbw,
+                solver,
+            )
+        logger.perf(f"\tLowering cache | {session.hits} hits | {session.misses} misses")
+        session.reset_stats()
+        if fuzz_filter is not None:
+            checked, rejected = fuzz_filter.num_checked, fuzz_filter.num_rejected
+            rate = rejected / checked * 100 if checked else 0.0
+            logger.perf(f"\tFuzz filter | {rejected}/{checked} rejected ({rate:.2f}%)")
+            fuzz_filter.reset_stats()
+        logger.perf(f"\tVerify times | {solution_set.verify_schedule}")
+        if portfolio:
+            wins = " | ".join(f"{k} {verifier.wins[k]}" for k in SolverKind)
+            logger.perf(f"\tPortfolio wins | {wins}")
+            verifier.wins.clear()
 
         write_log_file(
             f"iter{ith_iter}.mlir", "\n".join(map(str, solution_set.solutions))
@@ -216,6 +336,15 @@ def run(
             print("Found a perfect solution")
             break
 
+    if mcmc_pool is not None:
+        mcmc_pool.close()
+    if verify_pool is not None:
+        verify_pool.close()
+    if fuzz_filter is not None:
+        fuzz_filter.close()
+    if cache is not None:
+        cache.close()
+
     # Eval last solution:
     if not solution_set.has_solution():
         raise Exception("Found no solutions")
@@ -225,12 +354,12 @@ def run(
     lowerer = LowerToLLVM(all_bws)
     lowerer.add_fn(helper_funcs.meet_func)
     lowerer.add_fn(helper_funcs.get_top_func)
-    lowerer.add_mod(solution_module, ["solution"])
+    lowerer.add_mod(solution_module, ["solution"], batched=True)
 
     with Jit() as jit:
         jit.add_mod(lowerer)
-        sol_ptrs = {bw: jit.get_fn_ptr(f"solution_{bw}_shim") for bw in all_bws}
-        sol_to_eval = {bw: (to_eval[bw], [sol_ptrs[bw]], []) for bw in all_bws}
+        sol_ptrs = {bw: jit.get_fn_ptr(f"solution_{bw}_batch") for bw in all_bws}
+        sol_to_eval = {bw: (to_eval_cols[bw], [sol_ptrs[bw]], []) for bw in all_bws}
         solution_result = eval_transfer_func(sol_to_eval, low_and_med_bw)[0]
 
     solution_exact = solution_result.get_exact_prop() * 100
@@ -261,7 +390,7 @@ def _build_arg_parser() -> Namespace:
         "-i",
         "--input",
         type=Path,
-        help="Path to EnumData TSV used as evaluation dataset",
+        help="Path to EnumData TSV or binary dataset used as evaluation dataset",
     )
     p.add_argument(
         "--dsl-ops",
@@ -363,6 +492,54 @@ def _build_arg_parser() -> Namespace:
         default=SolverKind.bitwuzla,
         help="SMT solver backend",
     )
+    p.add_argument(
+        "--portfolio",
+        action=BooleanOptionalAction,
+        default=False,
+        help="verify with all the SMT solvers at once and keep the first answer, instead of with --solver",
+    )
+    p.add_argument(
+        "--eval-threads",
+        type=int,
+        default=1,
+        help="number of threads the eval engine uses per synthesis job (0 for all cores)",
+    )
+    p.add_argument(
+        "--fused-eval",
+        action=BooleanOptionalAction,
+        default=False,
+        help="compile each candidate set with the ref meet into one eval kernel",
+    )
+    p.add_argument(
+        "--staged-eval",
+        type=int,
+        default=0,
+        help="screen MCMC proposals on every Nth row first, and only evaluate the ones that may be accepted on all rows (0 to disable)",
+    )
+    p.add_argument(
+        "--mcmc-procs",
+        type=int,
+        default=1,
+        help="number of processes the MCMC samplers of each iteration are split across",
+    )
+    p.add_argument(
+        "--verify-procs",
+        type=int,
+        default=1,
+        help="number of processes candidates are verified on, one bitwidth per task",
+    )
+    p.add_argument(
+        "--fuzz-verify",
+        type=int_tuple,
+        default=None,
+        help="screen new candidates on sampled inputs at every verify bitwidth before calling the solver. Format: num_abstract_samples,num_concrete_samples",
+    )
+    p.add_argument(
+        "--verify-cache",
+        type=Path,
+        default=None,
+        help="SQLite database to keep verification results in across iterations and runs",
+    )
     p.add_argument(
         "--debug",
         action="store_true",
@@ -378,6 +555,13 @@ def _validate_args(args: Namespace) -> None:
     has_benchmark = args.benchmark is not None
     has_input = args.input is not None
 
+    if args.mcmc_procs < 1:
+        raise ValueError("--mcmc-procs must be positive")
+    if args.verify_procs < 1:
+        raise ValueError("--verify-procs must be positive")
+    if args.fuzz_verify is not None and min(args.fuzz_verify) < 1:
+        raise ValueError("--fuzz-verify sample counts must be positive")
+
     if has_input:
         invalid_flags: list[str] = []
         if has_op:
@@ -418,6 +602,13 @@ def _validate_args(args: Namespace) -> None:
             invalid_flags.append("--mbw")
         if args.hbw != []:
             invalid_flags.append("--hbw")
+        if args.mcmc_procs > 1:
+            # benchmark jobs already run in pool workers, which cannot have children
+            invalid_flags.append("--mcmc-procs")
+        if args.verify_procs > 1:
+            invalid_flags.append("--verify-procs")
+        if args.portfolio:
+            invalid_flags.append("--portfolio")
         if invalid_flags:
             raise ValueError(
                 f"{', '.join(invalid_flags)} are only valid with --op, not --benchmark"
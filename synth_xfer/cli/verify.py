@@ -2,7 +2,6 @@ from argparse import ArgumentParser, Namespace
 from pathlib import Path
 from time import perf_counter
 
-from xdsl.dialects.func import FuncOp
 from xdsl.parser import ModuleOp
 
 from synth_xfer._util.domain import AbstractDomain
@@ -10,38 +9,11 @@ from synth_xfer._util.eval import parse_to_run_inputs, run_concrete_fn, run_xfer
 from synth_xfer._util.parse_mlir import HelperFuncs, get_fns, parse_mlir_mod
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.smt_solver import Model, SolverKind
-from synth_xfer._util.verifier import verify_transfer_function
+from synth_xfer._util.verifier import verify_function
 from synth_xfer._util.xfer_data import prepare_exec_module, resolve_xfer_name
 from synth_xfer.cli.args import int_list
 
 
-def verify_function(
-    bw: int,
-    func: FuncOp,
-    xfer_helpers: list[FuncOp | None],
-    helper_funcs: HelperFuncs,
-    timeout: int,
-    solver_kind: SolverKind = SolverKind.bitwuzla,
-) -> tuple[bool | None, Model | None]:
-    xfer_helpers += [
-        helper_funcs.get_top_func,
-        helper_funcs.instance_constraint_func,
-        helper_funcs.domain_constraint_func,
-        helper_funcs.op_constraint_func,
-        helper_funcs.meet_func,
-    ]
-    helpers = [x for x in xfer_helpers if x is not None]
-
-    return verify_transfer_function(
-        func,
-        helper_funcs.crt_func,
-        helpers,
-        bw,
-        timeout,
-        solver_kind,
-    )
-
-
 def _register_parser() -> Namespace:
     p = ArgumentParser()
 
@@ -1,22 +1,35 @@
 from pathlib import Path
 
+import pytest
+
 from synth_xfer._eval_engine import (
+    ColumnsKnownBits_4_4_4,
     enum_low_knownbits_4_4_4,
     enum_low_uconstrange_4_4_4,
     enum_mid_knownbits_8_8_8,
     enum_mid_uconstrange_8_8_8,
+    eval_batched_knownbits_4_4_4,
+    eval_fused_knownbits_4_4_4,
     eval_knownbits_4_4_4,
     eval_knownbits_8_8_8,
     eval_uconstrange_4_4_4,
     eval_uconstrange_8_8_8,
 )
 from synth_xfer._util.domain import AbstractDomain
-from synth_xfer._util.eval import get_per_bit
+from synth_xfer._util.enum_bin import EnumBin, write_enum_bin
+from synth_xfer._util.eval import (
+    ToEval,
+    enum,
+    enum_edges,
+    get_per_bit,
+    set_eval_threads,
+)
 from synth_xfer._util.jit import Jit
 from synth_xfer._util.lower import LowerToLLVM
 from synth_xfer._util.parse_mlir import HelperFuncs, parse_mlir_func
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.random import Sampler
+from synth_xfer._util.tsv import build_enum_data, write_enum_tsv
 
 DATA_DIR = Path(__file__).parent.parent / "tests" / "data"
 
@@ -90,3 +103,143 @@ def test_jit_with_ucr_add():
         assert res.get_exact_prop() == 1.0
         assert res.all_cases == NUM_CASES
         assert res.bitwidth == 8
+
+
+def test_jit_batched_kb_and():
+    lowerer = LowerToLLVM([4])
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    xfer_mlir = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir")
+    lowerer.add_fn(xfer_mlir, shim=True, batched=True)
+    lowerer.add_fn(helpers.crt_func, shim=True)
+
+    with Jit() as jit:
+        jit.add_mod(str(lowerer))
+        conc_op_addr = jit.get_fn_ptr("concrete_op_4_shim")
+        xfer_fn_addr = jit.get_fn_ptr("kb_and_4_batch")
+
+        to_eval_low = enum_low_knownbits_4_4_4(conc_op_addr.addr, None)
+        cols = ColumnsKnownBits_4_4_4(to_eval_low)
+        assert len(cols) == len(to_eval_low)
+        raw_res = eval_batched_knownbits_4_4_4(cols, [xfer_fn_addr.addr], [])
+        res = get_per_bit(raw_res)[0]
+        assert (
+            str(res).strip()
+            == "bw: 4  all: 6561  s: 6561  e: 6561  uall: 6480  ue: 6480  dis: 0       bdis: 3499.2  sdis: 0"
+        )
+
+
+def test_jit_fused_kb_and():
+    lowerer = LowerToLLVM([4])
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    xfer_mlir = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir")
+    meet = lowerer.add_fn(helpers.meet_func)
+    top = lowerer.add_fn(helpers.get_top_func)
+    xfer = lowerer.add_fn(xfer_mlir)
+    lowerer.add_fn(helpers.crt_func, shim=True)
+    lowerer.shim_fused("kernel", xfer_mlir, [xfer[4]], [], meet[4], top[4], 4)
+
+    with Jit() as jit:
+        jit.add_mod(str(lowerer))
+        conc_op_addr = jit.get_fn_ptr("concrete_op_4_shim")
+        kernel_addr = jit.get_fn_ptr("kernel_4_fused")
+
+        to_eval_low = enum_low_knownbits_4_4_4(conc_op_addr.addr, None)
+        cols = ColumnsKnownBits_4_4_4(to_eval_low)
+        raw_res = eval_fused_knownbits_4_4_4(cols, kernel_addr.addr, 1)
+        res = get_per_bit(raw_res)[0]
+        assert (
+            str(res).strip()
+            == "bw: 4  all: 6561  s: 6561  e: 6561  uall: 6480  ue: 6480  dis: 0       bdis: 3499.2  sdis: 0"
+        )
+
+
+def test_enum_edges_are_exact_when_enumerable():
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    lows = enum([4], [], [], 0, helpers, Sampler.uniform())[4]
+    best = {(str(a), str(b)): str(res) for (a, b), res in lows}
+
+    # top, 5 constants and 8 distinct joins of two of them per argument
+    edges = enum_edges([(4, 256)], 0, helpers)[4]
+    assert len(edges) == 14 * 14
+    for (a, b), res in edges:
+        assert str(res) == best[(str(a), str(b))]
+
+
+def _rows(to_eval: ToEval) -> list[tuple[tuple[str, ...], str]]:
+    return [(tuple(str(x) for x in args), str(res)) for args, res in to_eval]
+
+
+def test_enum_is_independent_of_thread_count():
+    helpers = HelperFuncs(PatternDag("Udiv"), AbstractDomain.UConstRange)
+
+    def run(num_threads: int) -> dict[int, list[tuple[tuple[str, ...], str]]]:
+        set_eval_threads(num_threads)
+        try:
+            res = enum([4], [(8, 2000)], [(16, 1000, 100)], 7, helpers, Sampler.uniform())
+        finally:
+            set_eval_threads(1)
+        return {bw: _rows(to_eval) for bw, to_eval in res.items()}
+
+    assert run(1) == run(4)
+
+
+@pytest.mark.parametrize(
+    "domain, op",
+    [
+        (AbstractDomain.UConstRange, "Udiv"),
+        (AbstractDomain.SConstRange, "Sdiv"),
+        (AbstractDomain.Mod3, "Udiv"),
+    ],
+)
+def test_enum_lows_are_best_abstractions(domain: AbstractDomain, op: str):
+    helpers = HelperFuncs(PatternDag(op), domain)
+    lows = dict(_rows(enum([4], [], [], 0, helpers, Sampler.uniform())[4]))
+
+    # mid rows are the best abstractions of their arguments, computed one by one
+    mids = _rows(enum([], [(4, 5000)], [], 0, helpers, Sampler.uniform())[4])
+    for args, res in mids:
+        assert lows[args] == res, args
+
+
+def test_enum_tsv_matches_enum_data(tmp_path: Path):
+    spec = dict(
+        domain=AbstractDomain.KnownBits,
+        op=PatternDag("And"),
+        lbw=[4],
+        mbw=[(8, 5000)],
+        hbw=[],
+        seed=100,
+        sampler=Sampler.uniform(),
+    )
+    build_enum_data(**spec).write_tsv(tmp_path / "in_memory.tsv")
+    write_enum_tsv(tmp_path / "streamed.tsv", **spec)
+
+    in_memory = (tmp_path / "in_memory.tsv").read_text()
+    assert (tmp_path / "streamed.tsv").read_text() == in_memory
+
+
+def test_enum_bin_round_trip(tmp_path: Path):
+    spec = dict(
+        domain=AbstractDomain.KnownBits,
+        op=PatternDag("And"),
+        lbw=[4],
+        mbw=[(8, 5000)],
+        hbw=[],
+        seed=100,
+        sampler=Sampler.uniform(),
+    )
+    data = build_enum_data(**spec)
+    data.write_tsv(tmp_path / "in_memory.tsv")
+    EnumBin.from_enum_data(data).write(tmp_path / "in_memory.bin")
+    write_enum_bin(tmp_path / "streamed.bin", **spec)
+
+    in_memory = (tmp_path / "in_memory.bin").read_bytes()
+    assert (tmp_path / "streamed.bin").read_bytes() == in_memory
+
+    loaded = EnumBin.read(tmp_path / "streamed.bin")
+    assert loaded.metadata.dump() == data.metadata.dump()
+    assert {bw: len(cols) for bw, cols in loaded.columns.items()} == {4: 6561, 8: 5000}
+
+    loaded.to_enum_data().write_tsv(tmp_path / "round_trip.tsv")
+    round_trip = (tmp_path / "round_trip.tsv").read_text()
+    assert round_trip == (tmp_path / "in_memory.tsv").read_text()
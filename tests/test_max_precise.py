@@ -7,7 +7,7 @@ import pytest
 from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.jit import Jit
 from synth_xfer._util.lower import LowerToLLVM
-from synth_xfer._util.max_precise import compute_max_precise
+from synth_xfer._util.max_precise import compute_max_precise, max_precise_template
 from synth_xfer._util.parse_mlir import HelperFuncs
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.smt_solver import SolverKind
@@ -77,6 +77,9 @@ SCR_CASES = [
     ("Xor", "[-6, 6]", "[-5, 5]"),
 ]
 
+# interval domains can also be computed with z3's Optimize
+INTERVAL_SOLVERS = [(x, False) for x in SolverKind] + [(SolverKind.z3, True)]
+
 
 def _signed_to_raw(x: int, bw: int) -> int:
     return x % (2**bw)
@@ -195,6 +198,7 @@ def _check_cases(
     cases: list[tuple[str, str, str]],
     solver_kind: SolverKind,
     bw: int = BW,
+    optimize: bool = False,
 ) -> None:
     for op_name, arg0, arg1 in cases:
         args = (arg0, arg1)
@@ -206,6 +210,7 @@ def _check_cases(
             args,
             timeout=3,
             solver_kind=solver_kind,
+            optimize=optimize,
         )
         assert actual == expected, (
             f"{domain.name} {op_name} {args}: expected {expected}, got {actual}"
@@ -218,10 +223,41 @@ def test_max_precise_knownbits(solver_kind: SolverKind):
 
 
 @pytest.mark.parametrize("solver_kind", list(SolverKind))
-def test_max_precise_ucr(solver_kind: SolverKind):
-    _check_cases(AbstractDomain.UConstRange, UCR_CASES, solver_kind)
+def test_max_precise_knownbits_num_checks(solver_kind: SolverKind):
+    domain = AbstractDomain.KnownBits
+    for op_name, arg0, arg1 in KB_CASES:
+        template = max_precise_template(PatternDag(op_name), domain, BW, 3, solver_kind)
+        before = template.query.num_checks
+        template.compute((arg0, arg1))
+        assert template.query.num_checks - before <= BW + 1, (op_name, arg0, arg1)
+
+
+@pytest.mark.parametrize("solver_kind, optimize", INTERVAL_SOLVERS)
+def test_max_precise_ucr(solver_kind: SolverKind, optimize: bool):
+    _check_cases(AbstractDomain.UConstRange, UCR_CASES, solver_kind, optimize=optimize)
+
+
+@pytest.mark.parametrize("solver_kind, optimize", INTERVAL_SOLVERS)
+def test_max_precise_scr(solver_kind: SolverKind, optimize: bool):
+    _check_cases(AbstractDomain.SConstRange, SCR_CASES, solver_kind, optimize=optimize)
 
 
 @pytest.mark.parametrize("solver_kind", list(SolverKind))
-def test_max_precise_scr(solver_kind: SolverKind):
-    _check_cases(AbstractDomain.SConstRange, SCR_CASES, solver_kind)
+def test_max_precise_template_reuse(solver_kind: SolverKind):
+    domain = AbstractDomain.UConstRange
+    template = max_precise_template(PatternDag("Udiv"), domain, BW, 3, solver_kind)
+    again = max_precise_template(PatternDag("Udiv"), domain, BW, 3, solver_kind)
+    assert again is template
+
+    rows = [
+        ("[8, 15]", "[2, 4]"),
+        ("[3, 7]", "[0, 0]"),
+        ("[0, 15]", "[1, 1]"),
+        ("[5, 5]", "[3, 9]"),
+        ("[12, 14]", "[0, 2]"),
+    ]
+    expected = [_expected(domain, "Udiv", args, BW) for args in rows]
+    # the arguments of a row are popped with it, so the rows can't affect each other
+    for order in (rows, rows[::-1]):
+        actual = {args: template.compute(args) for args in order}
+        assert [actual[args] for args in rows] == expected
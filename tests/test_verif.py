@@ -1,3 +1,4 @@
+from collections import Counter
 from pathlib import Path
 
 import pytest
@@ -6,7 +7,9 @@ from synth_xfer._util.domain import AbstractDomain
 from synth_xfer._util.parse_mlir import HelperFuncs, parse_mlir_func
 from synth_xfer._util.pattern_dsl import PatternDag
 from synth_xfer._util.smt_solver import SolverKind
-from synth_xfer.cli.verify import verify_function
+from synth_xfer._util.verifier import verifier_session, verify_function
+from synth_xfer._util.verify_cache import VerifyCache
+from synth_xfer._util.xfer_func import XferFunc
 
 DATA_DIR = Path(__file__).parent.parent / "tests" / "data"
 
@@ -27,3 +30,69 @@ def test_verif_ucr_add(solver_kind: SolverKind):
     for bw in range(1, 17):
         res, _ = verify_function(bw, xfer_mlir, [], helpers, 3, solver_kind)
         assert res is True
+
+
+def test_verif_session_reuse():
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    xfer_mlir = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir")
+    session = verifier_session(helpers)
+    assert verifier_session(helpers) is session
+    for _ in range(2):
+        for bw in range(1, 9):
+            res, _ = session.verify(xfer_mlir, [], bw, 3, SolverKind.bitwuzla)
+            assert res is True
+
+
+@pytest.mark.parametrize("solver_kind", list(SolverKind))
+def test_verif_session_incremental(solver_kind: SolverKind):
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    sound = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir")
+    unsound = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_or.mlir")
+    session = verifier_session(helpers)
+    for bw in range(2, 9):
+        before = session.query_stats.copy()
+        for _ in range(2):
+            res, model = session.verify(unsound, [], bw, 3, solver_kind)
+            assert res is False and model is not None and model.items()
+            res, model = session.verify(sound, [], bw, 3, solver_kind)
+            assert res is True and model is None
+        # the second query at a width builds the shared base, later ones reuse it
+        assert session.query_stats - before == Counter(fresh=1, rebuilt=1, reused=2)
+
+
+def test_verif_cache(tmp_path: Path):
+    op = PatternDag("And")
+    helpers = HelperFuncs(op, AbstractDomain.KnownBits)
+    sound = XferFunc(parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir"))
+    unsound = XferFunc(parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_or.mlir"))
+    db = tmp_path / "verify.db"
+
+    cache = VerifyCache(db, AbstractDomain.KnownBits, op)
+    assert cache.verify(4, sound, helpers, 3, SolverKind.bitwuzla) == (True, None)
+    res, model = cache.verify(4, unsound, helpers, 3, SolverKind.bitwuzla)
+    assert res is False and model is not None
+    cache.close()
+
+    cache = VerifyCache(db, AbstractDomain.KnownBits, op)
+    key = unsound.structural_hash()
+    cached = cache.get(key, 4, SolverKind.bitwuzla, 3)
+    assert cached is not None and cached[0] is False
+    assert cached[1] is not None and cached[1].items() == model.items()
+    assert cache.get(key, 4, SolverKind.z3, 3) is None
+    cache.close()
+
+
+def test_verif_portfolio():
+    helpers = HelperFuncs(PatternDag("And"), AbstractDomain.KnownBits)
+    sound = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_and.mlir")
+    unsound = parse_mlir_func(DATA_DIR / "ideal_xfers" / "kb_or.mlir")
+    session = verifier_session(helpers)
+    session.portfolio = True
+    try:
+        assert session.verify(sound, [], 8, 3, SolverKind.z3) == (True, None)
+        res, model = session.verify(unsound, [], 8, 3, SolverKind.z3)
+        assert res is False and model is not None and model.items()
+        assert session.wins.total() == 2
+    finally:
+        session.portfolio = False
+        session.wins.clear()